@@ -0,0 +1,318 @@
+"""
+Address parsing for receipts: postcode, city and country.
+
+Addresses are matched against a handful of precompiled per-country layouts
+(postcode before the city as in DE/AT/CH/FR/NL, ``City, ST 12345`` in the US,
+``City POSTCODE`` in the UK). The postcode is then resolved to a canonical
+city through a gazetteer, a sorted ``country<TAB>first<TAB>last<TAB>city``
+file of postcode ranges that is memory-mapped on first use and binary
+searched, so it costs no Python objects per entry however large it is.
+
+Results are memoized per normalized address in an LRU cache.
+"""
+import mmap
+import os
+import re
+import tempfile
+import threading
+import unicodedata
+from array import array
+from collections import namedtuple
+from functools import lru_cache
+from pathlib import Path
+
+from django.conf import settings
+
+ParsedAddress = namedtuple("ParsedAddress", ["city", "postcode", "country"])
+
+BUNDLED_GAZETTEER = Path(__file__).resolve().parent / "data" / "postcodes.tsv"
+
+# Trailing country names (casefolded) -> ISO code.
+COUNTRY_NAMES = {
+    "germany": "DE", "deutschland": "DE", "de": "DE", "d": "DE",
+    "austria": "AT", "österreich": "AT", "at": "AT", "a": "AT",
+    "switzerland": "CH", "schweiz": "CH", "suisse": "CH", "svizzera": "CH", "ch": "CH",
+    "france": "FR", "fr": "FR", "f": "FR",
+    "netherlands": "NL", "the netherlands": "NL", "nederland": "NL", "holland": "NL", "nl": "NL",
+    "belgium": "BE", "belgië": "BE", "belgique": "BE", "be": "BE",
+    "italy": "IT", "italia": "IT", "it": "IT",
+    "spain": "ES", "españa": "ES", "es": "ES",
+    "denmark": "DK", "danmark": "DK", "dk": "DK",
+    "united kingdom": "GB", "uk": "GB", "gb": "GB", "england": "GB", "scotland": "GB", "wales": "GB",
+    "united states": "US", "united states of america": "US", "usa": "US", "us": "US",
+}
+
+# Postcode lengths that are plain digits, used to guess the country when the
+# address does not name one.
+NUMERIC_POSTCODE_COUNTRIES = {
+    5: ("DE", "FR", "IT", "ES", "US"),
+    4: ("AT", "CH", "NL", "BE", "DK"),
+}
+
+_CITY = r"[^\W\d_][^\d,;/]*?"
+
+US_PATTERN = re.compile(
+    rf"(?P<city>{_CITY}),\s*(?P<state>[A-Z]{{2}})\s+(?P<postcode>\d{{5}})(?:-\d{{4}})?\b"
+)
+NL_PATTERN = re.compile(rf"\b(?P<postcode>\d{{4}})\s?[A-Z]{{2}}\s+(?P<city>{_CITY})\s*(?:,|$)")
+POSTCODE_FIRST_PATTERN = re.compile(
+    rf"(?:\b(?P<prefix>[A-Z]{{1,2}})-)?\b(?P<postcode>\d{{4,5}})\s+(?P<city>{_CITY})\s*(?:,|$)"
+)
+UK_PATTERN = re.compile(
+    rf"(?P<city>{_CITY}),?\s+(?P<postcode>(?P<outward>[A-Z]{{1,2}}\d[A-Z\d]?)\s*\d[A-Z]{{2}})\b"
+)
+
+
+class Gazetteer:
+    """
+    Postcode range -> city lookups over a sorted TSV file.
+
+    The file is memory-mapped lazily on the first lookup; only an array of
+    line offsets (4 bytes per entry) lives in Python memory. Codes are
+    compared as strings, so within one country they must share a length.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._mmap = None
+        self._offsets = None
+
+    def _load(self):
+        with self._lock:
+            if self._offsets is not None:
+                return
+            offsets = array("L")
+            with open(self.path, "rb") as f:
+                if f.seek(0, 2) == 0:
+                    self._offsets = offsets
+                    return
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            position = 0
+            while position < len(data):
+                offsets.append(position)
+                newline = data.find(b"\n", position)
+                position = len(data) if newline == -1 else newline + 1
+            self._mmap = data
+            self._offsets = offsets
+
+    def __len__(self):
+        if self._offsets is None:
+            self._load()
+        return len(self._offsets)
+
+    def _record(self, index):
+        start = self._offsets[index]
+        end = self._mmap.find(b"\n", start)
+        line = self._mmap[start:end if end != -1 else len(self._mmap)]
+        return line.decode("utf-8").split("\t", 3)
+
+    def lookup(self, country, postcode):
+        """
+        City for ``postcode`` in ``country`` (ISO code), or ``None``.
+        """
+        if self._offsets is None:
+            self._load()
+        # Last record whose (country, first) is <= the key.
+        key = (country, postcode)
+        lo, hi = 0, len(self._offsets)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if key < tuple(self._record(mid)[:2]):
+                hi = mid
+            else:
+                lo = mid + 1
+        if lo == 0:
+            return None
+        record_country, first, last, city = self._record(lo - 1)
+        if record_country == country and len(postcode) == len(first) and first <= postcode <= last:
+            return city.strip()
+        return None
+
+    def close(self):
+        with self._lock:
+            if self._mmap is not None:
+                self._mmap.close()
+            self._mmap = None
+            self._offsets = None
+
+
+def build_gazetteer(entries, path):
+    """
+    Write a gazetteer file from ``(country, postcode, city)`` entries.
+    Neighbouring numeric postcodes of the same city collapse into one range.
+    Returns the number of ranges written.
+
+    The file is written next to ``path`` and renamed over it, so processes
+    that have the old file memory-mapped keep reading it intact until they
+    call ``reset_gazetteer()`` or restart.
+    """
+    cities = {}
+    for country, postcode, city in entries:
+        postcode = postcode.strip().upper()
+        if country and postcode and city:
+            # The first place name listed for a postcode wins.
+            cities.setdefault((country.strip().upper(), postcode), city.strip())
+
+    ranges = []
+    for (country, postcode), city in sorted(cities.items()):
+        if ranges:
+            last = ranges[-1]
+            if (
+                last[0] == country and last[3] == city and postcode.isdigit()
+                and last[2].isdigit() and len(postcode) == len(last[2])
+            ):
+                last[2] = postcode
+                continue
+        ranges.append([country, postcode, postcode, city])
+
+    path = Path(path)
+    fd, temp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with open(fd, "w", encoding="utf-8", newline="\n") as f:
+            for country, first, last, city in ranges:
+                f.write(f"{country}\t{first}\t{last}\t{city}\n")
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    return len(ranges)
+
+
+_gazetteer = None
+_gazetteer_lock = threading.Lock()
+
+
+def get_gazetteer():
+    global _gazetteer
+    if _gazetteer is None:
+        with _gazetteer_lock:
+            if _gazetteer is None:
+                _gazetteer = Gazetteer(getattr(settings, "ADDRESS_GAZETTEER_PATH", None) or BUNDLED_GAZETTEER)
+    return _gazetteer
+
+
+def reset_gazetteer():
+    """
+    Drop the loaded gazetteer and the parse cache, e.g. after rebuilding the
+    gazetteer file.
+    """
+    global _gazetteer
+    with _gazetteer_lock:
+        if _gazetteer is not None:
+            _gazetteer.close()
+        _gazetteer = None
+    _parse_normalized.cache_clear()
+
+
+def normalize_address(address):
+    return " ".join(address.split())
+
+
+def _fold(text):
+    text = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def _same_place(a, b):
+    """
+    Loose match between a city as written and the gazetteer's, e.g.
+    "Berlin-Mitte" / "Berlin" or "Frankfurt" / "Frankfurt am Main".
+    """
+    first_a = re.split(r"[\s\-/]+", _fold(a))[0]
+    first_b = re.split(r"[\s\-/]+", _fold(b))[0]
+    return bool(first_a) and first_a == first_b
+
+
+def _country_hint(parts):
+    """
+    ISO code named by the last comma-separated part, if any.
+    """
+    if len(parts) > 1:
+        return COUNTRY_NAMES.get(parts[-1].casefold().strip(" ."))
+    return None
+
+
+def _split_city(city):
+    """
+    Split a trailing country name off a city, as in "10117 Berlin Germany".
+    Returns ``(city, country)``.
+    """
+    city = city.strip(" .-")
+    words = city.rsplit(" ", 1)
+    if len(words) == 2 and len(words[1]) > 2 and words[1].casefold() in COUNTRY_NAMES:
+        return words[0].strip() or None, COUNTRY_NAMES[words[1].casefold()]
+    return city or None, None
+
+
+def _resolve(city, postcode, candidates, explicit):
+    """
+    Canonical city for ``postcode``: the gazetteer's answer when the country
+    is known or the written city agrees with it, else the written city.
+    """
+    gazetteer = get_gazetteer()
+    for country in candidates:
+        canonical = gazetteer.lookup(country, postcode)
+        if canonical and (explicit or not city or _same_place(city, canonical)):
+            return ParsedAddress(canonical, postcode, country)
+    country = candidates[0] if explicit and candidates else None
+    return ParsedAddress(city, postcode, country)
+
+
+@lru_cache(maxsize=getattr(settings, "ADDRESS_PARSE_CACHE_SIZE", 10000))
+def _parse_normalized(address):
+    parts = [part.strip() for part in address.split(",") if part.strip()]
+    hint = _country_hint(parts)
+    body = ", ".join(parts[:-1]) if hint else address
+
+    match = US_PATTERN.search(body)
+    if match and (hint in (None, "US")):
+        return _resolve(match.group("city").strip(), match.group("postcode"), ["US"], True)
+
+    match = NL_PATTERN.search(body)
+    if match and hint in (None, "NL"):
+        city, _ = _split_city(match.group("city"))
+        return _resolve(city, match.group("postcode"), ["NL"], True)
+
+    match = POSTCODE_FIRST_PATTERN.search(body)
+    if match:
+        postcode = match.group("postcode")
+        city, trailing = _split_city(match.group("city"))
+        country = hint or trailing or COUNTRY_NAMES.get((match.group("prefix") or "").casefold())
+        if country:
+            return _resolve(city, postcode, [country], True)
+        default = settings.ADDRESS_DEFAULT_COUNTRY
+        candidates = [default] + [c for c in NUMERIC_POSTCODE_COUNTRIES.get(len(postcode), ()) if c != default]
+        return _resolve(city, postcode, candidates, False)
+
+    match = UK_PATTERN.search(body)
+    if match and hint in (None, "GB"):
+        # UK gazetteers are keyed by the outward code ("SW1A" of "SW1A 2AA").
+        parsed = _resolve(match.group("city").strip(), match.group("outward"), ["GB"], True)
+        return parsed._replace(postcode=match.group("postcode"))
+
+    # No postcode: the last part that is not the country or a street line.
+    street_parts = parts[:-1] if hint else parts
+    if len(parts) >= 2:
+        for part in reversed(street_parts):
+            if not any(ch.isdigit() for ch in part):
+                return ParsedAddress(part, None, hint)
+    return ParsedAddress(None, None, hint)
+
+
+def parse_address(address):
+    """
+    Parse ``address`` into a ``ParsedAddress(city, postcode, country)``; any
+    field may be ``None``.
+    """
+    if not address:
+        return ParsedAddress(None, None, None)
+    return _parse_normalized(normalize_address(address))
+
+
+def extract_city(address):
+    return parse_address(address).city
+
+
+def parse_cache_info():
+    return _parse_normalized.cache_info()
@@ -4,3 +4,6 @@ class ReceiptsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'backend.apps.receipts'
     label = 'receipts'
+
+    def ready(self):
+        import backend.apps.receipts.signals
@@ -0,0 +1,78 @@
+"""
+Streaming receipt export as CSV or NDJSON.
+
+Rows are read through a server-side cursor as plain ``values()`` tuples and
+encoded one at a time, so memory stays constant however many receipts a user
+has. CSV text cells that a spreadsheet would run as a formula are prefixed
+with ``'``; NDJSON values are written unchanged.
+"""
+import csv
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+EXPORT_FIELDS = ("id", "date", "price", "restaurant_name", "address", "image")
+
+# Leading characters that make spreadsheet applications read a cell as a formula.
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+
+class _Echo:
+    """
+    File-like object whose ``write`` hands the line back to the csv writer's
+    caller instead of buffering it.
+    """
+
+    def write(self, value):
+        return value
+
+
+def export_rows(queryset):
+    """
+    Yield one tuple per receipt in ``EXPORT_FIELDS`` order, newest first.
+    """
+    return (
+        queryset.order_by("-date", "-id")
+        .values_list(*EXPORT_FIELDS)
+        .iterator(chunk_size=settings.RECEIPT_EXPORT_CHUNK_SIZE)
+    )
+
+
+def csv_cell(value):
+    """
+    ``value`` made safe to open in a spreadsheet: text starting like a
+    formula gets a leading ``'`` so it is shown instead of evaluated.
+    """
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def iter_csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        yield writer.writerow([csv_cell(value) for value in row])
+
+
+def iter_ndjson(rows):
+    encoder = DjangoJSONEncoder()
+    for row in rows:
+        yield encoder.encode(dict(zip(EXPORT_FIELDS, row))) + "\n"
+
+
+def stream_export(queryset, fmt):
+    """
+    Encoded chunks of the export of ``queryset`` in ``fmt`` (a key of
+    ``EXPORT_FORMATS``).
+    """
+    rows = export_rows(queryset)
+    if fmt == "csv":
+        return iter_csv(rows)
+    return iter_ndjson(rows)
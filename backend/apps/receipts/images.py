@@ -0,0 +1,79 @@
+import posixpath
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+# Pillow format name -> file extension used in storage paths.
+IMAGE_EXTENSIONS = {
+    "JPEG": "jpg",
+    "MPO": "jpg",
+    "PNG": "png",
+    "WEBP": "webp",
+    "GIF": "gif",
+    "BMP": "bmp",
+    "TIFF": "tiff",
+    "HEIF": "heic",
+}
+
+
+def image_extension(image_format=None, filename=None):
+    """
+    File extension for an uploaded image, preferring the format Pillow
+    detected over whatever the client named the file.
+    """
+    if image_format and image_format.upper() in IMAGE_EXTENSIONS:
+        return IMAGE_EXTENSIONS[image_format.upper()]
+    ext = posixpath.splitext(filename or "")[1].lstrip(".").lower()
+    if ext == "jpeg":
+        return "jpg"
+    return ext or "jpg"
+
+
+def variant_name(original_name, label):
+    """
+    Storage name of a derived image, next to the original:
+    ``receipts/1/2024-07-15/receipt_x.png`` -> ``receipts/1/2024-07-15/receipt_x_small.jpg``
+    """
+    root, _ = posixpath.splitext(original_name)
+    return f"{root}_{label}.jpg"
+
+
+def load_normalized(fp):
+    """
+    Open an image, apply its EXIF orientation and flatten it to RGB.
+    """
+    with Image.open(fp) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ("RGBA", "LA", "P"):
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            return background
+        return image.convert("RGB")
+
+
+def encode_jpeg(image, quality):
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", quality=quality, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def build_variants(fp, quality, max_dimension, thumbnail_sizes):
+    """
+    Return ``{label: jpeg_bytes}``: a recompressed ``full`` copy capped at
+    ``max_dimension`` pixels plus one thumbnail per ``thumbnail_sizes`` entry
+    (label -> longest edge in pixels).
+    """
+    image = load_normalized(fp)
+    variants = {}
+
+    full = image.copy()
+    full.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+    variants["full"] = encode_jpeg(full, quality)
+
+    for label, size in sorted(thumbnail_sizes.items(), key=lambda item: -item[1]):
+        thumb = image.copy()
+        thumb.thumbnail((size, size), Image.Resampling.LANCZOS)
+        variants[label] = encode_jpeg(thumb, quality)
+
+    return variants
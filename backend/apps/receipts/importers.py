@@ -0,0 +1,344 @@
+"""
+Bulk receipt import from CSV or JSON Lines.
+
+Rows are read one at a time, validated with the same rules as the receipts
+API and inserted with ``bulk_create`` in chunks, so memory stays flat however
+large the file is. Because ``bulk_create`` sends no signals, each chunk
+updates the rollups itself and queues enrichment and image processing as a
+handful of batched tasks rather than one per row. Row images are looked up
+one chunk at a time as well.
+
+Imports sent to the API run in ``import_receipts_task``: the view stages the
+uploaded files in storage and records a ``ReceiptImport`` that the task
+fills in with the result.
+"""
+import csv
+import io
+import json
+import logging
+import posixpath
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from secrets import token_hex
+
+from django.conf import settings
+from django.core.files.base import File
+from django.db import transaction
+from rest_framework import serializers
+from storages.utils import clean_name, safe_join
+
+from backend.apps.restaurants.models import ReceiptEnrichment
+from backend.apps.restaurants.tasks import fetch_and_create_restaurants_from_receipts
+
+from .models import Receipt, ReceiptImport
+from .rollups import receipt_values, record_new_receipts
+from .serializers import ReceiptSerializer
+from .tasks import process_receipt_images
+from .uploads import UploadError, new_upload_key, read_image_type
+from .utils import storage
+
+logger = logging.getLogger(__name__)
+
+IMPORT_FORMATS = ("csv", "jsonl")
+
+
+class ImportFileError(Exception):
+    """
+    The import file as a whole cannot be read.
+    """
+
+
+class ReceiptImportRowSerializer(ReceiptSerializer):
+    """
+    One import row. ``image`` names a file in the images archive or under the
+    image prefix instead of carrying the upload itself; like receipts created
+    through the API, every row needs one.
+    """
+    image = serializers.CharField(max_length=255)
+
+
+def detect_format(filename):
+    ext = posixpath.splitext(filename or "")[1].lstrip(".").lower()
+    if ext in ("jsonl", "ndjson"):
+        return "jsonl"
+    if ext == "csv":
+        return "csv"
+    raise ImportFileError(f"Cannot tell the format of {filename!r}; use .csv or .jsonl.")
+
+
+def iter_rows(fileobj, fmt):
+    """
+    Yield ``(line_number, row_dict)`` from a binary file object without
+    reading it into memory. JSON Lines rows that do not parse are yielded as
+    ``(line_number, None)``.
+    """
+    text = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+    try:
+        if fmt == "csv":
+            reader = csv.DictReader(text)
+            for row in reader:
+                yield reader.line_num, row
+        elif fmt == "jsonl":
+            for line_number, line in enumerate(text, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    row = None
+                yield line_number, row if isinstance(row, dict) else None
+        else:
+            raise ImportFileError(f"Unsupported import format {fmt!r}.")
+    finally:
+        # Leave the underlying file open for the caller.
+        text.detach()
+
+
+class ZipImages:
+    """
+    Images taken from a zip archive and copied into storage on import. Each
+    member is checked like a direct upload before it is copied.
+    """
+
+    def __init__(self, fileobj):
+        try:
+            self.archive = zipfile.ZipFile(fileobj)
+        except zipfile.BadZipFile:
+            raise ImportFileError("The images file is not a valid zip archive.")
+
+    def existing(self, names):
+        """
+        The members of ``names`` that are in the archive.
+        """
+        found = set()
+        for name in names:
+            try:
+                self.archive.getinfo(name)
+            except KeyError:
+                continue
+            found.add(name)
+        return found
+
+    def check(self, name):
+        """
+        Raise ``UploadError`` unless the member is a non-empty image of an
+        accepted type within ``RECEIPT_UPLOAD_MAX_SIZE``.
+        """
+        size = self.archive.getinfo(name).file_size
+        if size <= 0:
+            raise UploadError("The image is empty.")
+        if size > settings.RECEIPT_UPLOAD_MAX_SIZE:
+            raise UploadError("The image is too large.")
+        with self.archive.open(name) as member:
+            if read_image_type(member) not in settings.RECEIPT_UPLOAD_CONTENT_TYPES:
+                raise UploadError("The file is not a supported image.")
+
+    def store(self, receipt, name):
+        with self.archive.open(name) as member:
+            key = new_upload_key(receipt.user, receipt.date, name)
+            return storage.save(key, File(member, name=posixpath.basename(name)))
+
+    def discard(self, keys):
+        """
+        Delete copies made by ``store`` whose receipts were not created.
+        """
+        for key in keys:
+            storage.delete(key)
+
+
+class PrefixImages:
+    """
+    Images already in the bucket under ``prefix``. Each receipt gets its own
+    server-side copy, so deleting a receipt's image (or a failed chunk's)
+    never touches the user's source objects. Existence is checked per chunk
+    with concurrent HEAD requests, so nothing is held for objects the import
+    does not name.
+    """
+
+    def __init__(self, prefix):
+        self.prefix = prefix.strip("/")
+
+    def existing(self, names):
+        """
+        The members of ``names`` that exist under the prefix.
+        """
+        names = [name for name in names if ".." not in name.split("/")]
+        if not names:
+            return set()
+        workers = min(settings.RECEIPT_IMPORT_IMAGE_LOOKUPS, len(names))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            found = pool.map(lambda name: storage.exists(self._key(name)), names)
+            return {name for name, exists in zip(names, found) if exists}
+
+    def check(self, name):
+        # The copies are verified by process_receipt_image like any upload.
+        pass
+
+    def store(self, receipt, name):
+        key = new_upload_key(receipt.user, receipt.date, name)
+        storage.bucket.meta.client.copy_object(
+            Bucket=storage.bucket_name,
+            Key=safe_join(storage.location, clean_name(key)),
+            CopySource={"Bucket": storage.bucket_name, "Key": safe_join(storage.location, clean_name(self._key(name)))},
+        )
+        return key
+
+    def discard(self, keys):
+        """
+        Delete copies made by ``store`` whose receipts were not created.
+        """
+        for key in keys:
+            storage.delete(key)
+
+    def _key(self, name):
+        return posixpath.join(self.prefix, name.lstrip("/"))
+
+
+def import_receipts(user, rows, images=None, chunk_size=None):
+    """
+    Import ``(line_number, row)`` pairs (see ``iter_rows``) as receipts of
+    ``user``. ``images`` is a ``ZipImages``/``PrefixImages`` used to resolve
+    each row's ``image`` column.
+
+    Returns a dict with the number of ``created`` and ``failed`` rows and the
+    first ``RECEIPT_IMPORT_MAX_ERRORS`` row errors.
+    """
+    chunk_size = chunk_size or settings.RECEIPT_IMPORT_CHUNK_SIZE
+    result = {"created": 0, "failed": 0, "errors": []}
+    # (line_number, errors, receipt, image) in file order; rows that already
+    # failed carry their errors, the others wait for their image.
+    chunk = []
+
+    def fail(line_number, errors):
+        result["failed"] += 1
+        if len(result["errors"]) < settings.RECEIPT_IMPORT_MAX_ERRORS:
+            result["errors"].append({"line": line_number, "errors": errors})
+
+    for line_number, row in rows:
+        if row is None:
+            chunk.append((line_number, {"non_field_errors": ["Row is not a JSON object."]}, None, None))
+        else:
+            serializer = ReceiptImportRowSerializer(data=row)
+            if serializer.is_valid():
+                data = dict(serializer.validated_data)
+                image = data.pop("image")
+                chunk.append((line_number, None, Receipt(user=user, **data), image))
+            else:
+                chunk.append((line_number, serializer.errors, None, None))
+
+        if len(chunk) >= chunk_size:
+            result["created"] += _import_chunk(chunk, images, fail)
+            chunk = []
+
+    if chunk:
+        result["created"] += _import_chunk(chunk, images, fail)
+
+    logger.info(f"Imported {result['created']} receipts for user {user.id}, {result['failed']} rows failed")
+    return result
+
+
+def _import_chunk(chunk, images, fail):
+    """
+    Resolve the images of one chunk of rows and insert the receipts whose
+    image exists and passes ``images.check``. Returns the number inserted.
+    """
+    names = {image for _, errors, _, image in chunk if errors is None}
+    found = images.existing(names) if images is not None and names else set()
+    accepted = []
+    for line_number, errors, receipt, image in chunk:
+        if errors is not None:
+            fail(line_number, errors)
+            continue
+        if image not in found:
+            fail(line_number, {"image": [f"Image {image!r} was not found."]})
+            continue
+        try:
+            images.check(image)
+        except UploadError as exc:
+            fail(line_number, {"image": [f"Image {image!r}: {exc}"]})
+            continue
+        accepted.append((receipt, image))
+    return _insert_chunk(accepted, images) if accepted else 0
+
+
+def _insert_chunk(chunk, images):
+    receipts = [receipt for receipt, _ in chunk]
+    stored = []
+    try:
+        for receipt, image in chunk:
+            receipt.image = images.store(receipt, image)
+            stored.append(receipt.image.name)
+            receipt.set_city_from_address()
+        with transaction.atomic():
+            Receipt.objects.bulk_create(receipts)
+            # bulk_create sends no post_save: write the pending enrichment rows
+            # the signal would, so the retry sweep covers lost batches.
+            ReceiptEnrichment.objects.bulk_create([ReceiptEnrichment(receipt=receipt) for receipt in receipts])
+            record_new_receipts(receipt_values(receipt) for receipt in receipts)
+    except Exception:
+        # No receipt of the failed chunk refers to its copied images.
+        images.discard(stored)
+        raise
+
+    receipt_ids = [receipt.id for receipt in receipts]
+    transaction.on_commit(lambda: _dispatch(receipt_ids))
+    return len(receipts)
+
+
+def _dispatch(receipt_ids):
+    batch_size = settings.RECEIPT_ENRICHMENT_BATCH_SIZE
+    for start in range(0, len(receipt_ids), batch_size):
+        fetch_and_create_restaurants_from_receipts.delay(receipt_ids[start:start + batch_size])
+    process_receipt_images.delay(receipt_ids)
+
+
+def stage_import(user, upload, fmt, images=None, image_prefix=""):
+    """
+    Copy an uploaded import file (and images zip) into storage and record a
+    pending ``ReceiptImport`` for ``import_receipts_task``. Call inside a
+    transaction and queue the task on commit.
+    """
+    folder = f"imports/{user.id}/{token_hex(8)}"
+    receipt_import = ReceiptImport(user=user, format=fmt, image_prefix=image_prefix)
+    receipt_import.file = storage.save(f"{folder}/{posixpath.basename(upload.name)}", upload)
+    if images is not None:
+        receipt_import.images = storage.save(f"{folder}/{posixpath.basename(images.name)}", images)
+    receipt_import.save()
+    return receipt_import
+
+
+def run_import(receipt_import):
+    """
+    Run a staged import and store its result on ``receipt_import``. The
+    staged files are deleted afterwards, whatever the outcome.
+    """
+    Status = ReceiptImport.Status
+    ReceiptImport.objects.filter(id=receipt_import.id).update(status=Status.RUNNING)
+    try:
+        with storage.open(receipt_import.file, "rb") as fileobj:
+            rows = iter_rows(fileobj, receipt_import.format)
+            if receipt_import.images:
+                with storage.open(receipt_import.images, "rb") as archive:
+                    result = import_receipts(receipt_import.user, rows, ZipImages(archive))
+            else:
+                images = PrefixImages(receipt_import.image_prefix) if receipt_import.image_prefix else None
+                result = import_receipts(receipt_import.user, rows, images)
+    except (ImportFileError, UnicodeDecodeError, csv.Error) as exc:
+        receipt_import.status = Status.FAILED
+        receipt_import.error = str(exc)[:255]
+    except Exception:
+        ReceiptImport.objects.filter(id=receipt_import.id).update(
+            status=Status.FAILED, error="The import failed unexpectedly.",
+        )
+        raise
+    else:
+        receipt_import.status = Status.DONE
+        receipt_import.created_count = result["created"]
+        receipt_import.failed_count = result["failed"]
+        receipt_import.errors = result["errors"]
+    finally:
+        storage.delete(receipt_import.file)
+        if receipt_import.images:
+            storage.delete(receipt_import.images)
+    receipt_import.save(update_fields=["status", "error", "created_count", "failed_count", "errors", "updated_at"])
+    return receipt_import
@@ -0,0 +1,48 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.apps.receipts.address import build_gazetteer
+
+
+class Command(BaseCommand):
+    help = (
+        "Build the postcode gazetteer used for city extraction from a GeoNames "
+        "postal code dump (tab separated: country, postcode, place name, ...)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("source", help="GeoNames postal code file, e.g. allCountries.txt or DE.txt.")
+        parser.add_argument(
+            "--output",
+            required=True,
+            help=(
+                "Where to write the gazetteer, outside the package. Point ADDRESS_GAZETTEER_PATH at it; "
+                "an existing file is replaced atomically."
+            ),
+        )
+        parser.add_argument(
+            "--countries",
+            nargs="*",
+            help="Only keep these ISO country codes.",
+        )
+
+    def handle(self, *args, **options):
+        countries = {code.upper() for code in options["countries"] or ()}
+
+        def entries(f):
+            for row in csv.reader(f, delimiter="\t", quoting=csv.QUOTE_NONE):
+                if len(row) >= 3 and (not countries or row[0].upper() in countries):
+                    yield row[0], row[1], row[2]
+
+        try:
+            with open(options["source"], encoding="utf-8", newline="") as f:
+                written = build_gazetteer(entries(f), options["output"])
+        except OSError as exc:
+            raise CommandError(str(exc))
+
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} postcode ranges to {options['output']}."))
+        self.stdout.write(
+            "Point ADDRESS_GAZETTEER_PATH at it and restart the web and worker processes "
+            "(or call reset_gazetteer()) to use it."
+        )
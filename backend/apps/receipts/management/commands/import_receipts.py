@@ -0,0 +1,52 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.apps.receipts.importers import (
+    IMPORT_FORMATS,
+    ImportFileError,
+    PrefixImages,
+    ZipImages,
+    detect_format,
+    import_receipts,
+    iter_rows,
+)
+
+
+class Command(BaseCommand):
+    help = "Import receipts for a user from a CSV or JSON Lines file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or JSON Lines file with date, price, restaurant_name, address and image columns.")
+        parser.add_argument("--user", required=True, help="Email of the user who owns the receipts.")
+        parser.add_argument("--format", choices=IMPORT_FORMATS, help="File format; guessed from the extension by default.")
+        images = parser.add_mutually_exclusive_group()
+        images.add_argument("--images", help="Zip archive holding the files named in the image column.")
+        images.add_argument("--image-prefix", help="Storage prefix under which the image column's files already live.")
+        parser.add_argument("--chunk-size", type=int, help="Number of receipts per bulk insert.")
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        try:
+            user = User.objects.get(email=options["user"])
+        except User.DoesNotExist:
+            raise CommandError(f"No user with email {options['user']!r}.")
+
+        try:
+            fmt = options["format"] or detect_format(options["path"])
+            with open(options["path"], "rb") as fileobj:
+                if options["images"]:
+                    with open(options["images"], "rb") as archive:
+                        result = import_receipts(
+                            user, iter_rows(fileobj, fmt), ZipImages(archive), options["chunk_size"]
+                        )
+                else:
+                    images = PrefixImages(options["image_prefix"]) if options["image_prefix"] else None
+                    result = import_receipts(user, iter_rows(fileobj, fmt), images, options["chunk_size"])
+        except (ImportFileError, OSError) as exc:
+            raise CommandError(str(exc))
+
+        for error in result["errors"]:
+            self.stdout.write(f"line {error['line']}: {error['errors']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result['created']} receipts for {user.email}; {result['failed']} rows failed."
+        ))
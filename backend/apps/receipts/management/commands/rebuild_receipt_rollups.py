@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.apps.receipts.rollups import check_rollups, rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild the receipt spend rollups from receipts, or check them against the raw data."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only compare the rollups with the receipts and report differences.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of rows per bulk insert when rebuilding.",
+        )
+
+    def handle(self, *args, **options):
+        if options["check"]:
+            mismatches = check_rollups()
+            for (user_id, month, restaurant_name, city), expected, stored in mismatches:
+                self.stdout.write(
+                    f"user={user_id} month={month:%Y-%m} restaurant={restaurant_name!r} city={city!r}: "
+                    f"expected {expected}, stored {stored}"
+                )
+            if mismatches:
+                raise CommandError(f"{len(mismatches)} rollup rows differ from the receipts.")
+            self.stdout.write(self.style.SUCCESS("Rollups match the receipts."))
+            return
+
+        rows = rebuild_rollups(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt receipt rollups with {rows} rows."))
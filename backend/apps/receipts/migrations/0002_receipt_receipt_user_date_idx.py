@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:30
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('receipts', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='receipt',
+            index=models.Index(fields=['user', '-date', 'restaurant_name'], name='receipt_user_date_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:33
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('receipts', '0002_receipt_receipt_user_date_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='receipt',
+            name='receipt_user_date_idx',
+        ),
+        migrations.AddIndex(
+            model_name='receipt',
+            index=models.Index(fields=['user', '-date', '-id'], name='receipt_user_date_id_idx'),
+        ),
+    ]
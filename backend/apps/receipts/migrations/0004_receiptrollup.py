@@ -0,0 +1,84 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:35
+
+import re
+
+import django.db.models.deletion
+from collections import defaultdict
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+
+# Frozen copy of the city parser as of this migration, so later changes to
+# the live parser do not change what it writes.
+POSTCODE_CITY = re.compile(r"\b\d{5}\s+([A-Za-zäöüÄÖÜß\s\-]+)")
+
+
+def extract_city_from_address(address):
+    if not address:
+        return None
+
+    match = POSTCODE_CITY.search(address)
+    if match:
+        return match.group(1).strip()
+
+    parts = [p.strip() for p in address.split(",")]
+    if len(parts) >= 2:
+        return parts[-2]
+
+    return None
+
+
+def populate_rollups(apps, schema_editor):
+    Receipt = apps.get_model('receipts', 'Receipt')
+    ReceiptRollup = apps.get_model('receipts', 'ReceiptRollup')
+    totals = defaultdict(lambda: [0, Decimal('0')])
+    rows = Receipt.objects.values('user_id', 'date', 'restaurant_name', 'address', 'price')
+    for row in rows.iterator(chunk_size=2000):
+        city = (extract_city_from_address(row['address']) or '')[:100]
+        entry = totals[(row['user_id'], row['date'].replace(day=1), row['restaurant_name'].strip(), city)]
+        entry[0] += 1
+        entry[1] += row['price']
+    ReceiptRollup.objects.bulk_create(
+        [
+            ReceiptRollup(
+                user_id=user_id,
+                month=month,
+                restaurant_name=restaurant_name,
+                city=city,
+                receipt_count=count,
+                total_spend=spend,
+            )
+            for (user_id, month, restaurant_name, city), (count, spend) in totals.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('receipts', '0003_receipt_keyset_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReceiptRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('restaurant_name', models.CharField(max_length=255)),
+                ('city', models.CharField(blank=True, max_length=100)),
+                ('receipt_count', models.IntegerField(default=0)),
+                ('total_spend', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='receipt_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Receipt rollup',
+                'verbose_name_plural': 'Receipt rollups',
+                'ordering': ['month', 'restaurant_name'],
+                'unique_together': {('user', 'month', 'restaurant_name', 'city')},
+            },
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('receipts', '0004_receiptrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='receipt',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.4 on 2026-10-18 07:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('receipts', '0005_receipt_image_variants'),
+        ('restaurants', '0009_receiptenrichment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='receipt',
+            name='restaurant',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='receipts', to='restaurants.restaurant'),
+        ),
+    ]
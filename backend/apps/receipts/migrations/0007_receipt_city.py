@@ -0,0 +1,227 @@
+# Generated by Django 5.2.4 on 2026-10-18 08:23
+
+from bisect import bisect_right
+from collections import defaultdict
+from decimal import Decimal
+import re
+import unicodedata
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Frozen copy of receipts.address.extract_city and the bundled postcode
+# gazetteer as of this migration, so later changes to the live parser or
+# its data do not change which city a receipt is stored under.
+COUNTRY_NAMES = {
+    "germany": "DE", "deutschland": "DE", "de": "DE", "d": "DE",
+    "austria": "AT", "österreich": "AT", "at": "AT", "a": "AT",
+    "switzerland": "CH", "schweiz": "CH", "suisse": "CH", "svizzera": "CH", "ch": "CH",
+    "france": "FR", "fr": "FR", "f": "FR",
+    "netherlands": "NL", "the netherlands": "NL", "nederland": "NL", "holland": "NL", "nl": "NL",
+    "belgium": "BE", "belgië": "BE", "belgique": "BE", "be": "BE",
+    "italy": "IT", "italia": "IT", "it": "IT",
+    "spain": "ES", "españa": "ES", "es": "ES",
+    "denmark": "DK", "danmark": "DK", "dk": "DK",
+    "united kingdom": "GB", "uk": "GB", "gb": "GB", "england": "GB", "scotland": "GB", "wales": "GB",
+    "united states": "US", "united states of america": "US", "usa": "US", "us": "US",
+}
+NUMERIC_POSTCODE_COUNTRIES = {
+    5: ("DE", "FR", "IT", "ES", "US"),
+    4: ("AT", "CH", "NL", "BE", "DK"),
+}
+GAZETTEER = (
+    ("AT", "1010", "1239", "Wien"),
+    ("AT", "4020", "4040", "Linz"),
+    ("AT", "5020", "5026", "Salzburg"),
+    ("AT", "6020", "6080", "Innsbruck"),
+    ("AT", "8010", "8063", "Graz"),
+    ("CH", "1003", "1018", "Lausanne"),
+    ("CH", "1201", "1209", "Genève"),
+    ("CH", "3001", "3030", "Bern"),
+    ("CH", "4001", "4059", "Basel"),
+    ("CH", "8001", "8099", "Zürich"),
+    ("DE", "01067", "01328", "Dresden"),
+    ("DE", "04103", "04357", "Leipzig"),
+    ("DE", "10115", "14199", "Berlin"),
+    ("DE", "20095", "21149", "Hamburg"),
+    ("DE", "22041", "22769", "Hamburg"),
+    ("DE", "24103", "24159", "Kiel"),
+    ("DE", "28195", "28779", "Bremen"),
+    ("DE", "30159", "30669", "Hannover"),
+    ("DE", "40210", "40629", "Düsseldorf"),
+    ("DE", "44135", "44388", "Dortmund"),
+    ("DE", "45127", "45359", "Essen"),
+    ("DE", "48143", "48167", "Münster"),
+    ("DE", "50667", "51149", "Köln"),
+    ("DE", "53111", "53229", "Bonn"),
+    ("DE", "60306", "60599", "Frankfurt am Main"),
+    ("DE", "65929", "65936", "Frankfurt am Main"),
+    ("DE", "68159", "68309", "Mannheim"),
+    ("DE", "69115", "69126", "Heidelberg"),
+    ("DE", "70173", "70629", "Stuttgart"),
+    ("DE", "76131", "76229", "Karlsruhe"),
+    ("DE", "79098", "79117", "Freiburg im Breisgau"),
+    ("DE", "80331", "81929", "München"),
+    ("DE", "86150", "86199", "Augsburg"),
+    ("DE", "90402", "90491", "Nürnberg"),
+    ("DE", "93047", "93059", "Regensburg"),
+    ("FR", "13001", "13016", "Marseille"),
+    ("FR", "69001", "69009", "Lyon"),
+    ("FR", "75001", "75020", "Paris"),
+    ("FR", "75116", "75116", "Paris"),
+    ("NL", "1011", "1109", "Amsterdam"),
+    ("NL", "2491", "2599", "Den Haag"),
+    ("NL", "3011", "3089", "Rotterdam"),
+    ("NL", "3511", "3585", "Utrecht"),
+    ("US", "02108", "02137", "Boston"),
+    ("US", "10001", "10282", "New York"),
+    ("US", "60601", "60661", "Chicago"),
+    ("US", "94102", "94188", "San Francisco"),
+)
+GAZETTEER_KEYS = [(country, first) for country, first, _, _ in GAZETTEER]
+
+_CITY = r"[^\W\d_][^\d,;/]*?"
+US_PATTERN = re.compile(
+    rf"(?P<city>{_CITY}),\s*(?P<state>[A-Z]{{2}})\s+(?P<postcode>\d{{5}})(?:-\d{{4}})?\b"
+)
+NL_PATTERN = re.compile(rf"\b(?P<postcode>\d{{4}})\s?[A-Z]{{2}}\s+(?P<city>{_CITY})\s*(?:,|$)")
+POSTCODE_FIRST_PATTERN = re.compile(
+    rf"(?:\b(?P<prefix>[A-Z]{{1,2}})-)?\b(?P<postcode>\d{{4,5}})\s+(?P<city>{_CITY})\s*(?:,|$)"
+)
+UK_PATTERN = re.compile(
+    rf"(?P<city>{_CITY}),?\s+(?P<postcode>(?P<outward>[A-Z]{{1,2}}\d[A-Z\d]?)\s*\d[A-Z]{{2}})\b"
+)
+
+
+def lookup(country, postcode):
+    index = bisect_right(GAZETTEER_KEYS, (country, postcode))
+    if index == 0:
+        return None
+    record_country, first, last, city = GAZETTEER[index - 1]
+    if record_country == country and len(postcode) == len(first) and first <= postcode <= last:
+        return city
+    return None
+
+
+def _fold(text):
+    text = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def _same_place(a, b):
+    first_a = re.split(r"[\s\-/]+", _fold(a))[0]
+    first_b = re.split(r"[\s\-/]+", _fold(b))[0]
+    return bool(first_a) and first_a == first_b
+
+
+def _split_city(city):
+    city = city.strip(" .-")
+    words = city.rsplit(" ", 1)
+    if len(words) == 2 and len(words[1]) > 2 and words[1].casefold() in COUNTRY_NAMES:
+        return words[0].strip() or None, COUNTRY_NAMES[words[1].casefold()]
+    return city or None, None
+
+
+def _resolve(city, postcode, candidates, explicit):
+    for country in candidates:
+        canonical = lookup(country, postcode)
+        if canonical and (explicit or not city or _same_place(city, canonical)):
+            return canonical
+    return city
+
+
+def extract_city_from_address(address, default_country):
+    if not address:
+        return None
+    address = " ".join(address.split())
+    parts = [part.strip() for part in address.split(",") if part.strip()]
+    hint = COUNTRY_NAMES.get(parts[-1].casefold().strip(" .")) if len(parts) > 1 else None
+    body = ", ".join(parts[:-1]) if hint else address
+
+    match = US_PATTERN.search(body)
+    if match and hint in (None, "US"):
+        return _resolve(match.group("city").strip(), match.group("postcode"), ["US"], True)
+
+    match = NL_PATTERN.search(body)
+    if match and hint in (None, "NL"):
+        city, _ = _split_city(match.group("city"))
+        return _resolve(city, match.group("postcode"), ["NL"], True)
+
+    match = POSTCODE_FIRST_PATTERN.search(body)
+    if match:
+        postcode = match.group("postcode")
+        city, trailing = _split_city(match.group("city"))
+        country = hint or trailing or COUNTRY_NAMES.get((match.group("prefix") or "").casefold())
+        if country:
+            return _resolve(city, postcode, [country], True)
+        candidates = [default_country] + [
+            c for c in NUMERIC_POSTCODE_COUNTRIES.get(len(postcode), ()) if c != default_country
+        ]
+        return _resolve(city, postcode, candidates, False)
+
+    match = UK_PATTERN.search(body)
+    if match and hint in (None, "GB"):
+        return _resolve(match.group("city").strip(), match.group("outward"), ["GB"], True)
+
+    street_parts = parts[:-1] if hint else parts
+    if len(parts) >= 2:
+        for part in reversed(street_parts):
+            if not any(ch.isdigit() for ch in part):
+                return part
+    return None
+
+
+def populate_cities(apps, schema_editor):
+    """
+    Store each receipt's parsed city, then rebuild the rollups from the stored
+    cities so existing buckets and future deltas agree.
+    """
+    Receipt = apps.get_model('receipts', 'Receipt')
+    ReceiptRollup = apps.get_model('receipts', 'ReceiptRollup')
+    default_country = settings.ADDRESS_DEFAULT_COUNTRY
+    totals = defaultdict(lambda: [0, Decimal('0')])
+    batch = []
+    for receipt in Receipt.objects.only('id', 'user_id', 'date', 'restaurant_name', 'address', 'price').iterator(
+        chunk_size=2000,
+    ):
+        receipt.city = (extract_city_from_address(receipt.address, default_country) or '')[:100]
+        batch.append(receipt)
+        entry = totals[(receipt.user_id, receipt.date.replace(day=1), receipt.restaurant_name.strip(), receipt.city)]
+        entry[0] += 1
+        entry[1] += receipt.price
+        if len(batch) >= 2000:
+            Receipt.objects.bulk_update(batch, ['city'])
+            batch = []
+    Receipt.objects.bulk_update(batch, ['city'])
+
+    ReceiptRollup.objects.all().delete()
+    ReceiptRollup.objects.bulk_create(
+        [
+            ReceiptRollup(
+                user_id=user_id,
+                month=month,
+                restaurant_name=restaurant_name,
+                city=city,
+                receipt_count=count,
+                total_spend=spend,
+            )
+            for (user_id, month, restaurant_name, city), (count, spend) in totals.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('receipts', '0006_receipt_restaurant'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='receipt',
+            name='city',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.RunPython(populate_cities, migrations.RunPython.noop),
+    ]
@@ -1,20 +1,117 @@
 from django.db import models
 from django.conf import settings
-from backend.apps.receipts.utils import storage, user_receipt_upload_path
+from backend.apps.receipts.utils import extract_city_from_address, storage, user_receipt_upload_path
 
 class Receipt(models.Model):
 
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="receipts")
     image = models.ImageField(upload_to=user_receipt_upload_path,storage=storage)
+    # Derived images written by the processing task: label -> storage name.
+    image_variants = models.JSONField(default=dict, blank=True)
     date = models.DateField(null=False, blank=False)
     price = models.DecimalField(max_digits=10, decimal_places=2, null=False, blank=False)
     restaurant_name = models.CharField(max_length=255, null=False, blank=False)
     address = models.TextField(null=False, blank=False)
+    # City parsed from the address when it was last written, kept by save().
+    # The rollups are keyed on it, so a later parser change cannot move an
+    # existing receipt to another bucket.
+    city = models.CharField(max_length=100, blank=True, default="")
+    # Set by enrichment once the name and address are resolved.
+    restaurant = models.ForeignKey(
+        "restaurants.Restaurant", on_delete=models.SET_NULL, null=True, blank=True, related_name="receipts",
+    )
 
     class Meta:
         ordering = ['-date', 'restaurant_name']
+        indexes = [
+            # Serves the per-user list, month ranges and (date, id) keyset pages.
+            models.Index(fields=['user', '-date', '-id'], name='receipt_user_date_id_idx'),
+        ]
         verbose_name = "Receipt"
         verbose_name_plural = "Receipts"
 
     def __str__(self):
         return f"{self.restaurant_name} - {self.date}"
+
+    def set_city_from_address(self):
+        """
+        Parse ``city`` from ``address``. ``save()`` does this when the address
+        changes; call it before ``bulk_create``, which bypasses ``save()``.
+        """
+        self.city = (extract_city_from_address(self.address) or "")[:self._meta.get_field("city").max_length]
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        writes_address = update_fields is None or "address" in update_fields
+        if writes_address and getattr(self, "_loaded_values", {}).get("address") != self.address:
+            self.set_city_from_address()
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "city"}
+        super().save(*args, **kwargs)
+        if writes_address:
+            self._loaded_values = {**getattr(self, "_loaded_values", {}), "address": self.address}
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what is stored so updates and deletes can apply exact deltas.
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+
+class ReceiptRollup(models.Model):
+    """
+    Per-user monthly spend by restaurant and city, maintained incrementally
+    from receipt create/update/delete. Backs the receipts summary endpoint.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="receipt_rollups")
+    month = models.DateField()
+    restaurant_name = models.CharField(max_length=255)
+    city = models.CharField(max_length=100, blank=True)
+    receipt_count = models.IntegerField(default=0)
+    total_spend = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ("user", "month", "restaurant_name", "city")
+        ordering = ['month', 'restaurant_name']
+        verbose_name = "Receipt rollup"
+        verbose_name_plural = "Receipt rollups"
+
+    def __str__(self):
+        return f"{self.user_id} {self.month:%Y-%m} {self.restaurant_name}: {self.total_spend}"
+
+
+class ReceiptImport(models.Model):
+    """
+    A bulk import sent to the API and run by ``import_receipts_task``. The
+    uploaded files stay staged in storage until the task has run; the row
+    counts and errors are what ``importers.import_receipts`` returns.
+    """
+    class Status(models.TextChoices):
+        PENDING = "pending", "Pending"
+        RUNNING = "running", "Running"
+        DONE = "done", "Done"
+        FAILED = "failed", "Failed"
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="receipt_imports")
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    format = models.CharField(max_length=10)
+    # Storage names of the staged import file and images zip.
+    file = models.CharField(max_length=255)
+    images = models.CharField(max_length=255, blank=True)
+    image_prefix = models.CharField(max_length=255, blank=True)
+    created_count = models.PositiveIntegerField(default=0)
+    failed_count = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    # Why the file as a whole could not be imported.
+    error = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = "Receipt import"
+        verbose_name_plural = "Receipt imports"
+
+    def __str__(self):
+        return f"Import {self.id} for {self.user_id}: {self.status}"
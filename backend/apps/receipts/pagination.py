@@ -0,0 +1,141 @@
+from base64 import b64decode, b64encode
+from datetime import date as dt_date
+from urllib.parse import parse_qs, urlencode
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class ReceiptKeysetPagination(BasePagination):
+    """
+    Keyset pagination over (date, id), newest first.
+
+    Cursors are opaque tokens holding the (date, id) of the page edge, so each
+    page is one indexed range query with no OFFSET and no COUNT(*), however
+    deep the client pages.
+    """
+    cursor_query_param = "cursor"
+    page_size = int(settings.REST_FRAMEWORK["PAGE_SIZE"])
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.base_url = request.build_absolute_uri()
+        position = self.decode_cursor(request)
+
+        if position is None:
+            reverse = False
+            page = list(queryset.order_by("-date", "-id")[:self.page_size + 1])
+        else:
+            edge_date, edge_id, reverse = position
+            if reverse:
+                after = Q(date__gt=edge_date) | Q(date=edge_date, id__gt=edge_id)
+                page = list(queryset.filter(after).order_by("date", "id")[:self.page_size + 1])
+            else:
+                before = Q(date__lt=edge_date) | Q(date=edge_date, id__lt=edge_id)
+                page = list(queryset.filter(before).order_by("-date", "-id")[:self.page_size + 1])
+
+        has_more = len(page) > self.page_size
+        page = page[:self.page_size]
+        if reverse:
+            page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+
+        self.page = page
+        return page
+
+    def get_paginated_response(self, data):
+        return Response({
+            "next": self.get_next_link(),
+            "previous": self.get_previous_link(),
+            "results": data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [{
+            "name": self.cursor_query_param,
+            "required": False,
+            "in": "query",
+            "description": "The pagination cursor value.",
+            "schema": {"type": "string"},
+        }]
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        last = self.page[-1]
+        return self.encode_cursor(last.date, last.id, reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        first = self.page[0]
+        return self.encode_cursor(first.date, first.id, reverse=True)
+
+    def encode_cursor(self, edge_date, edge_id, reverse):
+        querystring = urlencode({"d": edge_date.isoformat(), "i": edge_id, "r": int(reverse)})
+        token = b64encode(querystring.encode("ascii")).decode("ascii")
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            tokens = parse_qs(b64decode(token.encode("ascii")).decode("ascii"), keep_blank_values=True)
+            edge_date = dt_date.fromisoformat(tokens["d"][0])
+            edge_id = int(tokens["i"][0])
+            reverse = bool(int(tokens["r"][0]))
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        return edge_date, edge_id, reverse
+
+
+class ReceiptPagination(BasePagination):
+    """
+    Keyset pagination by default. Clients that need page numbers (and a total
+    count) can keep them by passing ``?page=<n>``.
+    """
+    page_query_param = "page"
+
+    def __init__(self):
+        self.keyset = ReceiptKeysetPagination()
+        self.page_number = PageNumberPagination()
+        self.active = self.keyset
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.page_query_param in request.query_params:
+            self.active = self.page_number
+        else:
+            self.active = self.keyset
+        return self.active.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.active.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return self.keyset.get_paginated_response_schema(schema)
+
+    def get_schema_operation_parameters(self, view):
+        return (
+            self.keyset.get_schema_operation_parameters(view)
+            + self.page_number.get_schema_operation_parameters(view)
+        )
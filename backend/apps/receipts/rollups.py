@@ -0,0 +1,182 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import connection, transaction
+
+from .models import Receipt, ReceiptRollup
+
+ROLLUP_FIELDS = ("user_id", "date", "restaurant_name", "city", "price")
+
+
+def receipt_values(receipt):
+    """
+    The fields of ``receipt`` that feed the rollups, as currently set on the
+    instance.
+    """
+    return {field: getattr(receipt, field) for field in ROLLUP_FIELDS}
+
+
+def rollup_key(values):
+    """
+    (user_id, month, restaurant_name, city) bucket a receipt counts towards.
+    The city is the one stored on the receipt, not re-parsed, so a delta
+    always lands in the bucket the receipt was added to.
+    """
+    return (
+        values["user_id"],
+        values["date"].replace(day=1),
+        values["restaurant_name"].strip(),
+        values["city"],
+    )
+
+
+def record_receipt_change(before, after):
+    """
+    Apply one receipt change to the rollups. ``before``/``after`` are
+    ``receipt_values`` dicts, or ``None`` for a create/delete.
+    """
+    deltas = defaultdict(lambda: [0, Decimal("0")])
+    if before is not None:
+        entry = deltas[rollup_key(before)]
+        entry[0] -= 1
+        entry[1] -= Decimal(before["price"])
+    if after is not None:
+        entry = deltas[rollup_key(after)]
+        entry[0] += 1
+        entry[1] += Decimal(after["price"])
+    apply_rollup_deltas(deltas)
+
+
+def record_new_receipts(values_list):
+    """
+    Add many new receipts (``receipt_values`` dicts) to the rollups in bulk,
+    e.g. after ``bulk_create``, which sends no signals.
+    """
+    deltas = defaultdict(lambda: [0, Decimal("0")])
+    for values in values_list:
+        entry = deltas[rollup_key(values)]
+        entry[0] += 1
+        entry[1] += Decimal(values["price"])
+    apply_rollup_deltas(deltas)
+
+
+def apply_rollup_deltas(deltas):
+    """
+    Add ``{key: (count, spend)}`` deltas to the rollup table with one upsert
+    and drop buckets that no longer hold any receipts.
+    """
+    rows = sorted((key, delta) for key, delta in deltas.items() if delta[0] or delta[1])
+    if not rows:
+        return
+
+    table = connection.ops.quote_name(ReceiptRollup._meta.db_table)
+    sql = f"""
+        INSERT INTO {table} (user_id, month, restaurant_name, city, receipt_count, total_spend)
+        VALUES {", ".join(["(%s, %s, %s, %s, %s, %s)"] * len(rows))}
+        ON CONFLICT (user_id, month, restaurant_name, city) DO UPDATE SET
+            receipt_count = {table}.receipt_count + EXCLUDED.receipt_count,
+            total_spend = {table}.total_spend + EXCLUDED.total_spend
+    """
+    params = [value for key, (count, spend) in rows for value in (*key, count, spend)]
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+        ReceiptRollup.objects.filter(
+            user_id__in={key[0] for key, _ in rows},
+            month__in={key[1] for key, _ in rows},
+            receipt_count__lte=0,
+        ).delete()
+
+
+def compute_rollups(queryset=None, chunk_size=2000):
+    """
+    Fold receipts into ``{key: [count, spend]}`` straight from the receipts
+    table, streaming rows so memory only grows with the number of buckets.
+    """
+    queryset = queryset if queryset is not None else Receipt.objects.all()
+    totals = defaultdict(lambda: [0, Decimal("0")])
+    for values in queryset.order_by().values(*ROLLUP_FIELDS).iterator(chunk_size=chunk_size):
+        entry = totals[rollup_key(values)]
+        entry[0] += 1
+        entry[1] += values["price"]
+    return totals
+
+
+def rebuild_rollups(batch_size=1000):
+    """
+    Replace the rollup table with totals recomputed from receipts. Returns the
+    number of rollup rows written.
+    """
+    totals = compute_rollups()
+    rows = [
+        ReceiptRollup(
+            user_id=user_id,
+            month=month,
+            restaurant_name=restaurant_name,
+            city=city,
+            receipt_count=count,
+            total_spend=spend,
+        )
+        for (user_id, month, restaurant_name, city), (count, spend) in totals.items()
+    ]
+    with transaction.atomic():
+        ReceiptRollup.objects.all().delete()
+        ReceiptRollup.objects.bulk_create(rows, batch_size=batch_size)
+    return len(rows)
+
+
+def check_rollups():
+    """
+    Compare the rollup table with the receipts. Returns a list of
+    ``(key, expected, stored)`` tuples for every bucket that differs.
+    """
+    expected = {key: tuple(value) for key, value in compute_rollups().items()}
+    stored = {
+        (row.user_id, row.month, row.restaurant_name, row.city): (row.receipt_count, row.total_spend)
+        for row in ReceiptRollup.objects.iterator(chunk_size=2000)
+    }
+    return [
+        (key, expected.get(key), stored.get(key))
+        for key in sorted(expected.keys() | stored.keys())
+        if expected.get(key) != stored.get(key)
+    ]
+
+
+def _totals(count, spend):
+    return {
+        "count": count,
+        "total": spend,
+        "average": spend / count if count else Decimal("0"),
+    }
+
+
+def summarize_rollups(rollups):
+    """
+    Fold rollup rows into overall, per-year, per-month, per-restaurant and
+    per-city totals with counts and averages.
+    """
+    overall = [0, Decimal("0")]
+    groups = {name: defaultdict(lambda: [0, Decimal("0")]) for name in ("year", "month", "restaurant", "city")}
+    for month, restaurant_name, city, count, spend in rollups.values_list(
+        "month", "restaurant_name", "city", "receipt_count", "total_spend"
+    ):
+        keys = {"year": month.year, "month": month, "restaurant": restaurant_name, "city": city}
+        for entry in [overall] + [groups[name][key] for name, key in keys.items()]:
+            entry[0] += count
+            entry[1] += spend
+
+    def by_spend(group):
+        return sorted(group.items(), key=lambda item: (-item[1][1], item[0]))
+
+    return {
+        "total": _totals(*overall),
+        "by_year": [{"year": year, **_totals(*value)} for year, value in sorted(groups["year"].items())],
+        "by_month": [
+            {"month": month.strftime("%Y-%m"), **_totals(*value)}
+            for month, value in sorted(groups["month"].items())
+        ],
+        "by_restaurant": [
+            {"restaurant_name": name, **_totals(*value)} for name, value in by_spend(groups["restaurant"])
+        ],
+        "by_city": [{"city": city, **_totals(*value)} for city, value in by_spend(groups["city"])],
+    }
@@ -1,26 +1,47 @@
+from django.conf import settings
 from rest_framework import serializers
-from .models import Receipt
+from .models import Receipt, ReceiptImport
+from .uploads import UploadError, check_uploaded_object, read_upload_token
 from backend.apps.receipts.utils import storage
+from backend.apps.restaurants.serializers import RestaurantSerializer
 from datetime import date as dt_date
 
 class ReceiptSerializer(serializers.ModelSerializer):
     image_url = serializers.SerializerMethodField(read_only=True)
+    thumbnail_url = serializers.SerializerMethodField(read_only=True)
+    image_variants = serializers.SerializerMethodField(read_only=True)
     image = serializers.ImageField(write_only=True) 
+    # Null until enrichment has resolved the receipt.
+    restaurant = RestaurantSerializer(read_only=True)
 
     class Meta:
         model = Receipt
-        fields = ['id', 'user', 'date', 'price', 'restaurant_name', 'address', 'image', 'image_url']
-        read_only_fields = ['user', 'image_url']
+        fields = [
+            'id', 'user', 'date', 'price', 'restaurant_name', 'address',
+            'image', 'image_url', 'thumbnail_url', 'image_variants', 'restaurant',
+        ]
+        read_only_fields = ['user', 'image_url', 'thumbnail_url', 'image_variants', 'restaurant']
 
-    def get_image_url(self, obj):
+    def _storage_url(self, name):
         request = self.context.get('request')
+        url = storage.url(name)
+        if request:
+            return request.build_absolute_uri(url)
+        return url
+
+    def get_image_url(self, obj):
         if obj.image:
-            url = storage.url(obj.image.name)
-            if request:
-                return request.build_absolute_uri(url)
-            return url
+            return self._storage_url(obj.image.name)
         return None
 
+    def get_thumbnail_url(self, obj):
+        # None until the image processing task has run.
+        name = obj.image_variants.get(settings.RECEIPT_LIST_THUMBNAIL)
+        return self._storage_url(name) if name else None
+
+    def get_image_variants(self, obj):
+        return {label: self._storage_url(name) for label, name in obj.image_variants.items()}
+
     def validate_price(self, value):
         if value <= 0:
             raise serializers.ValidationError("Price must be positive.")
@@ -30,3 +51,96 @@ class ReceiptSerializer(serializers.ModelSerializer):
         if value > dt_date.today():
             raise serializers.ValidationError("Date cannot be in the future.")
         return value
+
+
+class ReceiptUploadSerializer(serializers.Serializer):
+    """
+    First step of a direct upload: what the client is about to upload.
+    """
+    date = serializers.DateField()
+    filename = serializers.CharField(max_length=255)
+    content_type = serializers.ChoiceField(choices=settings.RECEIPT_UPLOAD_CONTENT_TYPES)
+
+    def validate_date(self, value):
+        if value > dt_date.today():
+            raise serializers.ValidationError("Date cannot be in the future.")
+        return value
+
+
+class ReceiptFinalizeSerializer(ReceiptSerializer):
+    """
+    Second step of a direct upload: creates the receipt for an image the
+    client has put into the bucket. The date comes from the upload token.
+    """
+    image = None
+    upload_token = serializers.CharField(write_only=True)
+
+    class Meta(ReceiptSerializer.Meta):
+        fields = [
+            'id', 'user', 'date', 'price', 'restaurant_name', 'address',
+            'upload_token', 'image_url', 'thumbnail_url', 'image_variants', 'restaurant',
+        ]
+        read_only_fields = ReceiptSerializer.Meta.read_only_fields + ['date']
+
+    def validate(self, attrs):
+        token = attrs.pop('upload_token')
+        try:
+            name, receipt_date = read_upload_token(self.context['request'].user, token)
+            check_uploaded_object(name)
+        except UploadError as exc:
+            raise serializers.ValidationError({'upload_token': str(exc)})
+        attrs['image'] = name
+        attrs['date'] = receipt_date
+        return attrs
+
+    def create(self, validated_data):
+        # Retried finalize calls return the receipt created the first time.
+        existing = Receipt.objects.filter(user=validated_data['user'], image=validated_data['image']).first()
+        if existing is not None:
+            return existing
+        return super().create(validated_data)
+
+
+class ReceiptImportSerializer(serializers.ModelSerializer):
+    """
+    Status of a bulk import. ``created``, ``failed`` and ``errors`` are
+    filled in once it is ``done``; ``error`` says why a ``failed`` import
+    could not be read.
+    """
+    created = serializers.IntegerField(source='created_count', read_only=True)
+    failed = serializers.IntegerField(source='failed_count', read_only=True)
+
+    class Meta:
+        model = ReceiptImport
+        fields = ['id', 'status', 'created', 'failed', 'errors', 'error', 'created_at', 'updated_at']
+        read_only_fields = fields
+
+
+class SpendTotalsSerializer(serializers.Serializer):
+    count = serializers.IntegerField()
+    total = serializers.DecimalField(max_digits=12, decimal_places=2)
+    average = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+
+class YearSpendSerializer(SpendTotalsSerializer):
+    year = serializers.IntegerField()
+
+
+class MonthSpendSerializer(SpendTotalsSerializer):
+    month = serializers.CharField()
+
+
+class RestaurantSpendSerializer(SpendTotalsSerializer):
+    restaurant_name = serializers.CharField()
+
+
+class CitySpendSerializer(SpendTotalsSerializer):
+    city = serializers.CharField(allow_blank=True)
+
+
+class SpendSummarySerializer(serializers.Serializer):
+    total = SpendTotalsSerializer()
+    by_year = YearSpendSerializer(many=True)
+    by_month = MonthSpendSerializer(many=True)
+    by_restaurant = RestaurantSpendSerializer(many=True)
+    by_city = CitySpendSerializer(many=True)
@@ -0,0 +1,61 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import Receipt
+from .rollups import ROLLUP_FIELDS, receipt_values, record_receipt_change
+from .tasks import process_receipt_image
+
+
+def _stored_values(instance):
+    loaded = getattr(instance, "_loaded_values", None)
+    if loaded is not None and all(field in loaded for field in ROLLUP_FIELDS):
+        return {field: loaded[field] for field in ROLLUP_FIELDS}
+    return Receipt.objects.filter(pk=instance.pk).values(*ROLLUP_FIELDS).first()
+
+
+@receiver(pre_save, sender=Receipt)
+def remember_receipt_before_save(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or instance._state.adding or instance.pk is None:
+        instance._rollup_before = None
+        return
+    if update_fields is not None and not set(update_fields) & {"user", "date", "price", "restaurant_name", "city"}:
+        instance._rollup_before = False
+        return
+    instance._rollup_before = _stored_values(instance)
+
+
+@receiver(post_save, sender=Receipt)
+def update_rollups_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    before = None if created else getattr(instance, "_rollup_before", None)
+    if before is False:
+        return
+    after = receipt_values(instance)
+    if before != after:
+        record_receipt_change(before, after)
+    instance._loaded_values = {**getattr(instance, "_loaded_values", {}), **after}
+
+
+@receiver(post_delete, sender=Receipt)
+def update_rollups_on_delete(sender, instance, **kwargs):
+    loaded = getattr(instance, "_loaded_values", None)
+    if loaded is not None and all(field in loaded for field in ROLLUP_FIELDS):
+        before = {field: loaded[field] for field in ROLLUP_FIELDS}
+    else:
+        before = receipt_values(instance)
+    record_receipt_change(before, None)
+
+
+@receiver(post_save, sender=Receipt)
+def process_image_on_save(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw or not instance.image:
+        return
+    if update_fields is not None and "image" not in update_fields:
+        return
+    loaded = getattr(instance, "_loaded_values", {})
+    if not created and loaded.get("image") == instance.image.name:
+        return
+    instance._loaded_values = {**loaded, "image": instance.image.name}
+    transaction.on_commit(lambda: process_receipt_image.delay(instance.id))
@@ -0,0 +1,109 @@
+import logging
+
+from celery import shared_task
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image
+
+from .images import build_variants, variant_name
+from .models import Receipt, ReceiptImport
+from .rollups import rebuild_rollups
+from .uploads import read_image_type
+from .utils import storage
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def process_receipt_image(receipt_id):
+    """
+    Normalize orientation, recompress and thumbnail a receipt image. The
+    derived JPEGs are stored next to the original and recorded in
+    ``Receipt.image_variants``.
+
+    This is where an image is read in full, so direct uploads (checked only
+    by their header on finalize) are verified here: an object Pillow cannot
+    decode is deleted and the receipt left without an image.
+    """
+    receipt = Receipt.objects.filter(id=receipt_id).only("id", "image", "image_variants").first()
+    if receipt is None:
+        logger.error(f"Receipt {receipt_id} not found")
+        return
+    if not receipt.image:
+        logger.warning(f"Receipt {receipt_id} has no image to process")
+        return
+
+    with storage.open(receipt.image.name, "rb") as original:
+        variants = None
+        if read_image_type(original) is not None:
+            original.seek(0)
+            try:
+                variants = build_variants(
+                    original,
+                    quality=settings.RECEIPT_IMAGE_QUALITY,
+                    max_dimension=settings.RECEIPT_IMAGE_MAX_DIMENSION,
+                    thumbnail_sizes=settings.RECEIPT_THUMBNAIL_SIZES,
+                )
+            except (OSError, SyntaxError, ValueError, Image.DecompressionBombError):
+                variants = None
+
+    if variants is None:
+        for name in {receipt.image.name, *receipt.image_variants.values()}:
+            storage.delete(name)
+        Receipt.objects.filter(id=receipt_id).update(image="", image_variants={})
+        logger.warning(f"Discarded unreadable image {receipt.image.name} of receipt {receipt_id}")
+        return
+
+    stored = {
+        label: storage.save(variant_name(receipt.image.name, label), ContentFile(data))
+        for label, data in variants.items()
+    }
+
+    # Drop derived files of a previous image that this one replaced.
+    for name in set(receipt.image_variants.values()) - set(stored.values()):
+        storage.delete(name)
+
+    # update() rather than save(): no model signals for a derived-data write.
+    Receipt.objects.filter(id=receipt_id).update(image_variants=stored)
+    logger.info(f"Processed image for receipt {receipt_id} into {sorted(stored)}")
+
+
+@shared_task
+def process_receipt_images(receipt_ids):
+    """
+    Process the images of many receipts in one task, e.g. after a bulk import.
+    """
+    for receipt_id in receipt_ids:
+        try:
+            process_receipt_image(receipt_id)
+        except Exception:
+            logger.exception(f"Failed to process image for receipt {receipt_id}")
+
+
+@shared_task
+def import_receipts_task(import_id):
+    """
+    Run a bulk import staged by the import endpoint. Imports that already
+    started are skipped: a replay would insert their rows a second time.
+    """
+    # importers queues process_receipt_images from this module.
+    from .importers import run_import
+
+    receipt_import = ReceiptImport.objects.select_related("user").filter(
+        id=import_id, status=ReceiptImport.Status.PENDING,
+    ).first()
+    if receipt_import is None:
+        logger.warning(f"Receipt import {import_id} not found or already started")
+        return
+    run_import(receipt_import)
+    logger.info(f"Receipt import {import_id} finished: {receipt_import.status}")
+
+
+@shared_task
+def rebuild_receipt_rollups_task():
+    """
+    ``manage.py rebuild_receipt_rollups`` for periodic runs on the maintenance queue.
+    """
+    written = rebuild_rollups()
+    logger.info(f"Rebuilt receipt rollups: {written} rows")
+    return written
@@ -1,13 +1,26 @@
+import posixpath
 import pytest
-from io import BytesIO
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest.mock import patch
+from types import SimpleNamespace
+from uuid import uuid4
 from datetime import date, timedelta
 from PIL import Image
 from django.urls import reverse
+from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.core.files.uploadedfile import SimpleUploadedFile
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 from django.contrib.auth import get_user_model
-from backend.apps.receipts.models import Receipt
+from django.db import connection, transaction
+from django.db.models import Q
+from backend.apps.receipts.models import Receipt, ReceiptImport, ReceiptRollup
+from backend.apps.receipts.rollups import check_rollups
+from backend.apps.receipts.pagination import ReceiptKeysetPagination
+from backend.apps.receipts.views import ReceiptViewSet
+from backend.apps.restaurants.models import ReceiptEnrichment
 
 User = get_user_model()
 
@@ -125,3 +138,989 @@ class TestReceiptAPI(APITestCase):
         detail_url = reverse("receipt-detail", args=[receipt.id])
         response = self.client.get(detail_url)
         assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@patch.object(ReceiptKeysetPagination, "page_size", 2)
+class TestReceiptPagination(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email="pager@example.com",
+            password="testpass123",
+            full_name="Pager"
+        )
+        self.client.force_authenticate(user=self.user)
+        self.receipt_url = reverse("receipt-list")
+        # Five receipts, three of them on the same day to exercise the id tiebreak.
+        dates = [date(2024, 7, 3), date(2024, 7, 2), date(2024, 7, 2), date(2024, 7, 2), date(2024, 7, 1)]
+        Receipt.objects.bulk_create(
+            Receipt(user=self.user, image="", date=d, price="10.00", restaurant_name=f"R{n}", address="Addr")
+            for n, d in enumerate(dates)
+        )
+        self.expected = list(
+            Receipt.objects.filter(user=self.user).order_by("-date", "-id").values_list("id", flat=True)
+        )
+
+    def test_cursor_walks_all_pages_without_count(self):
+        seen = []
+        url = self.receipt_url
+        while url:
+            with self.assertNumQueries(1):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn("count", response.data)
+            seen.extend(r["id"] for r in response.data["results"])
+            url = response.data["next"]
+        self.assertEqual(seen, self.expected)
+
+    def test_previous_link_returns_prior_page(self):
+        first = self.client.get(self.receipt_url)
+        second = self.client.get(first.data["next"])
+        back = self.client.get(second.data["previous"])
+
+        self.assertEqual([r["id"] for r in second.data["results"]], self.expected[2:4])
+        self.assertEqual(
+            [r["id"] for r in back.data["results"]],
+            [r["id"] for r in first.data["results"]],
+        )
+        self.assertIsNone(first.data["previous"])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.receipt_url, {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_page_number_mode(self):
+        response = self.client.get(self.receipt_url, {"page": 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["count"], 5)
+
+
+class TestReceiptSummary(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email="summary@example.com",
+            password="testpass123",
+            full_name="Summary User"
+        )
+        self.client.force_authenticate(user=self.user)
+        self.summary_url = reverse("receipt-summary")
+
+    def add_receipt(self, **kwargs):
+        data = {
+            "user": self.user,
+            "image": "",
+            "date": date(2024, 7, 15),
+            "price": Decimal("10.00"),
+            "restaurant_name": "NENI",
+            "address": "Budapester Str. 40, 10787 Berlin",
+        }
+        data.update(kwargs)
+        return Receipt.objects.create(**data)
+
+    def test_rollups_follow_create_update_delete(self):
+        receipt = self.add_receipt()
+        self.add_receipt(price=Decimal("20.00"))
+        other = self.add_receipt(date=date(2024, 8, 1), restaurant_name="Curry 36", price=Decimal("7.50"))
+
+        rollup = ReceiptRollup.objects.get(user=self.user, month=date(2024, 7, 1), restaurant_name="NENI")
+        self.assertEqual((rollup.receipt_count, rollup.total_spend, rollup.city), (2, Decimal("30.00"), "Berlin"))
+
+        # Moving a receipt to another month shifts it between buckets.
+        receipt = Receipt.objects.get(pk=receipt.pk)
+        receipt.date = date(2024, 8, 3)
+        receipt.price = Decimal("12.00")
+        receipt.save()
+        other.delete()
+
+        rows = {
+            (r.month, r.restaurant_name): (r.receipt_count, r.total_spend)
+            for r in ReceiptRollup.objects.filter(user=self.user)
+        }
+        self.assertEqual(rows, {
+            (date(2024, 7, 1), "NENI"): (1, Decimal("20.00")),
+            (date(2024, 8, 1), "NENI"): (1, Decimal("12.00")),
+        })
+        self.assertEqual(check_rollups(), [])
+
+    def test_rollup_deltas_use_the_stored_city(self):
+        receipt = self.add_receipt()
+        receipt.refresh_from_db()
+        self.assertEqual(receipt.city, "Berlin")
+
+        # The address parser changes between the add and later edits.
+        with patch("backend.apps.receipts.models.extract_city_from_address", return_value="Tiergarten"):
+            receipt.price = Decimal("12.00")
+            receipt.save()
+            self.assertEqual(list(ReceiptRollup.objects.values_list("city", "total_spend")),
+                             [("Berlin", Decimal("12.00"))])
+            Receipt.objects.get(pk=receipt.pk).delete()
+        self.assertFalse(ReceiptRollup.objects.exists())
+
+        # A new address is parsed again and moves the receipt to that city.
+        receipt = self.add_receipt()
+        receipt.address = "Theresienstr. 1, 80333 München"
+        receipt.save(update_fields=["address"])
+        receipt.refresh_from_db()
+        self.assertEqual(receipt.city, "München")
+        self.assertEqual(list(ReceiptRollup.objects.values_list("city", flat=True)), ["München"])
+        self.assertEqual(check_rollups(), [])
+
+    def test_summary_endpoint(self):
+        self.add_receipt()
+        self.add_receipt(price=Decimal("20.00"))
+        self.add_receipt(date=date(2023, 12, 24), restaurant_name="Curry 36", price=Decimal("7.50"),
+                         address="Mehringdamm 36, 10961 Berlin")
+        self.add_receipt(date=date(2024, 8, 2), restaurant_name="Brenner", price=Decimal("22.50"),
+                         address="Theresienstr. 1, 80333 München")
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.summary_url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["total"], {"count": 4, "total": "60.00", "average": "15.00"})
+        self.assertEqual([row["month"] for row in response.data["by_month"]], ["2023-12", "2024-07", "2024-08"])
+        self.assertEqual(response.data["by_month"][1]["average"], "15.00")
+        self.assertEqual(response.data["by_restaurant"][0]["restaurant_name"], "NENI")
+        self.assertEqual(
+            {row["city"]: row["total"] for row in response.data["by_city"]},
+            {"Berlin": "37.50", "München": "22.50"},
+        )
+
+        response = self.client.get(self.summary_url, {"year": "2024"})
+        self.assertEqual(response.data["total"]["count"], 3)
+        self.assertEqual([row["year"] for row in response.data["by_year"]], [2024])
+
+    def test_summary_invalid_year(self):
+        response = self.client.get(self.summary_url, {"year": "24"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_rebuild_command_checks_and_repairs(self):
+        self.add_receipt()
+        ReceiptRollup.objects.update(total_spend=Decimal("99.00"))
+
+        with self.assertRaises(CommandError):
+            call_command("rebuild_receipt_rollups", "--check", stdout=StringIO())
+
+        call_command("rebuild_receipt_rollups", stdout=StringIO())
+        call_command("rebuild_receipt_rollups", "--check", stdout=StringIO())
+        self.assertEqual(ReceiptRollup.objects.get().total_spend, Decimal("10.00"))
+
+
+@pytest.mark.django_db
+@pytest.mark.skipif(connection.vendor != "postgresql", reason="query plans are PostgreSQL specific")
+class TestReceiptQueryPlans:
+    def explain_list(self, **query_params):
+        user = User.objects.create_user(email="plan@example.com", password="pass", full_name="Plan")
+        view = ReceiptViewSet()
+        view.request = SimpleNamespace(user=user, query_params=query_params)
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+            return view.get_queryset().explain()
+
+    def test_list_uses_user_date_index(self):
+        assert "receipt_user_date_id_idx" in self.explain_list()
+
+    def test_month_filter_is_an_index_range(self):
+        plan = self.explain_list(month="2024-07")
+        assert "receipt_user_date_id_idx" in plan
+        assert "2024-07-01" in plan and "2024-08-01" in plan
+        assert "EXTRACT" not in plan.upper()
+
+    def test_keyset_page_is_an_index_range(self):
+        user = User.objects.create_user(email="keyset@example.com", password="pass", full_name="Keyset")
+        view = ReceiptViewSet()
+        view.request = SimpleNamespace(user=user, query_params={})
+        before = Q(date__lt=date(2024, 7, 2)) | Q(date=date(2024, 7, 2), id__lt=10)
+        queryset = view.get_queryset().filter(before).order_by("-date", "-id")[:51]
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+            plan = queryset.explain()
+        assert "receipt_user_date_id_idx" in plan
+        assert "Sort" not in plan
+
+
+@pytest.mark.django_db
+class TestReceiptQueryBudgets:
+    def setup_method(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.user = User.objects.create_user(email="budget@example.com", password="pass", full_name="Budget")
+        self.client = APIClient()
+        # A real session, so the session and user lookups count as well.
+        self.client.force_login(self.user)
+
+    def add_receipts(self, count, user=None):
+        Receipt.objects.bulk_create([
+            Receipt(
+                user=user or self.user, image="receipts/budget.jpg", date=date(2024, 7, 1) + timedelta(days=i % 28),
+                price=Decimal("10.00"), restaurant_name=f"Resto {i}", address="Hauptstr. 1, 10115 Berlin",
+            )
+            for i in range(count)
+        ])
+
+    def test_list_queries_do_not_grow_with_rows(self):
+        from backend.query_budget import assert_max_queries
+
+        self.add_receipts(3)
+        with assert_max_queries(ReceiptViewSet.query_budget["list"]) as few:
+            assert self.client.get(reverse("receipt-list")).status_code == status.HTTP_200_OK
+        self.add_receipts(40)
+        with assert_max_queries(ReceiptViewSet.query_budget["list"]) as many:
+            assert self.client.get(reverse("receipt-list"), {"month": "2024-07"}).status_code == status.HTTP_200_OK
+        assert many.count <= few.count
+
+    def test_list_joins_linked_restaurants(self):
+        from backend.apps.restaurants.models import Restaurant
+        from backend.query_budget import assert_max_queries
+
+        self.add_receipts(10)
+        for receipt in Receipt.objects.all():
+            receipt.restaurant = Restaurant.objects.create(name=receipt.restaurant_name, city="Berlin")
+            receipt.save(update_fields=["restaurant"])
+        with assert_max_queries(ReceiptViewSet.query_budget["list"]):
+            response = self.client.get(reverse("receipt-list"))
+        assert response.status_code == status.HTTP_200_OK
+        assert all(row["restaurant"]["name"] == row["restaurant_name"] for row in response.data["results"])
+
+    def test_detail_does_not_load_the_owner(self):
+        from backend.query_budget import record_queries
+
+        self.add_receipts(1)
+        receipt = Receipt.objects.get()
+        with record_queries() as recorder:
+            assert self.client.get(reverse("receipt-detail", args=[receipt.id])).status_code == status.HTTP_200_OK
+        # Only the request user's own lookup.
+        assert sum(count for shape, count in recorder.shapes.items() if 'FROM "users_user"' in shape) <= 1
+
+    def test_repeated_query_shape_is_flagged(self):
+        from backend.query_budget import assert_max_queries
+
+        self.add_receipts(6)
+        with pytest.raises(AssertionError, match="N\\+1: 6x"):
+            with assert_max_queries():
+                [receipt.user.email for receipt in Receipt.objects.all()]
+        with assert_max_queries(budget=1):
+            [receipt.user.email for receipt in Receipt.objects.select_related("user")]
+
+    def test_middleware_enforces_view_budget(self, settings, monkeypatch):
+        from backend.query_budget import QueryBudgetExceeded
+
+        monkeypatch.setattr(ReceiptViewSet, "query_budget", {"list": 0})
+        settings.QUERY_BUDGET_RAISE = True
+        with pytest.raises(QueryBudgetExceeded, match="GET /api/receipts/: .* budget is 0"):
+            self.client.get(reverse("receipt-list"))
+
+    def test_middleware_logs_in_production(self, settings, monkeypatch, caplog):
+        monkeypatch.setattr(ReceiptViewSet, "query_budget", {"list": 0})
+        settings.QUERY_BUDGET_RAISE = False
+        with caplog.at_level("WARNING", logger="backend.query_budget"):
+            assert self.client.get(reverse("receipt-list")).status_code == status.HTTP_200_OK
+        assert "budget is 0" in caplog.text
+
+    def test_sql_shape(self):
+        from backend.query_budget import sql_shape
+
+        assert sql_shape("SELECT * FROM t WHERE id IN (%s, %s, %s) AND name = 'x' LIMIT 21") == \
+            sql_shape("SELECT *  FROM t WHERE id IN (%s) AND name = 'y' LIMIT 1")
+
+
+class TestReceiptImageProcessing(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(email="images@example.com", password="pass", full_name="Images")
+        self.client.force_authenticate(user=self.user)
+
+    def upload(self, image_file):
+        data = {
+            "date": date(2024, 7, 15),
+            "price": "10.00",
+            "restaurant_name": "Test Restaurant",
+            "address": "123 Test Street",
+            "image": image_file,
+        }
+        with self.captureOnCommitCallbacks(execute=False):
+            response = self.client.post(reverse("receipt-list"), data, format="multipart")
+        assert response.status_code == status.HTTP_201_CREATED
+        return Receipt.objects.get(id=response.data["id"])
+
+    def rotated_jpeg(self):
+        # Stored landscape, but EXIF says "rotate 90° clockwise" -> portrait.
+        image = Image.new("RGB", (400, 200), color="blue")
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        buffer = BytesIO()
+        image.save(buffer, format="JPEG", exif=exif, quality=95)
+        return SimpleUploadedFile("IMG_0001.JPEG", buffer.getvalue(), content_type="image/jpeg")
+
+    def test_upload_keeps_real_extension(self):
+        buffer = BytesIO()
+        Image.new("RGBA", (50, 50), color=(255, 0, 0, 128)).save(buffer, format="PNG")
+        receipt = self.upload(SimpleUploadedFile("scan.jpg", buffer.getvalue(), content_type="image/png"))
+        assert receipt.image.name.endswith(".png")
+
+    def test_upload_schedules_processing(self):
+        with patch("backend.apps.receipts.signals.process_receipt_image.delay") as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(reverse("receipt-list"), {
+                    "date": date(2024, 7, 15),
+                    "price": "10.00",
+                    "restaurant_name": "Test Restaurant",
+                    "address": "123 Test Street",
+                    "image": generate_image_file(),
+                }, format="multipart")
+        delay.assert_called_once_with(response.data["id"])
+
+        receipt = Receipt.objects.get(id=response.data["id"])
+        receipt.price = Decimal("12.00")
+        with patch("backend.apps.receipts.signals.process_receipt_image.delay") as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                receipt.save()
+        delay.assert_not_called()
+
+    def test_process_normalizes_orientation_and_builds_thumbnails(self):
+        from backend.apps.receipts.tasks import process_receipt_image
+        from backend.apps.receipts.utils import storage
+
+        receipt = self.upload(self.rotated_jpeg())
+        assert receipt.image.name.endswith(".jpg")
+
+        process_receipt_image(receipt.id)
+        receipt.refresh_from_db()
+        assert set(receipt.image_variants) == {"full", "small", "medium", "large"}
+
+        with storage.open(receipt.image_variants["full"], "rb") as f:
+            full = Image.open(f)
+            full.load()
+        assert full.size == (200, 400)
+        assert full.format == "JPEG"
+        assert not full.getexif().get(0x0112)
+
+        with storage.open(receipt.image_variants["small"], "rb") as f:
+            small = Image.open(f)
+            small.load()
+        assert max(small.size) == 160
+
+        response = self.client.get(reverse("receipt-detail", args=[receipt.id]))
+        assert response.data["thumbnail_url"].endswith(receipt.image_variants["small"])
+        assert set(response.data["image_variants"]) == {"full", "small", "medium", "large"}
+
+    def test_reprocessing_replaces_old_variants(self):
+        from backend.apps.receipts.tasks import process_receipt_image
+        from backend.apps.receipts.utils import storage
+
+        receipt = self.upload(self.rotated_jpeg())
+        Receipt.objects.filter(id=receipt.id).update(image_variants={"small": "receipts/stale_small.jpg"})
+        storage.save("receipts/stale_small.jpg", BytesIO(b"stale"))
+
+        process_receipt_image(receipt.id)
+        assert not storage.exists("receipts/stale_small.jpg")
+
+
+class TestReceiptDirectUpload(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(email="direct@example.com", password="pass", full_name="Direct")
+        self.client.force_authenticate(user=self.user)
+
+    def request_upload(self, **overrides):
+        data = {"date": "2024-07-15", "filename": "IMG_0001.jpeg", "content_type": "image/jpeg", **overrides}
+        return self.client.post(reverse("receipt-uploads"), data, format="json")
+
+    def put_object(self, upload, content):
+        import requests
+
+        response = requests.post(
+            upload["url"],
+            data=upload["fields"],
+            files={"file": ("receipt.jpg", content, "image/jpeg")},
+            timeout=10,
+        )
+        assert response.status_code in (200, 204), response.text
+
+    def finalize(self, upload_token, **overrides):
+        data = {
+            "upload_token": upload_token,
+            "price": "18.50",
+            "restaurant_name": "NENI Berlin",
+            "address": "Budapester Str. 40, 10787 Berlin",
+            **overrides,
+        }
+        return self.client.post(reverse("receipt-finalize-upload"), data, format="json")
+
+    def test_upload_and_finalize(self):
+        response = self.request_upload()
+        assert response.status_code == status.HTTP_201_CREATED
+        upload = response.data
+        assert upload["fields"]["key"].startswith(f"receipts/{self.user.id}/2024-07-15/receipt_")
+        assert upload["fields"]["key"].endswith(".jpg")
+
+        self.put_object(upload, generate_image_file().read())
+        with self.captureOnCommitCallbacks(execute=False):
+            response = self.finalize(upload["upload_token"])
+        assert response.status_code == status.HTTP_201_CREATED, response.data
+        receipt = Receipt.objects.get(id=response.data["id"])
+        assert receipt.image.name == upload["fields"]["key"]
+        assert receipt.date == date(2024, 7, 15)
+        assert response.data["image_url"].endswith(upload["fields"]["key"])
+
+        # Retrying the finalize call does not create a second receipt.
+        with self.captureOnCommitCallbacks(execute=False):
+            response = self.finalize(upload["upload_token"])
+        assert response.data["id"] == receipt.id
+        assert Receipt.objects.filter(user=self.user).count() == 1
+
+    def test_finalize_requires_uploaded_object(self):
+        upload = self.request_upload().data
+        response = self.finalize(upload["upload_token"])
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert "upload_token" in response.data
+        assert not Receipt.objects.exists()
+
+    def test_finalize_rejects_oversized_object(self):
+        upload = self.request_upload().data
+        self.put_object(upload, b"x" * 64)
+        with self.settings(RECEIPT_UPLOAD_MAX_SIZE=32):
+            response = self.finalize(upload["upload_token"])
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert "too large" in str(response.data["upload_token"])
+
+    def test_finalize_rejects_non_images(self):
+        from backend.apps.receipts.utils import storage
+
+        buffer = BytesIO()
+        Image.new("RGB", (10, 10)).save(buffer, format="GIF")
+        for content in [b"%PDF-1.4 not an image", buffer.getvalue()]:
+            upload = self.request_upload().data
+            self.put_object(upload, content)
+            response = self.finalize(upload["upload_token"])
+            assert response.status_code == status.HTTP_400_BAD_REQUEST
+            assert "not a supported image" in str(response.data["upload_token"])
+            assert not storage.exists(upload["fields"]["key"])
+        assert not Receipt.objects.exists()
+
+    def test_processing_discards_corrupt_uploads(self):
+        from backend.apps.receipts.tasks import process_receipt_image
+        from backend.apps.receipts.utils import storage
+
+        # A valid PNG header in front of truncated pixel data passes the
+        # finalize check, which only reads the header.
+        buffer = BytesIO()
+        Image.effect_noise((64, 64), 50).convert("RGB").save(buffer, format="PNG")
+        upload = self.request_upload(content_type="image/png").data
+        self.put_object(upload, buffer.getvalue()[:-40])
+        with self.captureOnCommitCallbacks(execute=False):
+            response = self.finalize(upload["upload_token"])
+        assert response.status_code == status.HTTP_201_CREATED, response.data
+
+        process_receipt_image(response.data["id"])
+        receipt = Receipt.objects.get(id=response.data["id"])
+        assert not receipt.image
+        assert receipt.image_variants == {}
+        assert not storage.exists(upload["fields"]["key"])
+
+    def test_policy_pins_key_type_and_size(self):
+        import json
+        from base64 import b64decode
+
+        with self.settings(RECEIPT_UPLOAD_MAX_SIZE=32):
+            upload = self.request_upload().data
+        policy = json.loads(b64decode(upload["fields"]["policy"]))
+        assert {"key": upload["fields"]["key"]} in policy["conditions"]
+        assert {"Content-Type": "image/jpeg"} in policy["conditions"]
+        assert ["content-length-range", 1, 32] in policy["conditions"]
+
+    def test_token_is_bound_to_user(self):
+        upload = self.request_upload().data
+        self.put_object(upload, generate_image_file().read())
+        other = User.objects.create_user(email="other-direct@example.com", password="pass", full_name="Other")
+        self.client.force_authenticate(user=other)
+        response = self.finalize(upload["upload_token"])
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_tampered_token_is_rejected(self):
+        response = self.finalize("not-a-token")
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_upload_validates_request(self):
+        future = (date.today() + timedelta(days=1)).isoformat()
+        assert self.request_upload(date=future).status_code == status.HTTP_400_BAD_REQUEST
+        assert self.request_upload(content_type="application/pdf").status_code == status.HTTP_400_BAD_REQUEST
+
+
+class TestReceiptImport(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(email="import@example.com", password="pass", full_name="Import")
+        self.client.force_authenticate(user=self.user)
+
+    def csv_file(self, rows, name="receipts.csv"):
+        lines = ["date,price,restaurant_name,address,image"] + [",".join(row) for row in rows]
+        return SimpleUploadedFile(name, "\n".join(lines).encode("utf-8"), content_type="text/csv")
+
+    def zip_file(self, *names, members=None):
+        import zipfile
+
+        buffer = BytesIO()
+        with zipfile.ZipFile(buffer, "w") as archive:
+            for name in names:
+                archive.writestr(name, generate_image_file().read())
+            for name, content in (members or {}).items():
+                archive.writestr(name, content)
+        return SimpleUploadedFile("images.zip", buffer.getvalue(), content_type="application/zip")
+
+    def post_import(self, **data):
+        """
+        Post an import, run its task in place and return the import status.
+        """
+        from backend.apps.receipts.tasks import import_receipts_task
+
+        with patch("backend.apps.receipts.importers.fetch_and_create_restaurants_from_receipts.delay") as enrich, \
+                patch("backend.apps.receipts.importers.process_receipt_images.delay") as images, \
+                patch("backend.apps.receipts.views.import_receipts_task.delay", side_effect=import_receipts_task):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(reverse("receipt-import-receipts"), data, format="multipart")
+        if response.status_code == status.HTTP_202_ACCEPTED:
+            response = self.client.get(reverse("receipt-import-status", args=[response.data["id"]]))
+        return response, enrich, images
+
+    def test_import_csv_with_zip_images(self):
+        rows = [
+            ("2024-07-01", "12.50", "NENI", '"Budapester Str. 40, 10787 Berlin"', "a.jpg"),
+            ("2024-07-02", "-1", "NENI", '"Budapester Str. 40, 10787 Berlin"', "a.jpg"),
+            ("2024-07-03", "8.00", "Brenner", '"Hauptstr. 1, 10115 Berlin"', "scans/b.png"),
+            ("2024-07-04", "9.00", "Brenner", '"Hauptstr. 1, 10115 Berlin"', "missing.jpg"),
+            ("2024-07-05", "9.00", "Brenner", '"Hauptstr. 1, 10115 Berlin"', ""),
+        ]
+        with self.settings(RECEIPT_IMPORT_CHUNK_SIZE=1):
+            response, enrich, images = self.post_import(
+                file=self.csv_file(rows), images=self.zip_file("a.jpg", "scans/b.png"),
+            )
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["status"] == ReceiptImport.Status.DONE
+        assert response.data["created"] == 2
+        assert response.data["failed"] == 3
+        assert [error["line"] for error in response.data["errors"]] == [3, 5, 6]
+        assert "price" in response.data["errors"][0]["errors"]
+        assert "was not found" in str(response.data["errors"][1]["errors"]["image"])
+        assert "image" in response.data["errors"][2]["errors"]
+
+        receipts = Receipt.objects.filter(user=self.user).order_by("date")
+        assert [r.restaurant_name for r in receipts] == ["NENI", "Brenner"]
+        assert receipts[0].image.name.startswith(f"receipts/{self.user.id}/2024-07-01/receipt_")
+        assert receipts[0].image.name.endswith(".jpg")
+        assert receipts[1].image.name.endswith(".png")
+        assert check_rollups() == []
+
+        enriched = [receipt_id for call in enrich.call_args_list for receipt_id in call.args[0]]
+        assert sorted(enriched) == sorted(r.id for r in receipts)
+        assert [call.args[0] for call in images.call_args_list] == [[receipts[0].id], [receipts[1].id]]
+
+        # The staged upload and archive are removed once the task has run.
+        from backend.apps.receipts.utils import storage
+
+        receipt_import = ReceiptImport.objects.get(user=self.user)
+        assert not storage.exists(receipt_import.file)
+        assert not storage.exists(receipt_import.images)
+
+    def test_import_checks_zip_images(self):
+        from backend.apps.receipts.utils import storage
+
+        image = generate_image_file().read()
+        rows = [
+            ("2024-07-01", "12.50", "NENI", '"Budapester Str. 40, 10787 Berlin"', "a.jpg"),
+            ("2024-07-02", "8.00", "NENI", '"Budapester Str. 40, 10787 Berlin"', "notes.jpg"),
+            ("2024-07-03", "8.00", "NENI", '"Budapester Str. 40, 10787 Berlin"', "huge.jpg"),
+            ("2024-07-04", "8.00", "NENI", '"Budapester Str. 40, 10787 Berlin"', "empty.jpg"),
+        ]
+        archive = self.zip_file("a.jpg", members={
+            "notes.jpg": b"not an image", "huge.jpg": image + b"\0" * len(image), "empty.jpg": b"",
+        })
+        with self.settings(RECEIPT_UPLOAD_MAX_SIZE=len(image) + 1), \
+                patch("backend.apps.receipts.importers.storage.save", wraps=storage.save) as save:
+            response, _, _ = self.post_import(file=self.csv_file(rows), images=archive)
+
+        assert response.data["created"] == 1
+        errors = {error["line"]: str(error["errors"]["image"]) for error in response.data["errors"]}
+        assert "not a supported image" in errors[3]
+        assert "too large" in errors[4]
+        assert "empty" in errors[5]
+        # Only the valid image is copied; the other saves stage the upload.
+        assert [call.args[0] for call in save.call_args_list if call.args[0].startswith("receipts/")] == [
+            Receipt.objects.get(user=self.user).image.name
+        ]
+
+    def test_failed_chunk_deletes_copied_images(self):
+        from backend.apps.receipts.importers import ZipImages, import_receipts
+        from backend.apps.receipts.utils import storage
+
+        rows = [
+            (line, {"date": "2024-07-01", "price": "10.00", "restaurant_name": "NENI",
+                    "address": "Budapester Str. 40, 10787 Berlin", "image": "a.jpg"})
+            for line in (2, 3)
+        ]
+        saved = []
+        real_save = storage.save
+
+        def save(name, content):
+            saved.append(real_save(name, content))
+            return saved[-1]
+
+        with patch("backend.apps.receipts.importers.storage.save", side_effect=save), \
+                patch("backend.apps.receipts.importers.record_new_receipts", side_effect=RuntimeError("boom")):
+            with pytest.raises(RuntimeError):
+                import_receipts(self.user, rows, images=ZipImages(self.zip_file("a.jpg")))
+
+        assert len(saved) == 2
+        assert not any(storage.exists(name) for name in saved)
+        assert not Receipt.objects.filter(user=self.user).exists()
+
+    def put_images(self, prefix, *names, body=None):
+        from backend.apps.receipts.utils import storage
+
+        for name in names:
+            storage.bucket.put_object(
+                Key=posixpath.join(storage.location, prefix, name), Body=body or generate_image_file().read(),
+            )
+
+    def test_import_from_prefix_checks_images_exist(self):
+        prefix = f"receipts/{self.user.id}/legacy-{uuid4().hex[:8]}"
+        self.put_images(prefix, "a.jpg", "2024/b.jpg")
+        rows = [
+            ("2024-07-01", "12.50", "NENI", '"Budapester Str. 40, 10787 Berlin"', "a.jpg"),
+            ("2024-07-02", "8.00", "Brenner", '"Hauptstr. 1, 10115 Berlin"', "2024/b.jpg"),
+            ("2024-07-03", "9.00", "Brenner", '"Hauptstr. 1, 10115 Berlin"', "2024/missing.jpg"),
+            ("2024-07-04", "9.00", "Brenner", '"Hauptstr. 1, 10115 Berlin"', "../a.jpg"),
+        ]
+        response, _, _ = self.post_import(file=self.csv_file(rows), image_prefix=prefix)
+
+        assert response.data["created"] == 2
+        assert [error["line"] for error in response.data["errors"]] == [4, 5]
+        # Each receipt points at its own copy; the source objects stay put.
+        from backend.apps.receipts.utils import storage
+
+        receipts = Receipt.objects.filter(user=self.user).order_by("date")
+        assert receipts[0].image.name.startswith(f"receipts/{self.user.id}/2024-07-01/receipt_")
+        assert receipts[1].image.name.startswith(f"receipts/{self.user.id}/2024-07-02/receipt_")
+        with storage.open(receipts[1].image.name, "rb") as copy:
+            assert copy.read() == generate_image_file().read()
+        assert storage.exists(f"{prefix}/a.jpg") and storage.exists(f"{prefix}/2024/b.jpg")
+
+    def test_unreadable_prefix_image_is_not_deleted(self):
+        from backend.apps.receipts.tasks import process_receipt_image
+        from backend.apps.receipts.utils import storage
+
+        prefix = f"receipts/{self.user.id}/legacy-{uuid4().hex[:8]}"
+        self.put_images(prefix, "broken.jpg", body=b"not an image")
+        rows = [
+            ("2024-07-01", "12.50", "NENI", '"Budapester Str. 40, 10787 Berlin"', "broken.jpg"),
+            ("2024-07-02", "8.00", "NENI", '"Budapester Str. 40, 10787 Berlin"', "broken.jpg"),
+        ]
+        response, _, _ = self.post_import(file=self.csv_file(rows), image_prefix=prefix)
+        assert response.data["created"] == 2
+
+        receipts = list(Receipt.objects.filter(user=self.user).order_by("date"))
+        assert receipts[0].image.name != receipts[1].image.name
+        process_receipt_image(receipts[0].id)
+
+        assert not Receipt.objects.get(id=receipts[0].id).image
+        assert not storage.exists(receipts[0].image.name)
+        # The other receipt's copy and the user's source object survive.
+        assert storage.exists(receipts[1].image.name)
+        assert storage.exists(f"{prefix}/broken.jpg")
+
+    def test_import_queues_batched_enrichment(self):
+        prefix = f"receipts/{self.user.id}/legacy-{uuid4().hex[:8]}"
+        self.put_images(prefix, "a.jpg")
+        from backend.apps.receipts.utils import storage
+
+        rows = [("2024-07-01", "10.00", f"Resto {i}", '"Hauptstr. 1, 10115 Berlin"', "a.jpg") for i in range(25)]
+        with self.settings(RECEIPT_IMPORT_CHUNK_SIZE=10, RECEIPT_ENRICHMENT_BATCH_SIZE=4), \
+                patch("backend.apps.receipts.importers.storage.exists", wraps=storage.exists) as exists:
+            response, enrich, _ = self.post_import(file=self.csv_file(rows), image_prefix=prefix)
+        assert response.data["created"] == 25
+        # One HEAD per distinct image and chunk, no listing of the prefix.
+        assert sum(call.args[0].startswith(prefix) for call in exists.call_args_list) == 3
+        # Chunks of 10, 10, 5 split into batches of at most 4.
+        assert [len(call.args[0]) for call in enrich.call_args_list] == [4, 4, 2, 4, 4, 2, 4, 1]
+        # Pending rows let the retry sweep recover batches that never run.
+        assert ReceiptEnrichment.objects.filter(
+            receipt__user=self.user, status=ReceiptEnrichment.Status.PENDING,
+        ).count() == 25
+
+    def test_import_request_only_stages_the_files(self):
+        from backend.apps.receipts.utils import storage
+
+        rows = [("2024-07-01", "10.00", f"Resto {i}", '"Hauptstr. 1, 10115 Berlin"', "a.jpg") for i in range(12)]
+        with self.settings(RECEIPT_IMPORT_CHUNK_SIZE=2, QUERY_BUDGET_RAISE=True), \
+                patch("backend.apps.receipts.views.import_receipts_task.delay") as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(
+                    reverse("receipt-import-receipts"),
+                    {"file": self.csv_file(rows), "images": self.zip_file("a.jpg")},
+                    format="multipart",
+                )
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        assert response.data["status"] == ReceiptImport.Status.PENDING
+        delay.assert_called_once_with(response.data["id"])
+        assert not Receipt.objects.filter(user=self.user).exists()
+
+        receipt_import = ReceiptImport.objects.get(id=response.data["id"])
+        assert receipt_import.file.startswith(f"imports/{self.user.id}/")
+        assert storage.exists(receipt_import.file)
+        assert storage.exists(receipt_import.images)
+
+    def test_import_status_is_per_user(self):
+        response, _, _ = self.post_import(file=self.csv_file([]))
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["created"] == 0
+
+        other = User.objects.create_user(email="other-import@example.com", password="pass", full_name="Other")
+        self.client.force_authenticate(user=other)
+        response = self.client.get(reverse("receipt-import-status", args=[response.data["id"]]))
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_unreadable_import_file_fails_the_import(self):
+        upload = SimpleUploadedFile("receipts.csv", b"\xff\xfe\x00bad", content_type="text/csv")
+        response, _, _ = self.post_import(file=upload)
+        assert response.data["status"] == ReceiptImport.Status.FAILED
+        assert response.data["error"]
+
+    def test_import_rejects_invalid_zip(self):
+        archive = SimpleUploadedFile("images.zip", b"not a zip", content_type="application/zip")
+        response, _, _ = self.post_import(file=self.csv_file([]), images=archive)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert "images" in response.data
+        assert not ReceiptImport.objects.exists()
+
+    def test_import_rejects_foreign_image_prefix(self):
+        response, _, _ = self.post_import(file=self.csv_file([]), image_prefix="receipts/999/")
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert "image_prefix" in response.data
+
+    def test_import_rejects_unknown_format(self):
+        response, _, _ = self.post_import(file=SimpleUploadedFile("receipts.xlsx", b"", content_type="text/plain"))
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_import_command_jsonl_with_prefix(self):
+        import json
+        import os
+        import tempfile
+
+        lines = [
+            json.dumps({"date": "2024-07-01", "price": "12.50", "restaurant_name": "NENI",
+                        "address": "Budapester Str. 40, 10787 Berlin", "image": "2024/a.jpg"}),
+            "not json",
+            json.dumps({"date": "2024-07-02", "price": "7.00", "restaurant_name": "Brenner",
+                        "address": "Hauptstr. 1, 10115 Berlin", "image": "b.jpg"}),
+            json.dumps({"date": "2024-07-03", "price": "7.00", "restaurant_name": "Brenner",
+                        "address": "Hauptstr. 1, 10115 Berlin"}),
+        ]
+        prefix = f"legacy/imports-{uuid4().hex[:8]}"
+        self.put_images(prefix, "2024/a.jpg", "b.jpg")
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl", delete=False) as f:
+            f.write("\n".join(lines))
+        self.addCleanup(os.unlink, f.name)
+        out = StringIO()
+        with patch("backend.apps.receipts.importers.fetch_and_create_restaurants_from_receipts.delay"), \
+                patch("backend.apps.receipts.importers.process_receipt_images.delay"):
+            call_command("import_receipts", f.name, "--user", self.user.email,
+                         "--image-prefix", f"{prefix}/", stdout=out)
+
+        assert "Imported 2 receipts" in out.getvalue()
+        assert "line 2:" in out.getvalue()
+        assert "line 4:" in out.getvalue()
+        neni = Receipt.objects.get(user=self.user, restaurant_name="NENI")
+        assert neni.image.name.startswith(f"receipts/{self.user.id}/2024-07-01/receipt_")
+
+    def test_import_command_unknown_user(self):
+        with pytest.raises(CommandError):
+            call_command("import_receipts", "x.csv", "--user", "nobody@example.com", stdout=StringIO())
+
+
+class TestReceiptExport(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(email="export@example.com", password="pass", full_name="Export")
+        self.client.force_authenticate(user=self.user)
+        other = User.objects.create_user(email="export-other@example.com", password="pass", full_name="Other")
+        Receipt.objects.bulk_create(
+            [
+                Receipt(user=self.user, date=date(2024, 7, day), price=Decimal(f"{day}.50"),
+                        restaurant_name=f"Resto {day}", address="Hauptstr. 1, 10115 Berlin",
+                        image=f"receipts/{self.user.id}/r{day}.jpg")
+                for day in range(1, 8)
+            ]
+            + [Receipt(user=self.user, date=date(2024, 8, 1), price=Decimal("3.00"),
+                       restaurant_name='Café "Eins", Mitte', address="Unter den Linden 1, Berlin")]
+            + [Receipt(user=other, date=date(2024, 7, 1), price=Decimal("1.00"),
+                       restaurant_name="Not mine", address="Somewhere")]
+        )
+
+    def export(self, **params):
+        response = self.client.get(reverse("receipt-export"), params)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.streaming
+        return b"".join(response.streaming_content).decode("utf-8")
+
+    def test_export_csv_streams_all_receipts(self):
+        import csv
+
+        with self.settings(RECEIPT_EXPORT_CHUNK_SIZE=3):
+            content = self.export()
+        rows = list(csv.DictReader(StringIO(content)))
+        assert len(rows) == 8
+        assert rows[0]["restaurant_name"] == 'Café "Eins", Mitte'
+        assert rows[0]["image"] == ""
+        assert [row["date"] for row in rows[1:]] == [f"2024-07-0{day}" for day in range(7, 0, -1)]
+        assert rows[-1]["price"] == "1.50"
+        assert "Not mine" not in content
+
+    def test_export_csv_escapes_formulas(self):
+        import csv
+        import json
+
+        Receipt.objects.bulk_create([
+            Receipt(user=self.user, date=date(2024, 9, 1), price=Decimal("5.00"),
+                    restaurant_name='=HYPERLINK("http://evil.example","x")', address="@SUM(1+1)"),
+            Receipt(user=self.user, date=date(2024, 9, 2), price=Decimal("5.00"),
+                    restaurant_name="+49 Imbiss", address="-Hauptstr. 1"),
+        ])
+        rows = list(csv.DictReader(StringIO(self.export(month="2024-09"))))
+        assert [(row["restaurant_name"], row["address"]) for row in rows] == [
+            ("'+49 Imbiss", "'-Hauptstr. 1"),
+            ("'=HYPERLINK(\"http://evil.example\",\"x\")", "'@SUM(1+1)"),
+        ]
+        assert rows[0]["price"] == "5.00"
+
+        lines = self.export(file_format="ndjson", month="2024-09").splitlines()
+        assert json.loads(lines[0])["restaurant_name"] == "+49 Imbiss"
+
+    def test_export_ndjson_with_month_filter(self):
+        import json
+
+        response = self.client.get(reverse("receipt-export"), {"file_format": "ndjson", "month": "2024-08"})
+        assert response["Content-Type"] == "application/x-ndjson"
+        assert response["Content-Disposition"].startswith('attachment; filename="receipts-')
+        lines = b"".join(response.streaming_content).decode("utf-8").splitlines()
+        assert [json.loads(line) for line in lines] == [{
+            "id": Receipt.objects.get(date=date(2024, 8, 1)).id,
+            "date": "2024-08-01",
+            "price": "3.00",
+            "restaurant_name": 'Café "Eins", Mitte',
+            "address": "Unter den Linden 1, Berlin",
+            "image": "",
+        }]
+
+    def test_export_rejects_unknown_format(self):
+        response = self.client.get(reverse("receipt-export"), {"file_format": "xlsx"})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+class TestAddressParsing:
+    @pytest.mark.parametrize("address, expected", [
+        ("Friedrichstraße 185-190, 10117 Berlin, Germany", ("Berlin", "10117", "DE")),
+        ("12345 Berlin Street, Berlin", ("Berlin", "12345", "DE")),
+        ("Leopoldstr. 10, 80802 München", ("München", "80802", "DE")),
+        ("Kärntner Ring 5, A-1010 Wien", ("Wien", "1010", "AT")),
+        ("Bahnhofstrasse 1, 8001 Zürich, Schweiz", ("Zürich", "8001", "CH")),
+        ("10 Rue de Rivoli, 75001 Paris, France", ("Paris", "75001", "FR")),
+        ("Damrak 1, 1012 LG Amsterdam", ("Amsterdam", "1012", "NL")),
+        ("350 5th Ave, New York, NY 10118", ("New York", "10118", "US")),
+        ("10 Downing St, London SW1A 2AA, United Kingdom", ("London", "SW1A 2AA", "GB")),
+        ("10117 Berlin Germany", ("Berlin", "10117", "DE")),
+        ("Street 1, Berlin, Germany", ("Berlin", None, "DE")),
+        ("Hauptstr. 1, Berlin", ("Berlin", None, None)),
+        ("123 Test Street", (None, None, None)),
+        ("", (None, None, None)),
+    ])
+    def test_parse_address(self, address, expected):
+        from backend.apps.receipts.address import parse_address
+
+        assert tuple(parse_address(address)) == expected
+
+    def test_unknown_postcode_keeps_written_city(self):
+        from backend.apps.receipts.address import parse_address
+
+        # Not in the gazetteer and no country given: trust the address.
+        assert parse_address("Leopoldstr. 10, 80802 Muenchen").city == "Muenchen"
+        assert parse_address("Dorfstr. 1, 99999 Kleinstadt").city == "Kleinstadt"
+
+    def test_parse_is_memoized_on_normalized_address(self):
+        from backend.apps.receipts.address import parse_address, parse_cache_info, reset_gazetteer
+
+        reset_gazetteer()
+        parse_address("Hauptstr. 1, 10115 Berlin")
+        parse_address("  Hauptstr.  1,   10115 Berlin ")
+        info = parse_cache_info()
+        assert (info.hits, info.misses) == (1, 1)
+
+    def test_extract_city_from_address_uses_parser(self):
+        from backend.apps.receipts.utils import extract_city_from_address
+
+        assert extract_city_from_address("Budapester Str. 40, 10787 Berlin, Deutschland") == "Berlin"
+        assert extract_city_from_address(None) is None
+
+    def test_gazetteer_ranges(self, tmp_path):
+        from backend.apps.receipts.address import Gazetteer, build_gazetteer
+
+        path = tmp_path / "postcodes.tsv"
+        written = build_gazetteer(
+            [
+                ("DE", "10115", "Berlin"), ("DE", "10117", "Berlin"), ("DE", "10119", "Berlin"),
+                ("DE", "10117", "Berlin-Mitte"), ("DE", "20095", "Hamburg"),
+                ("AT", "1010", "Wien"), ("GB", "SW1A", "London"),
+            ],
+            path,
+        )
+        assert written == 4
+        assert path.read_text().splitlines()[-1] == "GB\tSW1A\tSW1A\tLondon"
+
+        gazetteer = Gazetteer(path)
+        assert gazetteer.lookup("DE", "10118") == "Berlin"
+        assert gazetteer.lookup("DE", "20095") == "Hamburg"
+        assert gazetteer.lookup("DE", "20096") is None
+        assert gazetteer.lookup("DE", "1010") is None
+        assert gazetteer.lookup("AT", "1010") == "Wien"
+        assert gazetteer.lookup("GB", "SW1A") == "London"
+        assert gazetteer.lookup("FR", "75001") is None
+        assert len(gazetteer) == 4
+        gazetteer.close()
+
+    def test_rebuilding_keeps_open_gazetteers_intact(self, tmp_path):
+        from backend.apps.receipts.address import Gazetteer, build_gazetteer
+
+        path = tmp_path / "postcodes.tsv"
+        build_gazetteer([("DE", "10115", "Berlin"), ("DE", "20095", "Hamburg")], path)
+        old = Gazetteer(path)
+        assert old.lookup("DE", "20095") == "Hamburg"
+
+        build_gazetteer([("DE", "80331", "München")], path)
+        # The mapped file is replaced, not rewritten in place.
+        assert old.lookup("DE", "20095") == "Hamburg"
+        assert len(old) == 2
+        new = Gazetteer(path)
+        assert new.lookup("DE", "80331") == "München"
+        assert [p.name for p in tmp_path.iterdir()] == ["postcodes.tsv"]
+        old.close()
+        new.close()
+
+    def test_build_gazetteer_command(self, tmp_path):
+        source = tmp_path / "DE.txt"
+        source.write_text(
+            "DE\t10115\tBerlin\tBerlin\tBE\n"
+            "DE\t10117\tBerlin\tBerlin\tBE\n"
+            "AT\t1010\tWien\tWien\t09\n"
+        )
+        output = tmp_path / "postcodes.tsv"
+        out = StringIO()
+        call_command("build_postcode_gazetteer", str(source), "--output", str(output), "--countries", "DE", stdout=out)
+        assert output.read_text() == "DE\t10115\t10117\tBerlin\n"
+        assert "Wrote 1 postcode ranges" in out.getvalue()
+
+        with pytest.raises(CommandError):
+            call_command("build_postcode_gazetteer", str(source), stdout=StringIO())
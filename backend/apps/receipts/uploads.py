@@ -0,0 +1,149 @@
+import posixpath
+from datetime import date as dt_date
+from io import BytesIO
+from secrets import token_hex
+
+from django.conf import settings
+from django.core import signing
+from PIL import Image
+from storages.utils import clean_name, safe_join
+
+from .models import Receipt
+from .utils import storage, user_receipt_upload_path
+
+UPLOAD_TOKEN_SALT = "receipts.upload"
+
+# Leading bytes of an uploaded object fetched on finalize to tell its type.
+SNIFF_BYTES = 64 * 1024
+
+
+class UploadError(Exception):
+    """
+    The upload token is invalid or the uploaded object is missing or rejected.
+    """
+
+
+def new_upload_key(user, receipt_date, filename):
+    """
+    Storage name for a direct upload, following ``user_receipt_upload_path``
+    with a random suffix so uploads within the same second cannot collide.
+    """
+    name = user_receipt_upload_path(Receipt(user=user, date=receipt_date), filename)
+    root, ext = posixpath.splitext(name)
+    return f"{root}_{token_hex(4)}{ext}"
+
+
+def create_upload(user, receipt_date, filename, content_type):
+    """
+    Presign a POST that lets the client put one image straight into the bucket.
+
+    Returns the form ``url`` and ``fields`` to send along with the file, plus an
+    ``upload_token`` that the finalize call exchanges for a ``Receipt``. The
+    policy pins the key and content type and caps the size at
+    ``RECEIPT_UPLOAD_MAX_SIZE``.
+    """
+    name = new_upload_key(user, receipt_date, filename)
+    expires_in = settings.RECEIPT_UPLOAD_URL_EXPIRY
+    presigned = storage.bucket.meta.client.generate_presigned_post(
+        Bucket=storage.bucket_name,
+        Key=safe_join(storage.location, clean_name(name)),
+        Fields={"Content-Type": content_type},
+        Conditions=[
+            {"Content-Type": content_type},
+            ["content-length-range", 1, settings.RECEIPT_UPLOAD_MAX_SIZE],
+        ],
+        ExpiresIn=expires_in,
+    )
+    token = signing.dumps(
+        {"user": user.id, "name": name, "date": receipt_date.isoformat()},
+        salt=UPLOAD_TOKEN_SALT,
+    )
+    return {
+        "url": presigned["url"],
+        "fields": presigned["fields"],
+        "upload_token": token,
+        "expires_in": expires_in,
+    }
+
+
+def read_upload_token(user, token):
+    """
+    Return ``(name, date)`` for a token issued to ``user`` by ``create_upload``.
+    Tokens stay valid a little longer than the URL so slow uploads can finish.
+    """
+    try:
+        payload = signing.loads(
+            token,
+            salt=UPLOAD_TOKEN_SALT,
+            max_age=settings.RECEIPT_UPLOAD_URL_EXPIRY + settings.RECEIPT_UPLOAD_FINALIZE_GRACE,
+        )
+    except signing.SignatureExpired:
+        raise UploadError("Upload token has expired.")
+    except signing.BadSignature:
+        raise UploadError("Invalid upload token.")
+    if payload["user"] != user.id:
+        raise UploadError("Invalid upload token.")
+    return payload["name"], dt_date.fromisoformat(payload["date"])
+
+
+def read_image_type(fileobj):
+    """
+    MIME type of the image in ``fileobj`` once Pillow has read and verified
+    it, or ``None`` if it is not an image Pillow can read.
+    """
+    try:
+        with Image.open(fileobj) as image:
+            image_type = Image.MIME.get(image.format)
+            image.verify()
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError):
+        return None
+    return image_type
+
+
+def sniff_image_type(header):
+    """
+    MIME type of an image from its leading bytes, or ``None``. Only the
+    header is parsed; the pixel data is verified by ``process_receipt_image``.
+    """
+    try:
+        with Image.open(BytesIO(header)) as image:
+            return Image.MIME.get(image.format)
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError):
+        return None
+
+
+def read_object_header(name, length=SNIFF_BYTES):
+    """
+    First ``length`` bytes of a stored object, fetched with a ranged GET so
+    the web process never downloads the whole image.
+    """
+    response = storage.bucket.meta.client.get_object(
+        Bucket=storage.bucket_name,
+        Key=safe_join(storage.location, clean_name(name)),
+        Range=f"bytes=0-{length - 1}",
+    )
+    with response["Body"] as body:
+        return body.read()
+
+
+def check_uploaded_object(name):
+    """
+    Make sure the client really uploaded the object, that it is not empty or
+    larger than ``RECEIPT_UPLOAD_MAX_SIZE``, and that its header is that of an
+    image of an accepted type. Only the object's metadata and first
+    ``SNIFF_BYTES`` are read; full verification happens when the image is
+    processed. Rejected objects are deleted. Returns its size in bytes.
+    """
+    try:
+        size = storage.size(name)
+    except FileNotFoundError:
+        raise UploadError("The image has not been uploaded yet.")
+    if size <= 0:
+        raise UploadError("The uploaded image is empty.")
+    if size > settings.RECEIPT_UPLOAD_MAX_SIZE:
+        storage.delete(name)
+        raise UploadError("The uploaded image is too large.")
+    if sniff_image_type(read_object_header(name)) not in settings.RECEIPT_UPLOAD_CONTENT_TYPES:
+        storage.delete(name)
+        raise UploadError("The uploaded file is not a supported image.")
+    return size
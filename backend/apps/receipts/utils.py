@@ -1,22 +1,54 @@
 from django.conf import settings
 from django.utils.module_loading import import_string
 from datetime import datetime
+from backend.apps.receipts.address import extract_city
+from backend.apps.receipts.images import image_extension
+from backend.metrics import STORAGE_LATENCY, timed
 
-# Instantiate storage once, from your Django DEFAULT_FILE_STORAGE setting
 StorageClass = import_string(settings.DEFAULT_FILE_STORAGE)
-storage = StorageClass()
+
+
+class TimedStorage(StorageClass):
+    """
+    The ``DEFAULT_FILE_STORAGE`` backend with upload latency metrics.
+    """
+
+    def _save(self, name, content):
+        with timed(STORAGE_LATENCY, operation="save"):
+            return super()._save(name, content)
+
+    def deconstruct(self):
+        # Migrations refer to the configured backend, not this wrapper.
+        _, args, kwargs = super().deconstruct()
+        return f"{StorageClass.__module__}.{StorageClass.__qualname__}", args, kwargs
+
+
+# Instantiate storage once, from your Django DEFAULT_FILE_STORAGE setting
+storage = TimedStorage()
 
 def user_receipt_upload_path(instance, filename):
     """
     Returns a path like:
-    receipts/<user_id>/<YYYY-MM-DD>/receipt_<timestamp>.jpg
+    receipts/<user_id>/<YYYY-MM-DD>/receipt_<timestamp>.<ext>
+
+    The extension follows the image format Pillow detected on upload, falling
+    back to the client's file name.
     """
     date = instance.date
     user_id = instance.user.id
 
+    uploaded = getattr(instance.image, "_file", None)
+    image_format = getattr(getattr(uploaded, "image", None), "format", None)
+
     timestamp = datetime.now().strftime("%Y%m%dT%H%M%S")
-    new_filename = f"receipt_{timestamp}.jpg"
+    new_filename = f"receipt_{timestamp}.{image_extension(image_format, filename)}"
 
     date_path = date.strftime("%Y-%m-%d")
 
     return f"receipts/{user_id}/{date_path}/{new_filename}"
+
+def extract_city_from_address(address):
+    """
+    City of a receipt address, see ``backend.apps.receipts.address``.
+    """
+    return extract_city(address)
@@ -1,37 +1,181 @@
+import zipfile
 from rest_framework import viewsets, permissions, status
+from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.exceptions import ValidationError, PermissionDenied
-from datetime import datetime
-from .models import Receipt
-from .serializers import ReceiptSerializer
+from datetime import date, datetime, timedelta
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from backend.query_budget import EXEMPT
+from .models import Receipt, ReceiptImport, ReceiptRollup
+from .pagination import ReceiptPagination
+from .rollups import summarize_rollups
+from .serializers import (
+    ReceiptFinalizeSerializer,
+    ReceiptImportSerializer,
+    ReceiptSerializer,
+    ReceiptUploadSerializer,
+    SpendSummarySerializer,
+)
+from .exporters import EXPORT_FORMATS, stream_export
+from .importers import IMPORT_FORMATS, ImportFileError, detect_format, stage_import
+from .tasks import import_receipts_task
+from .uploads import create_upload
 
 class ReceiptViewSet(viewsets.ModelViewSet):
     serializer_class = ReceiptSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = ReceiptPagination
+    # Per action, including up to two session/user lookups on a cache miss.
+    # Edits and deletes also adjust the rollups and interaction stats.
+    # Export is exempt: it scales with the file and runs the same statement
+    # once per chunk. Import only stages the files for a task.
+    query_budget = {
+        "list": 4,
+        "retrieve": 4,
+        "create": 9,
+        "update": 12,
+        "partial_update": 12,
+        "destroy": 14,
+        "summary": 3,
+        "uploads": 2,
+        "finalize_upload": 9,
+        "import_receipts": 3,
+        "import_status": 3,
+        "export": EXEMPT,
+    }
 
     def get_queryset(self):
-        queryset = Receipt.objects.filter(user=self.request.user)
+        # One join instead of a restaurant query per listed receipt.
+        queryset = Receipt.objects.filter(user=self.request.user).select_related('restaurant')
         month = self.request.query_params.get("month")
 
         if month:
             try:
-                dt = datetime.strptime(month, "%Y-%m")
-                queryset = queryset.filter(date__year=dt.year, date__month=dt.month)
+                start = datetime.strptime(month, "%Y-%m").date()
             except ValueError:
                 raise ValidationError({"detail": "Invalid 'month' format. Use YYYY-MM."})
+            # A plain date range keeps the (user, date) index usable.
+            end = (start + timedelta(days=31)).replace(day=1)
+            queryset = queryset.filter(date__gte=start, date__lt=end)
 
         return queryset
 
+    @action(detail=False, methods=["get"])
+    def summary(self, request):
+        """
+        Spending totals, counts and averages per year, month, restaurant and
+        city, read from the incrementally maintained rollups.
+        """
+        rollups = ReceiptRollup.objects.filter(user=request.user)
+        year = request.query_params.get("year")
+        if year:
+            if not year.isdigit() or len(year) != 4:
+                raise ValidationError({"detail": "Invalid 'year' format. Use YYYY."})
+            rollups = rollups.filter(month__year=int(year))
+
+        serializer = SpendSummarySerializer(summarize_rollups(rollups))
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=["get"])
+    def export(self, request):
+        """
+        Stream the user's receipts (optionally filtered by ``month``) as CSV
+        or NDJSON, chosen with ``?file_format=``. ``format`` is left to DRF's
+        content negotiation.
+        """
+        fmt = request.query_params.get("file_format", "csv")
+        if fmt not in EXPORT_FORMATS:
+            raise ValidationError({"detail": f"Invalid 'file_format'. Use one of: {', '.join(EXPORT_FORMATS)}."})
+
+        response = StreamingHttpResponse(stream_export(self.get_queryset(), fmt), content_type=EXPORT_FORMATS[fmt])
+        filename = f"receipts-{date.today():%Y-%m-%d}.{fmt}"
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
+    @action(detail=False, methods=["post"])
+    def uploads(self, request):
+        """
+        Presign a direct-to-bucket upload for a receipt image.
+        """
+        serializer = ReceiptUploadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        upload = create_upload(
+            request.user,
+            serializer.validated_data["date"],
+            serializer.validated_data["filename"],
+            serializer.validated_data["content_type"],
+        )
+        return Response(upload, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=["post"], url_path="uploads/finalize")
+    def finalize_upload(self, request):
+        """
+        Create the receipt for an image uploaded through a presigned upload.
+        """
+        serializer = ReceiptFinalizeSerializer(data=request.data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            serializer.save(user=request.user)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=["post"], url_path="import")
+    def import_receipts(self, request):
+        """
+        Bulk-create receipts from an uploaded CSV or JSON Lines ``file``.
+        Images come from an optional ``images`` zip, or from an
+        ``image_prefix`` inside the user's own upload folder. The files are
+        staged and imported by a task; poll ``import_status`` for the result.
+        """
+        upload = request.FILES.get("file")
+        if upload is None:
+            raise ValidationError({"file": "This field is required."})
+        try:
+            fmt = request.data.get("format") or detect_format(upload.name)
+        except ImportFileError as exc:
+            raise ValidationError({"file": str(exc)})
+        if fmt not in IMPORT_FORMATS:
+            raise ValidationError({"format": f"Use one of: {', '.join(IMPORT_FORMATS)}."})
+        images = request.FILES.get("images")
+        image_prefix = (request.data.get("image_prefix") or "").strip("/")
+        if images is not None:
+            # Only the archive's end record is read here; members are checked
+            # by the task.
+            if not zipfile.is_zipfile(images):
+                raise ValidationError({"images": "The images file is not a valid zip archive."})
+            images.seek(0)
+            image_prefix = ""
+        elif image_prefix:
+            if not image_prefix.startswith(f"receipts/{request.user.id}/") or ".." in image_prefix.split("/"):
+                raise ValidationError({"image_prefix": "Must be inside your own receipts folder."})
+        with transaction.atomic():
+            receipt_import = stage_import(request.user, upload, fmt, images=images, image_prefix=image_prefix)
+            transaction.on_commit(lambda: import_receipts_task.delay(receipt_import.id))
+        return Response(ReceiptImportSerializer(receipt_import).data, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=False, methods=["get"], url_path=r"import/(?P<import_id>[0-9]+)")
+    def import_status(self, request, import_id=None):
+        """
+        Status and, once done, result of one of the user's imports.
+        """
+        receipt_import = get_object_or_404(ReceiptImport, id=import_id, user=request.user)
+        return Response(ReceiptImportSerializer(receipt_import).data, status=status.HTTP_200_OK)
+
     def get_serializer_context(self):
         # Pass request to serializer for building absolute URLs
         return {'request': self.request}
 
     def perform_create(self, serializer):
-        # Ensure user is set from request (ignore user field from client)
-        serializer.save(user=self.request.user)
+        # Ensure user is set from request (ignore user field from client).
+        # One transaction, so the receipt never commits without its pending
+        # enrichment row.
+        with transaction.atomic():
+            serializer.save(user=self.request.user)
 
     def get_object(self):
         obj = super().get_object()
-        if obj.user != self.request.user:
+        # Compare ids: obj.user would load the owner row on every request.
+        if obj.user_id != self.request.user.id:
             raise PermissionDenied("You do not have permission to access this receipt.")
         return obj
\ No newline at end of file
@@ -0,0 +1,166 @@
+"""
+Linking historical receipts to their ``Restaurant``.
+
+Receipts enriched before ``Receipt.restaurant`` existed are resolved in id
+order, one chunk at a time, without calling Google where possible:
+
+1. the restaurant their ``ReceiptEnrichment`` row already recorded,
+2. a restaurant with the same name in the same city, or a fuzzy match
+   (``find_matching_restaurant``),
+3. the place a stored ``PlaceLookup`` resolved the name to.
+
+Only with ``remote=True`` are the rest resolved through the cached Places
+lookup. A receipt whose visit enrichment already counted is only linked;
+pending and failed ones, and older ones without an interaction for their
+pair, have their visit recorded as enrichment would. Every chunk is
+committed on its own, so runs can be stopped at any point and resumed after
+the last reported id.
+"""
+from django.db import transaction
+
+from backend.apps.receipts.models import Receipt
+from backend.apps.receipts.utils import extract_city_from_address
+
+from .matching import find_matching_restaurant
+from .models import PlaceLookup, ReceiptEnrichment, Restaurant, UserRestaurantInteraction
+from .places_cache import lookup_key
+from .tasks import record_enrichment_outcomes, resolve_restaurant
+
+
+def find_local_restaurant(name, city):
+    """
+    Restaurant for ``name`` in ``city`` from data we already have: the
+    restaurant table, then earlier Places lookups. ``None`` if unknown.
+    """
+    restaurant = Restaurant.objects.filter(name__iexact=name, city__iexact=city).order_by('id').first()
+    if restaurant is None:
+        restaurant = find_matching_restaurant(name, city)
+    if restaurant is None:
+        stored = PlaceLookup.objects.filter(key=lookup_key(name, city)).values_list('data', flat=True).first()
+        if stored and stored.get('place_id'):
+            restaurant = Restaurant.objects.filter(place_id=stored['place_id']).first()
+    return restaurant
+
+
+class ReceiptBackfill:
+    """
+    Links unlinked receipts with ids above ``start_after`` to restaurants,
+    ``chunk_size`` receipts at a time. Resolutions are remembered per
+    (name, city) for the whole run.
+    """
+
+    def __init__(self, chunk_size=1000, start_after=0, remote=False):
+        self.chunk_size = chunk_size
+        self.last_id = start_after
+        self.remote = remote
+        self.resolved = {}
+
+    def chunks(self):
+        """
+        Process every remaining chunk, yielding ``(scanned, linked)`` counts
+        after each commit; ``last_id`` is where to resume.
+        """
+        while True:
+            receipts = list(
+                Receipt.objects.filter(restaurant__isnull=True, id__gt=self.last_id)
+                .select_related('user')
+                .order_by('id')
+                .only('id', 'user__id', 'restaurant_name', 'address', 'date', 'price')[:self.chunk_size]
+            )
+            if not receipts:
+                return
+            linked = self.link(receipts)
+            self.last_id = receipts[-1].id
+            yield len(receipts), linked
+
+    def link(self, receipts):
+        states = {
+            receipt_id: (status, restaurant_id)
+            for receipt_id, status, restaurant_id in ReceiptEnrichment.objects
+            .filter(receipt_id__in=[receipt.id for receipt in receipts])
+            .values_list('receipt_id', 'status', 'restaurant_id')
+        }
+        counted, stateless, uncounted, unresolved = [], [], [], []
+        for receipt in receipts:
+            status, restaurant_id = states.get(receipt.id, (None, None))
+            restaurant_id = restaurant_id or self.resolve(receipt)
+            if restaurant_id is None:
+                if status is None:
+                    unresolved.append(receipt)
+                continue
+            if status == ReceiptEnrichment.Status.DONE:
+                receipt.restaurant_id = restaurant_id
+                counted.append(receipt)
+            elif status in (None, ReceiptEnrichment.Status.UNLINKED):
+                stateless.append((receipt, restaurant_id))
+            else:
+                # Pending or failed: enrichment never counted the visit.
+                uncounted.append((receipt, restaurant_id))
+
+        # Receipts from before enrichment state was kept had their visit
+        # counted only if Google resolved them then, which left an
+        # interaction for the pair; the others are counted now.
+        visited = set(
+            UserRestaurantInteraction.objects
+            .filter(
+                user_id__in={receipt.user_id for receipt, _ in stateless},
+                restaurant_id__in={restaurant_id for _, restaurant_id in stateless},
+            )
+            .values_list('user_id', 'restaurant_id')
+        )
+        for receipt, restaurant_id in stateless:
+            if (receipt.user_id, restaurant_id) in visited:
+                receipt.restaurant_id = restaurant_id
+                counted.append(receipt)
+            else:
+                uncounted.append((receipt, restaurant_id))
+
+        with transaction.atomic():
+            Receipt.objects.bulk_update(counted, ['restaurant'])
+            # Mark them done so no later run counts them again.
+            ReceiptEnrichment.objects.bulk_create(
+                [
+                    ReceiptEnrichment(
+                        receipt_id=receipt.id, restaurant_id=receipt.restaurant_id,
+                        status=ReceiptEnrichment.Status.DONE,
+                    )
+                    for receipt in counted
+                ],
+                update_conflicts=True,
+                unique_fields=['receipt'],
+                update_fields=['status', 'restaurant'],
+            )
+            # Whether these were counted stays unknown; reconcile_interactions
+            # leaves their users alone. A later --remote run may still link them.
+            ReceiptEnrichment.objects.bulk_create(
+                [
+                    ReceiptEnrichment(receipt_id=receipt.id, status=ReceiptEnrichment.Status.UNLINKED)
+                    for receipt in unresolved
+                ],
+                ignore_conflicts=True,
+            )
+        if uncounted:
+            ReceiptEnrichment.objects.bulk_create(
+                [ReceiptEnrichment(receipt_id=receipt.id) for receipt, _ in uncounted], ignore_conflicts=True,
+            )
+            restaurants = Restaurant.objects.in_bulk({restaurant_id for _, restaurant_id in uncounted})
+            # Records the visit and links the receipt, unless a running
+            # enrichment finishes it first.
+            record_enrichment_outcomes(
+                [receipt for receipt, _ in uncounted],
+                {receipt.id: (restaurants[restaurant_id], "") for receipt, restaurant_id in uncounted},
+            )
+        return len(counted) + sum(1 for receipt, _ in uncounted if receipt.restaurant_id is not None)
+
+    def resolve(self, receipt):
+        name = receipt.restaurant_name.strip()
+        city = extract_city_from_address(receipt.address)
+        if not name or not city:
+            return None
+        key = (name.casefold(), city.casefold())
+        if key not in self.resolved:
+            restaurant = find_local_restaurant(name, city)
+            if restaurant is None and self.remote:
+                restaurant = resolve_restaurant(name, city, receipt.address)
+            self.resolved[key] = restaurant.id if restaurant else None
+        return self.resolved[key]
@@ -0,0 +1,76 @@
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+
+from .tasks import fetch_and_create_restaurants_from_receipts
+
+logger = logging.getLogger(__name__)
+
+
+class ReceiptBatcher:
+    """
+    Coalesces receipt IDs queued in this process into batches.
+
+    The first ID after a flush starts a timer of ``window`` seconds; when it
+    fires, or as soon as ``max_size`` IDs are pending, the batch is handed to
+    ``dispatch``. A ``window`` of 0 dispatches every ID on its own. Pending IDs
+    are flushed on interpreter exit.
+    """
+
+    def __init__(self, dispatch, window, max_size):
+        self.dispatch = dispatch
+        self.window = window
+        self.max_size = max_size
+        self.pending = []
+        self.timer = None
+        self.lock = threading.Lock()
+
+    def add(self, receipt_id):
+        if self.window <= 0:
+            self._send([receipt_id])
+            return
+
+        batch = None
+        with self.lock:
+            self.pending.append(receipt_id)
+            if len(self.pending) >= self.max_size:
+                batch = self._take()
+            elif self.timer is None:
+                self.timer = threading.Timer(self.window, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+        if batch:
+            self._send(batch)
+
+    def flush(self):
+        with self.lock:
+            batch = self._take()
+        if batch:
+            self._send(batch)
+
+    def _take(self):
+        batch, self.pending = self.pending, []
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        return batch
+
+    def _send(self, batch):
+        try:
+            self.dispatch(batch)
+        except Exception:
+            logger.exception(f"Failed to dispatch enrichment batch for receipts {batch}")
+
+
+def _dispatch_enrichment(receipt_ids):
+    fetch_and_create_restaurants_from_receipts.delay(receipt_ids)
+
+
+enrichment_batcher = ReceiptBatcher(
+    dispatch=_dispatch_enrichment,
+    window=settings.RECEIPT_ENRICHMENT_BATCH_WINDOW,
+    max_size=settings.RECEIPT_ENRICHMENT_BATCH_SIZE,
+)
+atexit.register(enrichment_batcher.flush)
@@ -0,0 +1,197 @@
+import logging
+import os
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from backend.metrics import PLACES_ERRORS, PLACES_LATENCY, timed
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# API statuses that are answers. Google reports quota, key and request errors
+# (OVER_QUERY_LIMIT, REQUEST_DENIED, INVALID_REQUEST, UNKNOWN_ERROR) with HTTP
+# 200; they must not look like "no such place". NOT_FOUND is what details
+# returns for a place_id that no longer exists.
+ANSWER_STATUSES = frozenset(["OK", "ZERO_RESULTS", "NOT_FOUND"])
+DETAIL_FIELDS = "place_id,name,formatted_address,formatted_phone_number,rating,user_ratings_total,type"
+
+
+class PlacesAPIError(Exception):
+    """
+    The Places API could not be reached or kept failing after all retries.
+    Distinct from "no such place", which the client reports as ``None``.
+    """
+
+
+class CappedRetry(Retry):
+    """
+    ``Retry`` that honours a server's Retry-After header only up to
+    ``backoff_max`` seconds, so one 429 cannot stall a worker thread.
+    """
+
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        if retry_after is None:
+            return None
+        return min(retry_after, self.backoff_max)
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket: allows ``rate`` calls per second on average with
+    bursts of up to ``burst`` calls. A rate of 0 disables limiting.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if not self.rate:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class PlacesClient:
+    """
+    Google Places client over a pooled keep-alive ``requests.Session``.
+
+    Every call has connect/read timeouts, 429/5xx responses and connection
+    errors are retried a bounded number of times with exponential backoff
+    (a server's Retry-After is honoured up to ``PLACES_RETRY_BACKOFF_MAX``),
+    and calls are throttled by a rate limiter. All settings default to the
+    ``PLACES_*`` / ``GOOGLE_*`` Django settings and can be overridden, e.g. to
+    point the client at a local fake server.
+    """
+
+    def __init__(
+        self,
+        api_key=None,
+        find_url=None,
+        details_url=None,
+        connect_timeout=None,
+        read_timeout=None,
+        max_retries=None,
+        backoff_factor=None,
+        rate_limit=None,
+        pool_maxsize=None,
+    ):
+        self.api_key = api_key if api_key is not None else settings.GOOGLE_API_KEY
+        self.find_url = find_url or settings.GOOGLE_PLACES_TEXT_SEARCH_URL
+        self.details_url = details_url or settings.GOOGLE_PLACES_DETAILS_URL
+        self.timeout = (
+            connect_timeout if connect_timeout is not None else settings.PLACES_CONNECT_TIMEOUT,
+            read_timeout if read_timeout is not None else settings.PLACES_READ_TIMEOUT,
+        )
+        self.max_retries = max_retries if max_retries is not None else settings.PLACES_MAX_RETRIES
+        self.backoff_factor = backoff_factor if backoff_factor is not None else settings.PLACES_RETRY_BACKOFF
+        self.rate_limiter = RateLimiter(rate_limit if rate_limit is not None else settings.PLACES_RATE_LIMIT)
+        self.session = self._build_session(pool_maxsize or settings.PLACES_POOL_MAXSIZE)
+
+    def _build_session(self, pool_maxsize):
+        retry = CappedRetry(
+            total=self.max_retries,
+            backoff_factor=self.backoff_factor,
+            backoff_max=settings.PLACES_RETRY_BACKOFF_MAX,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset(["GET"]),
+            raise_on_status=False,
+            respect_retry_after_header=True,
+        )
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_maxsize, max_retries=retry)
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def _get(self, url, params, endpoint):
+        self.rate_limiter.acquire()
+        try:
+            # Time spent waiting for the rate limiter is not API latency.
+            with timed(PLACES_LATENCY, endpoint=endpoint):
+                response = self.session.get(url, params={**params, "key": self.api_key}, timeout=self.timeout)
+        except requests.RequestException as exc:
+            PLACES_ERRORS.labels(endpoint=endpoint, reason="connection").inc()
+            raise PlacesAPIError(f"Places request to {url} failed: {exc}") from exc
+        if response.status_code != 200:
+            PLACES_ERRORS.labels(endpoint=endpoint, reason=f"http_{response.status_code}").inc()
+            raise PlacesAPIError(f"Places request to {url} returned HTTP {response.status_code}")
+        try:
+            data = response.json()
+        except ValueError as exc:
+            # e.g. a proxy's HTML error page once the retries are spent.
+            PLACES_ERRORS.labels(endpoint=endpoint, reason="invalid_response").inc()
+            raise PlacesAPIError(f"Places request to {url} returned a non-JSON body") from exc
+        if not isinstance(data, dict):
+            PLACES_ERRORS.labels(endpoint=endpoint, reason="invalid_response").inc()
+            raise PlacesAPIError(f"Places request to {url} returned an unexpected body")
+        status = data.get("status", "OK")
+        if status not in ANSWER_STATUSES:
+            PLACES_ERRORS.labels(endpoint=endpoint, reason=status.lower()).inc()
+            raise PlacesAPIError(f"Places request to {url} returned {status}: {data.get('error_message', '')}")
+        return data
+
+    def find_place_id(self, query):
+        candidates = self._get(self.find_url, {
+            "input": query,
+            "inputtype": "textquery",
+            "fields": "place_id",
+        }, "find").get("candidates", [])
+        if not candidates:
+            return None
+        return candidates[0]["place_id"]
+
+    def place_details(self, place_id):
+        return self._get(self.details_url, {
+            "place_id": place_id,
+            "fields": DETAIL_FIELDS,
+        }, "details").get("result")
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_places_client():
+    """
+    Per-process shared client. A forked worker builds its own instance instead
+    of reusing sockets inherited from the parent.
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                _client = PlacesClient()
+                _client_pid = pid
+    return _client
+
+
+def reset_places_client():
+    global _client, _client_pid
+    with _client_lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client = None
+        _client_pid = None
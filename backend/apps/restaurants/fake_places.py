@@ -0,0 +1,136 @@
+"""
+Local stand-in for the Google Places find-place and details endpoints, used by
+the tests and benchmarks instead of the real API.
+
+    with FakePlacesServer() as server:
+        server.add_place("Test Resto", "Berlin", rating=4.5)
+        client = PlacesClient(find_url=server.find_url, details_url=server.details_url)
+"""
+import json
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        fake = self.server.fake
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        status, body = fake.handle(url.path, params)
+        payload = json.dumps(body).encode("utf-8")
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up (e.g. read timeout) before the answer was ready.
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakePlacesServer:
+    """
+    Serves ``/find`` and ``/details`` on an ephemeral localhost port.
+
+    ``add_place`` registers a restaurant, ``fail_next`` queues errors returned
+    before normal answers resume (an HTTP status, or an API status such as
+    ``"OVER_QUERY_LIMIT"`` sent with HTTP 200), and ``latency`` adds a fixed delay
+    per request. With ``auto_create=True`` every query resolves to a generated
+    place, which is handy for load tests.
+    """
+
+    def __init__(self, latency=0.0, auto_create=False):
+        self.latency = latency
+        self.auto_create = auto_create
+        self.places = {}
+        self.queries = {}
+        self.failures = deque()
+        self.requests = []
+        self._lock = threading.Lock()
+        self._httpd = None
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def find_url(self):
+        return f"{self.base_url}/find"
+
+    @property
+    def details_url(self):
+        return f"{self.base_url}/details"
+
+    def add_place(self, name, city, **details):
+        place_id = details.pop("place_id", f"fake-{len(self.places) + 1}")
+        self.places[place_id] = {
+            "place_id": place_id,
+            "name": name,
+            "formatted_address": details.pop("formatted_address", f"1 Main St, {city}"),
+            "types": details.pop("types", ["restaurant", "food"]),
+            **details,
+        }
+        self.queries[f"{name}, {city}".casefold()] = place_id
+        return place_id
+
+    def fail_next(self, *statuses):
+        self.failures.extend(statuses)
+
+    def handle(self, path, params):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.requests.append(path)
+            if self.failures:
+                failure = self.failures.popleft()
+                if isinstance(failure, str):
+                    return 200, {"status": failure, "error_message": "Simulated failure."}
+                return failure, {"status": "UNKNOWN_ERROR"}
+
+            if path == "/find":
+                query = params.get("input", "")
+                place_id = self.queries.get(query.casefold())
+                if place_id is None and self.auto_create:
+                    name, _, city = query.partition(", ")
+                    place_id = self.add_place(name, city)
+                candidates = [{"place_id": place_id}] if place_id else []
+                return 200, {"candidates": candidates, "status": "OK" if candidates else "ZERO_RESULTS"}
+
+            if path == "/details":
+                result = self.places.get(params.get("place_id"))
+                if result is None:
+                    return 200, {"status": "NOT_FOUND"}
+                return 200, {"result": result, "status": "OK"}
+
+        return 404, {"status": "NOT_FOUND"}
+
+    def start(self):
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.fake = self
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,276 @@
+"""
+Keeping ``UserRestaurantInteraction`` in step with edited and deleted receipts.
+
+A receipt counts towards the stats of its (user, restaurant) pair once
+enrichment has linked it (``Receipt.restaurant``). Edits and deletes of a
+linked receipt apply the difference to that pair with one ``UPDATE``; only
+``last_visited`` is re-read, from the receipts index. ``reconcile_interactions``
+recomputes the stats from linked receipts a chunk of users at a time and
+repairs pairs that drifted.
+
+Receipts from before the link existed may have been counted without being
+linked. Until ``backfill_receipt_restaurants`` has gone through them,
+reconciliation refuses to repair; users left with receipts it could not link
+are reported rather than repaired, as their stored stats cannot be checked.
+"""
+import logging
+from collections import defaultdict
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import Count, Max, Q, Sum
+
+from backend.apps.receipts.models import Receipt
+
+from .models import CityRestaurantPopularity, ReceiptEnrichment, Restaurant, UserRestaurantInteraction
+from .recommendation_cache import invalidate_recommendations
+from .services import increment_city_popularities, normalize_city
+
+logger = logging.getLogger(__name__)
+
+VISIT_FIELDS = ("user_id", "restaurant_id", "date", "price")
+
+# Unlinked receipts in these states may have had their visit counted.
+UNVERIFIABLE = Q(enrichment__isnull=True) | Q(
+    enrichment__status__in=[ReceiptEnrichment.Status.DONE, ReceiptEnrichment.Status.UNLINKED],
+)
+
+
+class BackfillPending(Exception):
+    """
+    Raised when interactions would be repaired before the receipt backfill has finished.
+    """
+
+
+def unbackfilled_receipts():
+    """
+    Unlinked receipts the backfill has yet to go through: ones enriched before
+    the link existed, which may have been counted.
+    """
+    return Receipt.objects.filter(
+        Q(enrichment__isnull=True) | Q(enrichment__status=ReceiptEnrichment.Status.DONE),
+        restaurant__isnull=True,
+    )
+
+
+def visit_values(values):
+    """
+    The visit a receipt counts as, from a dict of its field values, or
+    ``None`` while it is not linked to a restaurant.
+    """
+    if values is None or values.get("restaurant_id") is None:
+        return None
+    return {field: values[field] for field in VISIT_FIELDS}
+
+
+def record_visit_change(before, after):
+    """
+    Apply one receipt change to the interaction stats. ``before``/``after``
+    are ``visit_values`` dicts, or ``None`` when the receipt did not count.
+    """
+    if before == after:
+        return
+    deltas = defaultdict(lambda: [0, Decimal("0")])
+    dates = {}
+    if before is not None:
+        entry = deltas[(before["user_id"], before["restaurant_id"])]
+        entry[0] -= 1
+        entry[1] -= Decimal(before["price"])
+    if after is not None:
+        key = (after["user_id"], after["restaurant_id"])
+        deltas[key][0] += 1
+        deltas[key][1] += Decimal(after["price"])
+        dates[key] = after["date"]
+    apply_visit_deltas(deltas, dates)
+
+
+def apply_visit_deltas(deltas, dates=None):
+    """
+    Add ``{(user_id, restaurant_id): (visits, spend)}`` deltas to the
+    interactions, creating pairs that gain visits (``dates`` gives their
+    visit date) and dropping pairs left without any. ``last_visited`` is
+    re-read from the pair's linked receipts, so it follows edits and deletes.
+    """
+    rows = sorted(deltas.items())
+    if not rows:
+        return
+    dates = dates or {}
+    table = connection.ops.quote_name(UserRestaurantInteraction._meta.db_table)
+    receipts = connection.ops.quote_name(Receipt._meta.db_table)
+    added = [(key, dates[key]) for key, (visits, _) in rows if visits > 0 and key in dates]
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            if added:
+                cursor.execute(
+                    f"""
+                    INSERT INTO {table} (user_id, restaurant_id, visits, total_spend, average_spend, last_visited)
+                    VALUES {", ".join(["(%s, %s, 0, 0, NULL, %s)"] * len(added))}
+                    ON CONFLICT (user_id, restaurant_id) DO NOTHING
+                    """,
+                    [value for (user_id, restaurant_id), day in added for value in (user_id, restaurant_id, day)],
+                )
+            # GREATEST keeps drifted rows within the column constraints until
+            # reconciliation repairs them.
+            cursor.execute(
+                f"""
+                UPDATE {table} AS i SET
+                    visits = GREATEST(i.visits + d.visits, 0),
+                    total_spend = i.total_spend + d.spend,
+                    average_spend = CASE
+                        WHEN i.visits + d.visits > 0 THEN (i.total_spend + d.spend) / (i.visits + d.visits)
+                    END,
+                    last_visited = COALESCE(
+                        (SELECT MAX(r.date) FROM {receipts} r
+                         WHERE r.user_id = i.user_id AND r.restaurant_id = i.restaurant_id),
+                        i.last_visited
+                    )
+                FROM (VALUES {", ".join(["(%s::bigint, %s::bigint, %s::integer, %s::numeric)"] * len(rows))})
+                    AS d(user_id, restaurant_id, visits, spend)
+                WHERE i.user_id = d.user_id AND i.restaurant_id = d.restaurant_id
+                RETURNING i.id, i.visits
+                """,
+                [value for (user_id, restaurant_id), (visits, spend) in rows
+                 for value in (user_id, restaurant_id, visits, spend)],
+            )
+            emptied = [interaction_id for interaction_id, visits in cursor.fetchall() if visits <= 0]
+        if emptied:
+            UserRestaurantInteraction.objects.filter(id__in=emptied).delete()
+
+        cities = _apply_popularity_deltas({restaurant_id: visits for (_, restaurant_id), (visits, _) in rows})
+        invalidate_recommendations(cities=cities, user_ids={user_id for (user_id, _), _ in rows})
+
+
+def _apply_popularity_deltas(visits_by_restaurant):
+    """
+    Add visit deltas per restaurant id to the popularity table and drop rows
+    left without visits. Rows are keyed on the restaurant's current city, as
+    ``increment_city_popularities`` writes them. Returns the cities whose
+    ranking changed.
+    """
+    changed = {restaurant_id: visits for restaurant_id, visits in visits_by_restaurant.items() if visits}
+    if not changed:
+        return set()
+    restaurants = list(Restaurant.objects.filter(id__in=changed).only("id", "city"))
+    cities = set()
+
+    gained = [restaurant for restaurant in restaurants if changed[restaurant.id] > 0]
+    if gained:
+        increment_city_popularities((restaurant, changed[restaurant.id]) for restaurant in gained)
+        cities.update(restaurant.city for restaurant in gained)
+
+    lost = sorted(
+        (normalize_city(restaurant.city), restaurant.id, changed[restaurant.id])
+        for restaurant in restaurants if changed[restaurant.id] < 0
+    )
+    if lost:
+        table = connection.ops.quote_name(CityRestaurantPopularity._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                UPDATE {table} AS p SET total_visits = GREATEST(p.total_visits + d.visits, 0)
+                FROM (VALUES {", ".join(["(%s::text, %s::bigint, %s::integer)"] * len(lost))})
+                    AS d(city, restaurant_id, visits)
+                WHERE p.city = d.city AND p.restaurant_id = d.restaurant_id
+                RETURNING p.id, p.city, p.total_visits
+                """,
+                [value for row in lost for value in row],
+            )
+            updated = cursor.fetchall()
+        cities.update(city for _, city, _ in updated)
+        emptied = [row_id for row_id, _, total_visits in updated if total_visits <= 0]
+        if emptied:
+            CityRestaurantPopularity.objects.filter(id__in=emptied).delete()
+    return cities
+
+
+def compute_interactions(user_ids):
+    """
+    ``{(user_id, restaurant_id): (visits, total_spend, last_visited)}`` from
+    the linked receipts of ``user_ids``.
+    """
+    rows = (
+        Receipt.objects.filter(user_id__in=user_ids, restaurant__isnull=False)
+        .order_by()
+        .values("user_id", "restaurant_id")
+        .annotate(visits=Count("id"), total_spend=Sum("price"), last_visited=Max("date"))
+    )
+    return {
+        (row["user_id"], row["restaurant_id"]): (row["visits"], row["total_spend"], row["last_visited"])
+        for row in rows
+    }
+
+
+def reconcile_interactions(chunk_size=500, repair=True):
+    """
+    Compare every user's interactions with their linked receipts,
+    ``chunk_size`` users at a time, and with ``repair`` rewrite the pairs that
+    differ. Each chunk is checked and repaired in its own transaction with the
+    users' interaction rows locked.
+
+    Users with unlinked receipts whose visit may have been counted are
+    skipped. Returns ``(mismatches, unverified)``: ``(key, expected, stored)``
+    for every pair that differed, and the ids of the skipped users. Raises
+    ``BackfillPending`` instead of repairing while the backfill has receipts
+    left.
+    """
+    if repair and unbackfilled_receipts().exists():
+        raise BackfillPending("Receipts enriched before they were linked remain; run backfill_receipt_restaurants.")
+    User = get_user_model()
+    mismatches, unverified = [], []
+    last_id = 0
+    while True:
+        user_ids = list(User.objects.filter(id__gt=last_id).order_by("id").values_list("id", flat=True)[:chunk_size])
+        if not user_ids:
+            return mismatches, unverified
+        last_id = user_ids[-1]
+        with transaction.atomic():
+            skipped = set(
+                Receipt.objects.filter(UNVERIFIABLE, user_id__in=user_ids, restaurant__isnull=True)
+                .order_by().values_list("user_id", flat=True).distinct()
+            )
+            stored = {
+                (row.user_id, row.restaurant_id): (row.visits, row.total_spend, row.last_visited)
+                for row in UserRestaurantInteraction.objects.select_for_update()
+                .filter(user_id__in=user_ids).exclude(user_id__in=skipped).order_by("user_id", "restaurant_id")
+            }
+            expected = compute_interactions([user_id for user_id in user_ids if user_id not in skipped])
+            differing = [
+                (key, expected.get(key), stored.get(key))
+                for key in sorted(expected.keys() | stored.keys())
+                if expected.get(key) != stored.get(key)
+            ]
+            if repair and differing:
+                _repair(differing)
+        mismatches.extend(differing)
+        unverified.extend(sorted(skipped))
+
+
+def _repair(differing):
+    UserRestaurantInteraction.objects.bulk_create(
+        [
+            UserRestaurantInteraction(
+                user_id=user_id, restaurant_id=restaurant_id, visits=visits, total_spend=total_spend,
+                average_spend=total_spend / visits, last_visited=last_visited,
+            )
+            for (user_id, restaurant_id), expected, _ in differing if expected is not None
+            for visits, total_spend, last_visited in [expected]
+        ],
+        update_conflicts=True,
+        unique_fields=["user", "restaurant"],
+        update_fields=["visits", "total_spend", "average_spend", "last_visited"],
+    )
+    stale = Q()
+    for (user_id, restaurant_id), expected, _ in differing:
+        if expected is None:
+            stale |= Q(user_id=user_id, restaurant_id=restaurant_id)
+    if stale:
+        UserRestaurantInteraction.objects.filter(stale).delete()
+
+    visit_changes = defaultdict(int)
+    for (_, restaurant_id), expected, stored in differing:
+        visit_changes[restaurant_id] += (expected[0] if expected else 0) - (stored[0] if stored else 0)
+    cities = _apply_popularity_deltas(visit_changes)
+    invalidate_recommendations(cities=cities, user_ids={user_id for (user_id, _), _, _ in differing})
+    logger.info(f"Repaired {len(differing)} user-restaurant interactions")
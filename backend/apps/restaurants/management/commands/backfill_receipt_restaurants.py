@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from backend.apps.restaurants.backfill import ReceiptBackfill
+
+
+class Command(BaseCommand):
+    help = (
+        "Link receipts without a restaurant to one, resolving names locally first. "
+        "Commits per chunk; resume an interrupted run with --start-after."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Receipts resolved and committed per chunk.",
+        )
+        parser.add_argument(
+            "--start-after",
+            type=int,
+            default=0,
+            help="Skip receipts up to and including this id.",
+        )
+        parser.add_argument(
+            "--remote",
+            action="store_true",
+            help="Look receipts that cannot be resolved locally up on Google Places.",
+        )
+
+    def handle(self, *args, **options):
+        backfill = ReceiptBackfill(
+            chunk_size=options["chunk_size"], start_after=options["start_after"], remote=options["remote"],
+        )
+        scanned = linked = 0
+        for chunk_scanned, chunk_linked in backfill.chunks():
+            scanned += chunk_scanned
+            linked += chunk_linked
+            self.stdout.write(f"Linked {chunk_linked} of {chunk_scanned} receipts (up to id {backfill.last_id})")
+        self.stdout.write(self.style.SUCCESS(f"Linked {linked} of {scanned} receipts to restaurants."))
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+
+from backend.apps.restaurants.matching import find_duplicate_groups, merge_restaurants, pick_canonical
+from backend.apps.restaurants.models import Restaurant
+
+
+class Command(BaseCommand):
+    help = (
+        "Merge restaurants in the same city whose normalized names match, moving "
+        "their user interactions and popularity onto one row."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=None,
+            help="Minimum name similarity (0-1) to treat two restaurants as the same. "
+                 "Defaults to RESTAURANT_MATCH_THRESHOLD; above 1 only merges identical names.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only list the groups that would be merged.",
+        )
+
+    def handle(self, *args, **options):
+        groups = find_duplicate_groups(threshold=options["threshold"])
+        merged = 0
+        for ids in groups:
+            restaurants = list(Restaurant.objects.filter(id__in=ids))
+            canonical = pick_canonical(restaurants)
+            duplicates = [restaurant for restaurant in restaurants if restaurant.id != canonical.id]
+            self.stdout.write(
+                f"{canonical.city}: keep {canonical.id} {canonical.name!r}, merge "
+                + ", ".join(f"{restaurant.id} {restaurant.name!r}" for restaurant in duplicates)
+            )
+            if not options["dry_run"]:
+                merge_restaurants(canonical, duplicates)
+                merged += len(duplicates)
+
+        if options["dry_run"]:
+            self.stdout.write(self.style.SUCCESS(f"Found {len(groups)} groups of duplicate restaurants."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Merged {merged} duplicate restaurants into {len(groups)}."))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from backend.apps.restaurants.models import PlaceLookup
+from backend.apps.restaurants.places_cache import get_lookup_stats, reset_lookup_stats
+
+
+class Command(BaseCommand):
+    help = "Show hit/miss counters for the Google Places lookup cache."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--reset",
+            action="store_true",
+            help="Reset the counters after printing them.",
+        )
+
+    def handle(self, *args, **options):
+        stats = get_lookup_stats()
+        self.stdout.write(f"Cache hits:      {stats['hits']}")
+        self.stdout.write(f"Database hits:   {stats['db_hits']}")
+        self.stdout.write(f"Coalesced:       {stats['coalesced']}")
+        self.stdout.write(f"Misses (Google): {stats['misses']}")
+        self.stdout.write(f"Hit ratio:       {stats['hit_ratio']:.1%}")
+        self.stdout.write(f"Stored lookups:  {PlaceLookup.objects.count()} "
+                          f"({PlaceLookup.objects.filter(data__isnull=True).count()} negative)")
+        if options["reset"]:
+            reset_lookup_stats()
+            self.stdout.write(self.style.SUCCESS("Counters reset."))
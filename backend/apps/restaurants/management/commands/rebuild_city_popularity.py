@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from backend.apps.restaurants.services import rebuild_city_popularity
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-city restaurant popularity table from user interactions."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of rows per bulk insert.",
+        )
+
+    def handle(self, *args, **options):
+        rows = rebuild_city_popularity(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt city popularity table with {rows} rows."))
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.apps.restaurants.interactions import BackfillPending, reconcile_interactions
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare user-restaurant interaction stats with the receipts linked to each restaurant "
+        "and repair pairs that differ."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only report pairs that differ from the receipts.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=500,
+            help="Users compared and repaired per transaction.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            mismatches, unverified = reconcile_interactions(
+                chunk_size=options["chunk_size"], repair=not options["check"],
+            )
+        except BackfillPending as exc:
+            raise CommandError(str(exc))
+        for (user_id, restaurant_id), expected, stored in mismatches:
+            self.stdout.write(f"user={user_id} restaurant={restaurant_id}: expected {expected}, stored {stored}")
+        if unverified:
+            self.stdout.write(self.style.WARNING(
+                f"Skipped {len(unverified)} users with receipts that could not be linked: "
+                f"{', '.join(map(str, unverified))}"
+            ))
+        if options["check"]:
+            if mismatches:
+                raise CommandError(f"{len(mismatches)} interactions differ from the receipts.")
+            self.stdout.write(self.style.SUCCESS("Interactions match the receipts."))
+            return
+        self.stdout.write(self.style.SUCCESS(f"Repaired {len(mismatches)} interactions."))
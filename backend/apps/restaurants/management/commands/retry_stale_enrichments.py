@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from backend.apps.restaurants.tasks import retry_stale_enrichments
+
+
+class Command(BaseCommand):
+    help = (
+        "Queue receipts whose restaurant enrichment is still pending or failed again, "
+        "backing off with every attempt."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=1000,
+            help="Most receipts queued in one run, oldest first.",
+        )
+
+    def handle(self, *args, **options):
+        queued = retry_stale_enrichments(limit=options["limit"])
+        self.stdout.write(self.style.SUCCESS(f"Queued {queued} receipts for enrichment."))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from backend.apps.restaurants.recommender import train_recommender
+
+
+class Command(BaseCommand):
+    help = "Train the item-item recommender from user interactions and store each restaurant's neighbours."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--neighbors",
+            type=int,
+            default=None,
+            help="Neighbours kept per restaurant (default: RECOMMENDER_NEIGHBORS).",
+        )
+        parser.add_argument(
+            "--block-size",
+            type=int,
+            default=256,
+            help="Restaurants whose similarities are computed at once; lower it to use less memory.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=5000,
+            help="Number of rows per bulk insert.",
+        )
+
+    def handle(self, *args, **options):
+        rows = train_recommender(
+            neighbors=options["neighbors"], block_size=options["block_size"], batch_size=options["batch_size"],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Stored {rows} restaurant neighbours."))
@@ -0,0 +1,326 @@
+"""
+Matching receipt restaurant names to existing ``Restaurant`` rows.
+
+Names are reduced to a key (unaccented, casefolded, legal-form suffixes and
+punctuation/whitespace removed), so "Pizza Hut", "PIZZA HUT GmbH" and
+"Pizzahut" all share ``pizzahut``. Near misses are found by trigram
+similarity: in PostgreSQL with ``pg_trgm``'s indexed ``%`` operator when it
+is installed, otherwise by the same measure computed in Python. Trigrams only
+shortlist candidates; a candidate is accepted if its key is a single typo
+away with the same numbers (``is_name_variant``), so "Restaurant Italia" and
+"Restaurant Italiano" or "Asia Wok" and "Asia Wok 2" stay apart. Restaurants
+with different Google places are never treated as the same.
+"""
+import logging
+import re
+import unicodedata
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Max, Sum
+
+from backend.apps.receipts.models import Receipt
+
+from .models import CityRestaurantPopularity, ReceiptEnrichment, Restaurant, UserRestaurantInteraction
+
+logger = logging.getLogger(__name__)
+
+# Legal forms and filler words dropped from the end of names.
+LEGAL_SUFFIXES = {
+    "gmbh", "mbh", "ug", "haftungsbeschrankt", "ag", "kg", "kgaa", "ohg", "gbr", "ek", "ev", "se",
+    "co", "cokg", "gmbhcokg", "ltd", "limited", "llc", "inc", "corp", "plc",
+    "sarl", "sas", "sa", "srl", "spa", "bv", "nv", "oy", "ab",
+}
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+_NUMBERS = re.compile(r"[0-9]+")
+
+
+def _unaccent(text):
+    text = unicodedata.normalize("NFKD", text)
+    return "".join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def normalize_restaurant_name(name):
+    """
+    Matching key for a restaurant name: "Café Müller GmbH & Co. KG" -> "cafemuller".
+    """
+    words = _NON_ALNUM.split(_unaccent((name or "").casefold().replace("ß", "ss")))
+    words = [word for word in words if word]
+    while len(words) > 1 and words[-1] in LEGAL_SUFFIXES:
+        words.pop()
+    # "& Co." leaves a dangling "und"/"and" behind.
+    while len(words) > 1 and words[-1] in ("und", "and"):
+        words.pop()
+    return "".join(words)
+
+
+def trigrams(text):
+    """
+    Trigram set of ``text`` as pg_trgm builds it: per alphanumeric word,
+    padded with two leading blanks and one trailing blank.
+    """
+    grams = set()
+    for word in re.findall(r"[^\W_]+", text.casefold()):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def similarity(a, b):
+    """
+    pg_trgm ``similarity()``: shared trigrams over all trigrams.
+    """
+    grams_a, grams_b = trigrams(a), trigrams(b)
+    if not grams_a or not grams_b:
+        return 0.0
+    return len(grams_a & grams_b) / len(grams_a | grams_b)
+
+
+def is_name_variant(key_a, key_b):
+    """
+    Whether two name keys are the same name up to one typo: one character
+    inserted, dropped, replaced or two neighbours swapped, with the numbers
+    in both unchanged ("pizzahut"/"pizzahutt", but not "asiawok"/"asiawok2").
+    """
+    if key_a == key_b:
+        return True
+    if _NUMBERS.findall(key_a) != _NUMBERS.findall(key_b) or abs(len(key_a) - len(key_b)) > 1:
+        return False
+    # Strip the common prefix and suffix; one typo leaves at most two characters.
+    start = 0
+    while start < min(len(key_a), len(key_b)) and key_a[start] == key_b[start]:
+        start += 1
+    end_a, end_b = len(key_a), len(key_b)
+    while end_a > start and end_b > start and key_a[end_a - 1] == key_b[end_b - 1]:
+        end_a, end_b = end_a - 1, end_b - 1
+    rest_a, rest_b = key_a[start:end_a], key_b[start:end_b]
+    if len(rest_a) <= 1 and len(rest_b) <= 1:
+        return True
+    return len(rest_a) == len(rest_b) == 2 and rest_a == rest_b[::-1]
+
+
+_trigram_support = {}
+
+
+def has_pg_trgm():
+    """
+    Whether the default database can run trigram queries. Checked once per
+    database alias.
+    """
+    alias = connection.alias
+    if alias not in _trigram_support:
+        supported = False
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+                supported = cursor.fetchone() is not None
+        _trigram_support[alias] = supported
+    return _trigram_support[alias]
+
+
+def find_matching_restaurant(name, city, threshold=None):
+    """
+    Existing restaurant in ``city`` whose name matches ``name``: same name key
+    first, then the most similar key at or above ``threshold`` (defaults to
+    ``RESTAURANT_MATCH_THRESHOLD``). Returns ``None`` if nothing matches.
+    """
+    key = normalize_restaurant_name(name)
+    if not key:
+        return None
+    threshold = settings.RESTAURANT_MATCH_THRESHOLD if threshold is None else threshold
+    in_city = Restaurant.objects.filter(city__iexact=city)
+
+    restaurant = in_city.filter(name_key=key).order_by("id").first()
+    if restaurant is not None or threshold > 1:
+        return restaurant
+
+    if has_pg_trgm():
+        from django.contrib.postgres.lookups import TrigramSimilar
+        from django.contrib.postgres.search import TrigramSimilarity
+
+        with transaction.atomic():
+            _set_similarity_threshold(threshold)
+            # ``%`` filters through the trigram index; the similarity itself
+            # is only computed to order the few candidates it returns.
+            candidates = list(
+                in_city.filter(TrigramSimilar(F("name_key"), key))
+                .annotate(similarity=TrigramSimilarity("name_key", key))
+                .order_by("-similarity", "id")
+            )
+        return next((candidate for candidate in candidates if is_name_variant(key, candidate.name_key)), None)
+
+    best_id, best_score = None, threshold
+    for restaurant_id, candidate in in_city.order_by("id").values_list("id", "name_key").iterator():
+        if not is_name_variant(key, candidate):
+            continue
+        score = similarity(key, candidate)
+        if score > best_score or (best_id is None and score >= best_score):
+            best_id, best_score = restaurant_id, score
+    return in_city.filter(id=best_id).first() if best_id is not None else None
+
+
+def _set_similarity_threshold(threshold):
+    """
+    Threshold of pg_trgm's ``%`` operator for the current transaction.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT set_config('pg_trgm.similarity_threshold', %s, true)", [str(threshold)])
+
+
+def find_duplicate_groups(threshold=None):
+    """
+    Groups of restaurant ids (two or more) in the same city that are the same
+    restaurant: equal name keys, or keys at least ``threshold`` similar that
+    are a single typo apart. Each group is one canonical restaurant (see
+    ``pick_canonical``) and the rows that match it directly; matches are not
+    chained, and a group never holds two different Google places.
+    """
+    threshold = settings.RESTAURANT_MATCH_THRESHOLD if threshold is None else threshold
+    pairs = _similar_pairs(threshold) if has_pg_trgm() else _similar_pairs_in_python(threshold)
+    partners = defaultdict(set)
+    for id_a, key_a, id_b, key_b in pairs:
+        if is_name_variant(key_a, key_b):
+            partners[id_a].add(id_b)
+            partners[id_b].add(id_a)
+
+    restaurants = Restaurant.objects.filter(id__in=list(partners)).only("id", "place_id", "user_ratings_total")
+    groups, grouped = [], set()
+    for canonical in sorted(restaurants, key=_canonical_order):
+        if canonical.id in grouped:
+            continue
+        group = [canonical.id] + [
+            restaurant_id for restaurant_id in partners[canonical.id] if restaurant_id not in grouped
+        ]
+        if len(group) > 1:
+            grouped.update(group)
+            groups.append(sorted(group))
+    return sorted(groups)
+
+
+def _similar_pairs(threshold):
+    """
+    ``(id, name key, id, name key)`` of restaurants in the same city with equal
+    or similar name keys and at most one Google place between them, from a
+    self-join: each restaurant looks up its partners through the city/name-key
+    index and the trigram index.
+    """
+    table = connection.ops.quote_name(Restaurant._meta.db_table)
+    same_place = "(a.place_id IS NULL OR b.place_id IS NULL)"
+    sql = f"""
+        SELECT a.id, a.name_key, b.id, b.name_key FROM {table} a
+        JOIN {table} b ON UPPER(b.city) = UPPER(a.city) AND b.name_key = a.name_key AND b.id > a.id
+        WHERE {same_place}
+    """
+    if threshold <= 1:
+        sql += f"""
+            UNION
+            SELECT a.id, a.name_key, b.id, b.name_key FROM {table} a
+            JOIN {table} b ON b.name_key %% a.name_key AND UPPER(b.city) = UPPER(a.city) AND b.id > a.id
+            WHERE {same_place}
+        """
+    with transaction.atomic():
+        _set_similarity_threshold(threshold)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [])
+            return cursor.fetchall()
+
+
+def _similar_pairs_in_python(threshold):
+    """
+    ``_similar_pairs`` without pg_trgm: every pair within each city compared
+    in Python.
+    """
+    by_city = defaultdict(list)
+    rows = Restaurant.objects.order_by("id").values_list("id", "city", "name_key", "place_id").iterator()
+    for restaurant_id, city, key, place_id in rows:
+        by_city[city.upper()].append((restaurant_id, key, place_id))
+
+    for restaurants in by_city.values():
+        for i, (id_a, key_a, place_a) in enumerate(restaurants):
+            for id_b, key_b, place_b in restaurants[i + 1:]:
+                if place_a is not None and place_b is not None:
+                    continue
+                if key_a == key_b or (threshold <= 1 and similarity(key_a, key_b) >= threshold):
+                    yield id_a, key_a, id_b, key_b
+
+
+def _canonical_order(restaurant):
+    return restaurant.place_id is None, -(restaurant.user_ratings_total or 0), restaurant.id
+
+
+def pick_canonical(restaurants):
+    """
+    The row to keep: one with a Google place, then the most rated, then the
+    oldest.
+    """
+    return min(restaurants, key=_canonical_order)
+
+
+def merge_restaurants(canonical, duplicates):
+    """
+    Fold ``duplicates`` into ``canonical``: interactions and popularity rows
+    are re-pointed or summed into the canonical ones, linked receipts are
+    re-pointed, then the duplicates are deleted. Raises ``ValueError`` if
+    they belong to more than one Google place.
+    """
+    duplicate_ids = [restaurant.id for restaurant in duplicates if restaurant.id != canonical.id]
+    if not duplicate_ids:
+        return
+    place_ids = {restaurant.place_id for restaurant in [canonical, *duplicates]} - {None}
+    if len(place_ids) > 1:
+        raise ValueError(f"Restaurants {[canonical.id, *duplicate_ids]} are different places: {sorted(place_ids)}")
+    with transaction.atomic():
+        _merge_interactions(canonical, duplicate_ids)
+        _merge_popularity(canonical, duplicate_ids)
+        Receipt.objects.filter(restaurant_id__in=duplicate_ids).update(restaurant=canonical)
+        ReceiptEnrichment.objects.filter(restaurant_id__in=duplicate_ids).update(restaurant=canonical)
+        Restaurant.objects.filter(id__in=duplicate_ids).delete()
+    logger.info(f"Merged restaurants {duplicate_ids} into {canonical.id}")
+
+
+def _merge_interactions(canonical, duplicate_ids):
+    moved = UserRestaurantInteraction.objects.filter(restaurant_id__in=duplicate_ids)
+    totals = moved.order_by().values("user_id").annotate(
+        visits=Sum("visits"), total_spend=Sum("total_spend"), last_visited=Max("last_visited"),
+    )
+    existing = {
+        interaction.user_id: interaction
+        for interaction in UserRestaurantInteraction.objects.select_for_update().filter(
+            restaurant=canonical, user_id__in=moved.values("user_id"),
+        )
+    }
+    to_create = []
+    for row in totals:
+        interaction = existing.get(row["user_id"])
+        if interaction is None:
+            interaction = UserRestaurantInteraction(
+                user_id=row["user_id"], restaurant=canonical, visits=0, total_spend=0,
+                last_visited=row["last_visited"],
+            )
+            to_create.append(interaction)
+        interaction.visits += row["visits"]
+        interaction.total_spend += row["total_spend"]
+        interaction.last_visited = max(interaction.last_visited, row["last_visited"])
+        interaction.average_spend = interaction.total_spend / interaction.visits if interaction.visits else None
+
+    moved.delete()
+    if existing:
+        UserRestaurantInteraction.objects.bulk_update(
+            existing.values(), ["visits", "total_spend", "last_visited", "average_spend"],
+        )
+    UserRestaurantInteraction.objects.bulk_create(to_create)
+
+
+def _merge_popularity(canonical, duplicate_ids):
+    moved = CityRestaurantPopularity.objects.filter(restaurant_id__in=duplicate_ids)
+    totals = list(moved.order_by().values("city").annotate(visits=Sum("total_visits")))
+    moved.delete()
+    for row in totals:
+        updated = CityRestaurantPopularity.objects.filter(restaurant=canonical, city=row["city"]).update(
+            total_visits=F("total_visits") + row["visits"],
+        )
+        if not updated:
+            CityRestaurantPopularity.objects.create(
+                restaurant=canonical, city=row["city"], total_visits=row["visits"],
+            )
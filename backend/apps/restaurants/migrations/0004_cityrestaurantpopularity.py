@@ -0,0 +1,54 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def populate_city_popularity(apps, schema_editor):
+    UserRestaurantInteraction = apps.get_model('restaurants', 'UserRestaurantInteraction')
+    CityRestaurantPopularity = apps.get_model('restaurants', 'CityRestaurantPopularity')
+    totals = (
+        UserRestaurantInteraction.objects
+        .values('restaurant_id', 'restaurant__city')
+        .annotate(total_visits=Sum('visits'))
+        .order_by()
+    )
+    CityRestaurantPopularity.objects.bulk_create(
+        [
+            CityRestaurantPopularity(
+                city=" ".join(entry['restaurant__city'].split()).casefold(),
+                restaurant_id=entry['restaurant_id'],
+                total_visits=entry['total_visits'],
+            )
+            for entry in totals
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurants', '0003_alter_restaurant_place_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CityRestaurantPopularity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('city', models.CharField(max_length=100)),
+                ('total_visits', models.PositiveIntegerField(default=0)),
+                ('restaurant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='popularity', to='restaurants.restaurant')),
+            ],
+            options={
+                'verbose_name': 'City restaurant popularity',
+                'verbose_name_plural': 'City restaurant popularity',
+                'ordering': ['-total_visits'],
+                'indexes': [models.Index(fields=['city', '-total_visits'], name='popularity_city_visits_idx')],
+                'unique_together': {('city', 'restaurant')},
+            },
+        ),
+        migrations.RunPython(populate_city_popularity, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurants', '0004_cityrestaurantpopularity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlaceLookup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('name', models.CharField(max_length=255)),
+                ('city', models.CharField(max_length=100)),
+                ('data', models.JSONField(blank=True, null=True)),
+                ('fetched_at', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Place lookup',
+                'verbose_name_plural': 'Place lookups',
+            },
+        ),
+    ]
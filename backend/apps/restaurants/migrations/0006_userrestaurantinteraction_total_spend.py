@@ -0,0 +1,22 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurants', '0005_placelookup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userrestaurantinteraction',
+            name='total_spend',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.RunSQL(
+            "UPDATE restaurants_userrestaurantinteraction SET total_spend = COALESCE(average_spend, 0) * visits",
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:30
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurants', '0006_userrestaurantinteraction_total_spend'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='restaurant',
+            index=models.Index(django.db.models.functions.text.Upper('city'), django.db.models.functions.text.Upper('name'), name='restaurant_upper_city_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='restaurant',
+            index=models.Index(django.db.models.functions.text.Upper('city'), models.OrderBy(models.F('rating'), descending=True), name='restaurant_upper_city_idx'),
+        ),
+    ]
@@ -0,0 +1,83 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:50
+
+import re
+import unicodedata
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+# Frozen copy of matching.normalize_restaurant_name as of this migration, so
+# later changes to the live normalizer do not change what it writes.
+LEGAL_SUFFIXES = {
+    "gmbh", "mbh", "ug", "haftungsbeschrankt", "ag", "kg", "kgaa", "ohg", "gbr", "ek", "ev", "se",
+    "co", "cokg", "gmbhcokg", "ltd", "limited", "llc", "inc", "corp", "plc",
+    "sarl", "sas", "sa", "srl", "spa", "bv", "nv", "oy", "ab",
+}
+NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+
+def normalize_restaurant_name(name):
+    text = unicodedata.normalize("NFKD", (name or "").casefold().replace("ß", "ss"))
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    words = [word for word in NON_ALNUM.split(text) if word]
+    while len(words) > 1 and words[-1] in LEGAL_SUFFIXES:
+        words.pop()
+    while len(words) > 1 and words[-1] in ("und", "and"):
+        words.pop()
+    return "".join(words)
+
+
+def populate_name_keys(apps, schema_editor):
+    Restaurant = apps.get_model('restaurants', 'Restaurant')
+    batch = []
+    for restaurant in Restaurant.objects.only('id', 'name').iterator(chunk_size=2000):
+        restaurant.name_key = normalize_restaurant_name(restaurant.name)
+        batch.append(restaurant)
+        if len(batch) >= 1000:
+            Restaurant.objects.bulk_update(batch, ['name_key'])
+            batch = []
+    Restaurant.objects.bulk_update(batch, ['name_key'])
+
+
+def create_trigram_index(apps, schema_editor):
+    """
+    Trigram index for fuzzy name matching, only where pg_trgm can be
+    installed; without it the matcher falls back to Python.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS restaurant_name_key_trgm_idx "
+        "ON restaurants_restaurant USING gin (name_key gin_trgm_ops)"
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS restaurant_name_key_trgm_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurants', '0007_restaurant_functional_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='restaurant',
+            name='name_key',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='restaurant',
+            index=models.Index(django.db.models.functions.text.Upper('city'), models.F('name_key'), name='restaurant_city_name_key_idx'),
+        ),
+        migrations.RunPython(populate_name_keys, migrations.RunPython.noop),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
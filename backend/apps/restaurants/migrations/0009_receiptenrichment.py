@@ -0,0 +1,31 @@
+# Generated by Django 5.2.4 on 2026-10-18 07:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('receipts', '0005_receipt_image_variants'),
+        ('restaurants', '0008_restaurant_name_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReceiptEnrichment',
+            fields=[
+                ('receipt', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='enrichment', serialize=False, to='receipts.receipt')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('error', models.CharField(blank=True, max_length=255)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('restaurant', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='receipt_enrichments', to='restaurants.restaurant')),
+            ],
+            options={
+                'verbose_name': 'Receipt enrichment',
+                'verbose_name_plural': 'Receipt enrichments',
+                'indexes': [models.Index(fields=['status', 'updated_at'], name='enrichment_status_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.4 on 2026-10-18 07:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurants', '0009_receiptenrichment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RestaurantNeighbor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('city', models.CharField(max_length=100)),
+                ('score', models.FloatField()),
+                ('neighbor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='restaurants.restaurant')),
+                ('restaurant', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='neighbors', to='restaurants.restaurant')),
+            ],
+            options={
+                'verbose_name': 'Restaurant neighbor',
+                'verbose_name_plural': 'Restaurant neighbors',
+                'indexes': [models.Index(fields=['city'], name='neighbor_city_idx')],
+                'unique_together': {('restaurant', 'neighbor')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 07:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurants', '0010_restaurantneighbor'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='receiptenrichment',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('done', 'Done'), ('failed', 'Failed'), ('unlinked', 'Unlinked')], default='pending', max_length=10),
+        ),
+    ]
@@ -1,9 +1,13 @@
 from django.db import models
+from django.db.models import F
+from django.db.models.functions import Upper
 from django.conf import settings
 
 class Restaurant(models.Model):
     place_id = models.CharField(max_length=255, unique=True, null=True, blank=True)
     name = models.CharField(max_length=255)
+    # normalize_restaurant_name(name), kept in sync by save().
+    name_key = models.CharField(max_length=255, blank=True, default="")
     address = models.TextField()
     city = models.CharField(max_length=100)
     
@@ -15,8 +19,24 @@ class Restaurant(models.Model):
     def __str__(self):
         return f"{self.name} ({', '.join(self.cuisine)})" if self.cuisine else self.name
 
+    def save(self, *args, **kwargs):
+        from .matching import normalize_restaurant_name
+
+        self.name_key = normalize_restaurant_name(self.name)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "name" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "name_key"}
+        super().save(*args, **kwargs)
+
     class Meta:
         ordering = ['-rating']
+        indexes = [
+            # name__iexact / city__iexact compile to UPPER(...) = UPPER(...),
+            # which only functional indexes can serve.
+            models.Index(Upper('city'), Upper('name'), name='restaurant_upper_city_name_idx'),
+            models.Index(Upper('city'), F('rating').desc(), name='restaurant_upper_city_idx'),
+            models.Index(Upper('city'), 'name_key', name='restaurant_city_name_key_idx'),
+        ]
         verbose_name = "Restaurant"
         verbose_name_plural = "Restaurants"
 
@@ -26,8 +46,117 @@ class UserRestaurantInteraction(models.Model):
     
     visits = models.PositiveIntegerField(default=1)
     last_visited = models.DateField()
+    # Running sum kept by the database; average_spend is derived from it.
+    total_spend = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     average_spend = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
 
     class Meta:
         unique_together = ("user", "restaurant")
-        ordering = ['-last_visited']
\ No newline at end of file
+        ordering = ['-last_visited']
+
+
+class CityRestaurantPopularity(models.Model):
+    """
+    Precomputed per-city visit totals used to rank recommendations.
+
+    Rows are maintained incrementally by ``update_user_interaction`` and can be
+    rebuilt from scratch with ``manage.py rebuild_city_popularity``.
+    """
+    city = models.CharField(max_length=100)
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name="popularity")
+    total_visits = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ("city", "restaurant")
+        ordering = ['-total_visits']
+        indexes = [
+            models.Index(fields=["city", "-total_visits"], name="popularity_city_visits_idx"),
+        ]
+        verbose_name = "City restaurant popularity"
+        verbose_name_plural = "City restaurant popularity"
+
+    def __str__(self):
+        return f"{self.restaurant_id} in {self.city}: {self.total_visits}"
+
+
+class RestaurantNeighbor(models.Model):
+    """
+    One of the most similar restaurants to ``restaurant`` in the same
+    (normalized) city, as scored by the offline recommender.
+
+    Rows are rebuilt per city by ``manage.py train_recommender``; see
+    ``recommender.py``.
+    """
+    city = models.CharField(max_length=100)
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name="neighbors", db_index=False)
+    neighbor = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name="+")
+    score = models.FloatField()
+
+    class Meta:
+        # Recommendations join the user's restaurants to their neighbours
+        # through the unique index.
+        unique_together = ("restaurant", "neighbor")
+        indexes = [
+            models.Index(fields=["city"], name="neighbor_city_idx"),
+        ]
+        verbose_name = "Restaurant neighbor"
+        verbose_name_plural = "Restaurant neighbors"
+
+    def __str__(self):
+        return f"{self.restaurant_id} ~ {self.neighbor_id}: {self.score:.3f}"
+
+
+class PlaceLookup(models.Model):
+    """
+    Persistent store behind the Google Places lookup cache, so warm results
+    survive cache flushes and restarts. ``data`` is null for lookups that
+    found no place (negative entries).
+    """
+    key = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=255)
+    city = models.CharField(max_length=100)
+    data = models.JSONField(null=True, blank=True)
+    fetched_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name = "Place lookup"
+        verbose_name_plural = "Place lookups"
+
+    def __str__(self):
+        return f"{self.name}, {self.city}"
+
+
+class ReceiptEnrichment(models.Model):
+    """
+    Enrichment state of one receipt. The receipt's visit is recorded in the
+    same transaction that marks it ``done``, so replayed or redelivered tasks
+    skip it instead of counting it again. ``unlinked`` marks receipts from
+    before this state was kept that the backfill could not link, so whether
+    their visit was counted is unknown.
+    """
+    class Status(models.TextChoices):
+        PENDING = "pending", "Pending"
+        DONE = "done", "Done"
+        FAILED = "failed", "Failed"
+        UNLINKED = "unlinked", "Unlinked"
+
+    receipt = models.OneToOneField(
+        "receipts.Receipt", on_delete=models.CASCADE, primary_key=True, related_name="enrichment",
+    )
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    restaurant = models.ForeignKey(
+        Restaurant, on_delete=models.SET_NULL, null=True, blank=True, related_name="receipt_enrichments",
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.CharField(max_length=255, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "updated_at"], name="enrichment_status_idx"),
+        ]
+        verbose_name = "Receipt enrichment"
+        verbose_name_plural = "Receipt enrichments"
+
+    def __str__(self):
+        return f"Receipt {self.receipt_id}: {self.status}"
@@ -0,0 +1,152 @@
+import hashlib
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from .models import PlaceLookup
+from .services import fetch_restaurant_details_from_google, normalize_city
+
+logger = logging.getLogger(__name__)
+
+CACHE_PREFIX = "places:lookup"
+STATS_PREFIX = "places:stats"
+LOCK_PREFIX = "places:lock"
+STATS_COUNTERS = ("hits", "db_hits", "coalesced", "misses")
+
+
+def normalize_name(name):
+    return " ".join((name or "").split()).casefold()
+
+
+def lookup_key(name, city):
+    """
+    Stable key for a (name, city) lookup, insensitive to case and spacing.
+    """
+    raw = f"{normalize_name(name)}|{normalize_city(city)}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _cache():
+    return caches[settings.PLACES_CACHE_ALIAS]
+
+
+def _ttl(data):
+    return settings.PLACES_CACHE_TTL if data is not None else settings.PLACES_NEGATIVE_CACHE_TTL
+
+
+def _count(counter):
+    cache = _cache()
+    key = f"{STATS_PREFIX}:{counter}"
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Evicted between add() and incr(); losing one tick is fine.
+        pass
+
+
+def get_lookup_stats():
+    """
+    Hit/miss counters for the lookup cache. ``hits`` were served by the cache
+    backend, ``db_hits`` by the persistent table, ``coalesced`` waited for
+    another worker's request and ``misses`` went to Google.
+    """
+    values = _cache().get_many([f"{STATS_PREFIX}:{counter}" for counter in STATS_COUNTERS])
+    stats = {counter: values.get(f"{STATS_PREFIX}:{counter}", 0) for counter in STATS_COUNTERS}
+    total = sum(stats.values())
+    stats["hit_ratio"] = (total - stats["misses"]) / total if total else 0.0
+    return stats
+
+
+def reset_lookup_stats():
+    _cache().delete_many([f"{STATS_PREFIX}:{counter}" for counter in STATS_COUNTERS])
+
+
+def lookup_restaurant_details(name, city):
+    """
+    Cached front for ``fetch_restaurant_details_from_google``.
+
+    Looks in the cache backend first, then in the ``PlaceLookup`` table, and
+    only calls Google when both are cold or expired. Lookups that return no
+    place are cached too, for the shorter negative TTL.
+    """
+    key = lookup_key(name, city)
+    cache_key = f"{CACHE_PREFIX}:{key}"
+    cache = _cache()
+
+    entry = cache.get(cache_key)
+    if entry is not None:
+        _count("hits")
+        return entry["data"]
+
+    stored = PlaceLookup.objects.filter(key=key).first()
+    if stored:
+        remaining = stored.fetched_at + timedelta(seconds=_ttl(stored.data)) - timezone.now()
+        if remaining.total_seconds() > 0:
+            _count("db_hits")
+            cache.set(cache_key, {"data": stored.data}, int(remaining.total_seconds()) or 1)
+            return stored.data
+
+    return _fetch_once(name, city, key, cache_key)
+
+
+def _fetch_once(name, city, key, cache_key):
+    """
+    Fetch from Google with at most one request per key in flight across all
+    workers: the first caller takes a lock in the cache, concurrent callers
+    wait for its result. Waiters give up after ``PLACES_LOOKUP_LOCK_TIMEOUT``
+    seconds, when the lock expires anyway, and fetch themselves.
+    """
+    cache = _cache()
+    lock_key = f"{LOCK_PREFIX}:{key}"
+    timeout = settings.PLACES_LOOKUP_LOCK_TIMEOUT
+    deadline = time.monotonic() + timeout
+    delay = 0.05
+    locked = cache.add(lock_key, 1, timeout)
+    while not locked:
+        entry = cache.get(cache_key)
+        if entry is not None:
+            _count("coalesced")
+            return entry["data"]
+        if time.monotonic() >= deadline:
+            logger.warning(f"Gave up waiting for the Places lookup of '{name}' in '{city}'")
+            break
+        time.sleep(delay)
+        delay = min(delay * 2, 0.5)
+        # The holder may have failed and released the lock without a result.
+        locked = cache.add(lock_key, 1, timeout)
+
+    try:
+        if locked:
+            # Another worker may have stored the result before we took the lock.
+            entry = cache.get(cache_key)
+            if entry is not None:
+                _count("coalesced")
+                return entry["data"]
+        _count("misses")
+        data = fetch_restaurant_details_from_google(name, city)
+        PlaceLookup.objects.update_or_create(
+            key=key,
+            defaults={
+                "name": name,
+                "city": city,
+                "data": data,
+                "fetched_at": timezone.now(),
+            },
+        )
+        cache.set(cache_key, {"data": data}, _ttl(data))
+        logger.info(f"Places lookup miss for '{name}' in '{city}' ({'found' if data else 'not found'})")
+        return data
+    finally:
+        if locked:
+            cache.delete(lock_key)
+
+
+def invalidate_lookup(name, city):
+    key = lookup_key(name, city)
+    _cache().delete(f"{CACHE_PREFIX}:{key}")
+    PlaceLookup.objects.filter(key=key).delete()
@@ -0,0 +1,93 @@
+"""
+Cache of serialized recommendation payloads per (user, city).
+
+Entries are addressed through version counters instead of being deleted:
+one per normalized city, one per user and a global one. Recording a visit or
+changing a restaurant bumps the counters it affects, which moves every
+dependent (user, city) pair to a new key and a new ETag at once, without
+scanning keys. Counters start from a clock value, so a counter that was
+evicted never comes back as a number that was already used.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from .services import normalize_city
+
+GLOBAL_VERSION_KEY = "recs:v:all"
+
+
+def _cache():
+    return caches[settings.RECOMMENDATION_CACHE_ALIAS]
+
+
+def _city_version_key(city):
+    return f"recs:v:city:{hashlib.sha1(normalize_city(city).encode('utf-8')).hexdigest()}"
+
+
+def _user_version_key(user_id):
+    return f"recs:v:user:{user_id}"
+
+
+def _fresh_version():
+    return time.time_ns()
+
+
+def _get_versions(keys):
+    cache = _cache()
+    versions = cache.get_many(keys)
+    missing = {key: _fresh_version() for key in keys if key not in versions}
+    for key, version in missing.items():
+        # add() so that concurrent first readers agree on one value.
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key, version)
+        versions[key] = version
+    return [versions[key] for key in keys]
+
+
+def _bump(keys):
+    cache = _cache()
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _fresh_version(), timeout=None)
+
+
+def recommendation_key(user_id, city, limit):
+    """
+    ``(cache_key, etag)`` for the current version of a user's recommendations
+    in ``city``.
+    """
+    global_version, city_version, user_version = _get_versions(
+        [GLOBAL_VERSION_KEY, _city_version_key(city), _user_version_key(user_id)]
+    )
+    digest = hashlib.sha1(
+        f"{global_version}:{city_version}:{user_version}:{user_id}:{normalize_city(city)}:{limit}".encode("utf-8")
+    ).hexdigest()
+    return f"recs:payload:{digest}", f'"{digest}"'
+
+
+def get_cached_payload(cache_key):
+    return _cache().get(cache_key)
+
+
+def set_cached_payload(cache_key, payload):
+    _cache().set(cache_key, payload, timeout=settings.RECOMMENDATION_CACHE_TTL)
+
+
+def invalidate_recommendations(cities=(), user_ids=()):
+    """
+    Expire cached recommendations for everyone in ``cities`` and for
+    ``user_ids`` in every city, once the current transaction commits.
+    """
+    keys = {_city_version_key(city) for city in cities if city} | {_user_version_key(user_id) for user_id in user_ids}
+    if keys:
+        transaction.on_commit(lambda: _bump(sorted(keys)))
+
+
+def invalidate_all_recommendations():
+    transaction.on_commit(lambda: _bump([GLOBAL_VERSION_KEY]))
@@ -0,0 +1,220 @@
+"""
+Offline item-item recommender.
+
+``train_recommender`` turns ``UserRestaurantInteraction`` into one sparse
+user x restaurant matrix per city, weighted by ``log1p(visits)`` so a single
+regular does not outweigh everyone else. Two restaurants are similar when the
+same users visit them: the cosine of their matrix columns, shrunk towards zero
+for pairs only a few users share. Cuisine (TF-IDF over the Places types, so
+tags every restaurant has, like "restaurant", weigh nothing) and price level
+(average spend per visit) then re-rank each restaurant's best co-visited
+candidates; they never add pairs that nobody co-visited.
+
+The best ``RECOMMENDER_NEIGHBORS`` neighbours of each restaurant are stored in
+``RestaurantNeighbor`` and read by ``get_recommendations_for_user`` in its
+ranking query. Similarities are computed a block of restaurants at a time, so
+memory follows the co-visited pairs of one block rather than the square of
+the number of restaurants in a city.
+"""
+import logging
+import math
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from scipy import sparse
+
+from .models import Restaurant, RestaurantNeighbor, UserRestaurantInteraction
+from .recommendation_cache import invalidate_recommendations
+from .services import normalize_city
+
+logger = logging.getLogger(__name__)
+
+# Average spends twice apart are e^-1 as similar in price as equal ones.
+PRICE_SCALE = math.log(2)
+# Co-visit candidates per restaurant that cuisine and price re-rank, per neighbour kept.
+RERANK_FACTOR = 4
+
+
+def _normalize_rows(matrix):
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    scale = np.divide(1, norms, out=np.zeros_like(norms), where=norms > 0)
+    return (sparse.diags(scale.astype(np.float32)) @ matrix).tocsr()
+
+
+def cuisine_features(cuisines):
+    """
+    Unit-length TF-IDF rows over the cuisine tags of each restaurant.
+    """
+    vocabulary = {}
+    rows, columns = [], []
+    for row, tags in enumerate(cuisines):
+        for tag in set(tags) if isinstance(tags, list) else ():
+            rows.append(row)
+            columns.append(vocabulary.setdefault(tag, len(vocabulary)))
+    shape = (len(cuisines), len(vocabulary))
+    columns = np.asarray(columns, dtype=np.int64)
+    idf = np.log((1 + shape[0]) / (1 + np.bincount(columns, minlength=shape[1]))).astype(np.float32)
+    return _normalize_rows(sparse.csr_matrix((idf[columns], (rows, columns)), shape=shape, dtype=np.float32))
+
+
+def top_k(rows, columns, scores, k):
+    """
+    The ``k`` best-scoring ``(rows, columns, scores)`` entries of each row,
+    best first; ties go to the lower column.
+    """
+    order = np.lexsort((columns, -scores, rows))
+    ordered_rows = rows[order]
+    rank = np.arange(order.size) - np.searchsorted(ordered_rows, ordered_rows)
+    keep = order[rank < k]
+    return rows[keep], columns[keep], scores[keep]
+
+
+def item_neighbors(visits, k, shrinkage=0.0, features=None, prices=None, content_weight=0.0, block_size=256):
+    """
+    Top-``k`` neighbours of every column of the user x item ``visits``
+    matrix, as ``(items, neighbors, scores)`` arrays. With ``content_weight``
+    the scores blend in the cosine of the items' ``features`` rows and the
+    closeness of their ``prices`` (NaN when unknown), each half of the
+    content part.
+    """
+    items = _normalize_rows(sparse.csr_matrix(visits, dtype=np.float32).T)
+    items_t = items.T.tocsr()
+    visitors = items.copy()
+    visitors.data[:] = 1
+    visitors_t = visitors.T.tocsr()
+    log_prices = np.log(prices) if prices is not None else None
+
+    found = []
+    for start in range(0, items.shape[0], block_size):
+        block = slice(start, start + block_size)
+        similarity = items[block] @ items_t
+        if shrinkage:
+            common = visitors[block] @ visitors_t
+            common.data /= common.data + shrinkage
+            similarity = similarity.multiply(common)
+        similarity = similarity.tocoo()
+        rows = similarity.row.astype(np.int64) + start
+        columns = similarity.col.astype(np.int64)
+        scores = similarity.data.astype(np.float32)
+        other = (rows != columns) & (scores > 0)
+        rows, columns, scores = rows[other], columns[other], scores[other]
+
+        if content_weight:
+            rows, columns, scores = top_k(rows, columns, scores, k * RERANK_FACTOR)
+            content = np.zeros_like(scores)
+            if features is not None:
+                content += np.asarray(features[rows].multiply(features[columns]).sum(axis=1)).ravel()
+            if log_prices is not None:
+                content += np.nan_to_num(np.exp(-np.abs(log_prices[rows] - log_prices[columns]) / PRICE_SCALE))
+            scores = (1 - content_weight) * scores + content_weight * content / 2
+        found.append(top_k(rows, columns, scores, k))
+
+    if not found:
+        return np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.float32)
+    return tuple(np.concatenate(parts) for parts in zip(*found))
+
+
+def city_neighbors(users, items, visits, spend, cuisines, k, shrinkage=0.0, content_weight=0.0, block_size=256):
+    """
+    Neighbours among the restaurants of one city. ``users``, ``items``,
+    ``visits`` and ``spend`` hold one entry per interaction, ``items``
+    indexing into ``cuisines``. Returns ``item_neighbors`` indexes.
+    """
+    _, user_index = np.unique(users, return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (np.log1p(visits).astype(np.float32), (user_index, items)),
+        shape=(user_index.max(initial=-1) + 1, len(cuisines)),
+    )
+    total_visits = np.bincount(items, weights=visits, minlength=len(cuisines))
+    total_spend = np.bincount(items, weights=spend, minlength=len(cuisines))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        prices = np.where(total_spend > 0, total_spend / total_visits, np.nan)
+    return item_neighbors(
+        matrix, k, shrinkage=shrinkage, features=cuisine_features(cuisines), prices=prices,
+        content_weight=content_weight, block_size=block_size,
+    )
+
+
+INTERACTION_DTYPE = np.dtype(
+    [("user", np.int64), ("restaurant", np.int64), ("visits", np.float64), ("spend", np.float64)]
+)
+
+
+def load_interactions(chunk_size=20000):
+    """
+    All interactions as ``(user_ids, restaurant_ids, visits, total_spend)`` arrays.
+    Rows are streamed from a server-side cursor straight into one structured
+    array, with no Python object kept per row.
+    """
+    rows = (
+        UserRestaurantInteraction.objects.order_by()
+        .values_list("user_id", "restaurant_id", "visits", "total_spend")
+        .iterator(chunk_size=chunk_size)
+    )
+    data = np.fromiter(rows, dtype=INTERACTION_DTYPE)
+    return data["user"], data["restaurant"], data["visits"], data["spend"]
+
+
+def train_recommender(neighbors=None, shrinkage=None, content_weight=None, block_size=256, batch_size=5000):
+    """
+    Rebuild ``RestaurantNeighbor`` from the interactions, replacing one
+    city's rows per transaction. Rows a restaurant still has under a city it
+    moved away from go in the same transaction. Returns the number of rows
+    written.
+    """
+    k = neighbors or settings.RECOMMENDER_NEIGHBORS
+    shrinkage = settings.RECOMMENDER_SHRINKAGE if shrinkage is None else shrinkage
+    content_weight = settings.RECOMMENDER_CONTENT_WEIGHT if content_weight is None else content_weight
+
+    users, restaurant_ids, visits, spend = load_interactions()
+    visited = Restaurant.objects.filter(Exists(UserRestaurantInteraction.objects.filter(restaurant=OuterRef("pk"))))
+    restaurants = list(visited.order_by("id").values_list("id", "city", "cuisine"))
+    ids = np.array([restaurant_id for restaurant_id, _, _ in restaurants], dtype=np.int64)
+    city_names = [normalize_city(city) for _, city, _ in restaurants]
+    cities = sorted(set(city_names))
+    code_of = {city: code for code, city in enumerate(cities)}
+    codes = np.array([code_of[city] for city in city_names], dtype=np.int64)
+
+    # Group the interactions by city. Ones whose restaurant appeared after
+    # they were loaded are left to the next run.
+    position = np.searchsorted(ids, restaurant_ids)
+    known = position < len(ids)
+    known[known] = ids[position[known]] == restaurant_ids[known]
+    interaction_city = np.full(len(restaurant_ids), -1, dtype=np.int64)
+    interaction_city[known] = codes[position[known]]
+    order = np.argsort(interaction_city, kind="stable")
+    bounds = np.searchsorted(interaction_city[order], np.arange(len(cities) + 1))
+
+    written = 0
+    for code, city in enumerate(cities):
+        selected = order[bounds[code]:bounds[code + 1]]
+        members = np.flatnonzero(codes == code)
+        city_ids = ids[members]
+        items, similar, scores = city_neighbors(
+            users[selected], np.searchsorted(members, position[selected]), visits[selected], spend[selected],
+            [restaurants[member][2] for member in members], k,
+            shrinkage=shrinkage, content_weight=content_weight, block_size=block_size,
+        )
+        rows = [
+            RestaurantNeighbor(city=city, restaurant_id=restaurant_id, neighbor_id=neighbor_id, score=score)
+            for restaurant_id, neighbor_id, score in zip(
+                city_ids[items].tolist(), city_ids[similar].tolist(), scores.tolist(),
+            )
+        ]
+        replaced = RestaurantNeighbor.objects.filter(Q(city=city) | Q(restaurant_id__in=city_ids.tolist()))
+        with transaction.atomic():
+            moved_from = set(replaced.exclude(city=city).values_list("city", flat=True).distinct())
+            replaced.delete()
+            RestaurantNeighbor.objects.bulk_create(rows, batch_size=batch_size)
+            invalidate_recommendations(cities=[city, *moved_from])
+        written += len(rows)
+
+    stale = set(RestaurantNeighbor.objects.exclude(city__in=cities).values_list("city", flat=True).distinct())
+    if stale:
+        with transaction.atomic():
+            RestaurantNeighbor.objects.filter(city__in=stale).delete()
+            invalidate_recommendations(cities=stale)
+    logger.info(f"Trained recommender: {written} neighbours for {len(ids)} restaurants in {len(cities)} cities")
+    return written
@@ -1,40 +1,22 @@
-import requests
-from django.conf import settings
-from .models import Restaurant, UserRestaurantInteraction
-from django.db.models import Sum
-
-def fetch_restaurant_details_from_google(name, city):
-    query = f"{name}, {city}"
-    api_key = settings.GOOGLE_API_KEY
-
-    find_url = settings.GOOGLE_PLACES_TEXT_SEARCH_URL
-    find_params = {
-        "input": query,
-        "inputtype": "textquery",
-        "fields": "place_id",
-        "key": api_key
-    }
-    res = requests.get(find_url, params=find_params)
-    if res.status_code != 200:
-        return None
+from collections import defaultdict
 
-    candidates = res.json().get("candidates", [])
-    if not candidates:
-        return None
-
-    place_id = candidates[0]["place_id"]
-
-    detail_url = settings.GOOGLE_PLACES_DETAILS_URL
-    detail_params = {
-        "place_id": place_id,
-        "fields": "place_id,name,formatted_address,formatted_phone_number,rating,user_ratings_total,type",
-        "key": api_key
-    }
-    detail_res = requests.get(detail_url, params=detail_params)
-    if detail_res.status_code != 200:
+from django.db import connection, transaction
+from django.db.models import Sum
+from .clients import get_places_client
+from .models import CityRestaurantPopularity, Restaurant, RestaurantNeighbor, UserRestaurantInteraction
+
+def fetch_restaurant_details_from_google(name, city, client=None):
+    """
+    Look a restaurant up on Google Places. Returns ``None`` when no place
+    matches; raises ``PlacesAPIError`` when the API cannot be reached.
+    """
+    client = client or get_places_client()
+
+    place_id = client.find_place_id(f"{name}, {city}")
+    if not place_id:
         return None
 
-    result = detail_res.json().get("result")
+    result = client.place_details(place_id)
     if not result:
         return None
 
@@ -49,48 +31,112 @@ def fetch_restaurant_details_from_google(name, city):
         "phone_number": result.get("formatted_phone_number")
     }
 
-def get_recommendations_for_user(user, city: str, limit=10):
-    print(f"Getting recommendations for user {user.id} in city '{city}'")
-
-    # Restaurants the user has visited in this city
-    user_visits_in_city = UserRestaurantInteraction.objects.filter(
-        user=user,
-        restaurant__city__iexact=city
-    ).values('restaurant').annotate(
-        total_visits=Sum('visits')
-    ).order_by('-total_visits')
-
-    visited_ids = [entry['restaurant'] for entry in user_visits_in_city]
-    print(f"User visited restaurant IDs in city '{city}': {visited_ids}")
-
-    # Exclude already visited restaurants for recommendation
-    exclude_ids = set(visited_ids)
+def normalize_city(city):
+    """
+    Key used for per-city lookups: case-insensitive and whitespace-collapsed,
+    so "Berlin", " berlin " and "BERLIN" share one popularity bucket.
+    """
+    return " ".join((city or "").split()).casefold()
+
+
+def increment_city_popularity(restaurant, visits=1):
+    """
+    Add ``visits`` to the restaurant's row in the per-city popularity table,
+    creating the row on first use.
+    """
+    increment_city_popularities([(restaurant, visits)])
+
+
+def increment_city_popularities(counts):
+    """
+    Add visit counts for many ``(restaurant, visits)`` pairs in a single
+    ``INSERT ... ON CONFLICT DO UPDATE`` statement.
+    """
+    folded = defaultdict(int)
+    for restaurant, visits in counts:
+        folded[(normalize_city(restaurant.city), restaurant.id)] += visits
+    if not folded:
+        return
+
+    table = connection.ops.quote_name(CityRestaurantPopularity._meta.db_table)
+    rows = sorted(folded.items())
+    sql = f"""
+        INSERT INTO {table} (city, restaurant_id, total_visits)
+        VALUES {", ".join(["(%s, %s, %s)"] * len(rows))}
+        ON CONFLICT (city, restaurant_id) DO UPDATE
+        SET total_visits = {table}.total_visits + EXCLUDED.total_visits
+    """
+    params = [value for (city, restaurant_id), visits in rows for value in (city, restaurant_id, visits)]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def rebuild_city_popularity(batch_size=1000):
+    """
+    Recompute the popularity table from ``UserRestaurantInteraction``.
+    Returns the number of rows written.
+    """
+    totals = (
+        UserRestaurantInteraction.objects
+        .values('restaurant_id', 'restaurant__city')
+        .annotate(total_visits=Sum('visits'))
+        .order_by()
+    )
+    rows = [
+        CityRestaurantPopularity(
+            city=normalize_city(entry['restaurant__city']),
+            restaurant_id=entry['restaurant_id'],
+            total_visits=entry['total_visits'],
+        )
+        for entry in totals.iterator()
+    ]
+    from .recommendation_cache import invalidate_all_recommendations
+
+    with transaction.atomic():
+        CityRestaurantPopularity.objects.all().delete()
+        CityRestaurantPopularity.objects.bulk_create(rows, batch_size=batch_size)
+        invalidate_all_recommendations()
+    return len(rows)
 
-    # Find other popular restaurants in the city by all users, excluding user's visited ones
-    popular_restaurants = UserRestaurantInteraction.objects.filter(
-        restaurant__city__iexact=city
-    ).exclude(
-        restaurant__id__in=exclude_ids
-    ).values('restaurant').annotate(
-        total_visits=Sum('visits')
-    ).order_by('-total_visits')[:limit]
 
-    popular_ids = [entry['restaurant'] for entry in popular_restaurants]
-    print(f"Popular restaurant IDs (excluding user's visited): {popular_ids}")
-
-    # Combine: first user's visited restaurants ordered by visits, then popular restaurants
-    combined_ids = visited_ids + popular_ids
+def get_recommendations_for_user(user, city: str, limit=10):
+    """
+    Restaurants the user already visits in ``city`` come first (by their own
+    visit count), then restaurants similar to those (summed ``RestaurantNeighbor``
+    scores, see ``recommender.py``), then the most visited restaurants in the
+    city overall. Served from ``CityRestaurantPopularity`` in a single query;
+    the user's visits and neighbour scores are aggregated once and hash-joined
+    instead of being looked up per candidate.
+    """
+    quote = connection.ops.quote_name
+    interactions = quote(UserRestaurantInteraction._meta.db_table)
+    neighbors = quote(RestaurantNeighbor._meta.db_table)
+    popularity = quote(CityRestaurantPopularity._meta.db_table)
+    restaurant_table = quote(Restaurant._meta.db_table)
+    ranked = Restaurant.objects.raw(
+        f"""
+        WITH visited AS (
+            SELECT restaurant_id, visits FROM {interactions} WHERE user_id = %s
+        ),
+        similarity AS (
+            SELECT n.neighbor_id AS restaurant_id, SUM(n.score) AS score
+            FROM {neighbors} n JOIN visited v ON v.restaurant_id = n.restaurant_id
+            GROUP BY n.neighbor_id
+        )
+        SELECT r.* FROM {popularity} p
+        JOIN {restaurant_table} r ON r.id = p.restaurant_id
+        LEFT JOIN visited v ON v.restaurant_id = p.restaurant_id
+        LEFT JOIN similarity s ON s.restaurant_id = p.restaurant_id
+        WHERE p.city = %s
+        ORDER BY COALESCE(v.visits, 0) DESC, COALESCE(s.score, 0) DESC, p.total_visits DESC, p.restaurant_id
+        LIMIT %s
+        """,
+        [user.pk, normalize_city(city), limit],
+    )
+    restaurants = list(ranked)
 
     # If no restaurants to recommend, fallback to top-rated restaurants in the city
-    if not combined_ids:
-        fallback_restaurants = list(Restaurant.objects.filter(city__iexact=city).order_by('-rating')[:limit])
-        print(f"Fallback to top rated restaurants (including visited): {[r.name for r in fallback_restaurants]}")
-        return fallback_restaurants
-
-    # Fetch Restaurant objects preserving the order in combined_ids
-    restaurants = list(Restaurant.objects.filter(id__in=combined_ids))
-    restaurants.sort(key=lambda r: combined_ids.index(r.id))
-
-    print(f"Final recommended restaurants: {[r.name for r in restaurants[:limit]]}")
+    if not restaurants:
+        return list(Restaurant.objects.filter(city__iexact=city).order_by('-rating')[:limit])
 
-    return restaurants[:limit]
\ No newline at end of file
+    return restaurants
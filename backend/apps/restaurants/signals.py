@@ -1,10 +1,97 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 from backend.apps.receipts.models import Receipt
-from backend.apps.restaurants.tasks import fetch_and_create_restaurant_from_receipt
+from backend.apps.restaurants.batching import enrichment_batcher
+from backend.apps.restaurants.interactions import record_visit_change, visit_values
+from backend.apps.restaurants.models import ReceiptEnrichment, Restaurant
+from backend.apps.restaurants.recommendation_cache import invalidate_recommendations
 
 @receiver(post_save, sender=Receipt)
-def handle_receipt_creation(sender, instance, created, **kwargs):
-    if not created:
+def handle_receipt_creation(sender, instance, created, raw=False, **kwargs):
+    if not created or raw:
         return
-    fetch_and_create_restaurant_from_receipt.delay(instance.id)
+    # The pending row commits with the receipt, so the retry sweep finds it
+    # even if the batch below never reaches a worker.
+    ReceiptEnrichment.objects.create(receipt=instance)
+    # Queue only once the receipt is committed, so the worker can load it.
+    transaction.on_commit(lambda: enrichment_batcher.add(instance.id))
+
+
+# Fields that decide which visit a receipt counts as.
+VISIT_SOURCE_FIELDS = ("user_id", "restaurant_id", "date", "price", "restaurant_name", "address")
+
+
+def _stored_visit_source(instance):
+    loaded = getattr(instance, "_loaded_values", None)
+    if loaded is not None and all(field in loaded for field in VISIT_SOURCE_FIELDS):
+        return {field: loaded[field] for field in VISIT_SOURCE_FIELDS}
+    return Receipt.objects.filter(pk=instance.pk).values(*VISIT_SOURCE_FIELDS).first()
+
+
+@receiver(pre_save, sender=Receipt)
+def remember_visit_before_save(sender, instance, raw=False, update_fields=None, **kwargs):
+    instance._visit_before = None
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    if update_fields is not None and not {
+        field.removesuffix("_id") for field in VISIT_SOURCE_FIELDS
+    } & {field.removesuffix("_id") for field in update_fields}:
+        return
+    before = instance._visit_before = _stored_visit_source(instance)
+    if before and (instance.restaurant_name, instance.address) != (before["restaurant_name"], before["address"]):
+        # The receipt may now name another restaurant: unlink it here so the
+        # save writes the change, and enrich it again once committed.
+        instance.restaurant = None
+
+
+@receiver(post_save, sender=Receipt)
+def update_interactions_on_save(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    before = None if created else getattr(instance, "_visit_before", None)
+    if raw or before is None:
+        return
+    if (instance.restaurant_name, instance.address) != (before["restaurant_name"], before["address"]):
+        if update_fields is not None and "restaurant" not in update_fields:
+            Receipt.objects.filter(pk=instance.pk).update(restaurant=None)
+        ReceiptEnrichment.objects.bulk_create(
+            [ReceiptEnrichment(receipt_id=instance.pk)],
+            update_conflicts=True, unique_fields=["receipt"],
+            update_fields=["status", "restaurant", "attempts", "error", "updated_at"],
+        )
+        transaction.on_commit(lambda: enrichment_batcher.add(instance.id))
+    record_visit_change(
+        visit_values(before), visit_values({field: getattr(instance, field) for field in VISIT_SOURCE_FIELDS}),
+    )
+    instance._loaded_values = {
+        **getattr(instance, "_loaded_values", {}),
+        **{field: getattr(instance, field) for field in VISIT_SOURCE_FIELDS},
+    }
+
+
+@receiver(post_delete, sender=Receipt)
+def update_interactions_on_delete(sender, instance, **kwargs):
+    loaded = getattr(instance, "_loaded_values", None)
+    if loaded is not None and "restaurant_id" in loaded:
+        values = {**{field: getattr(instance, field) for field in VISIT_SOURCE_FIELDS}, **loaded}
+    else:
+        values = {field: getattr(instance, field) for field in VISIT_SOURCE_FIELDS}
+    record_visit_change(visit_values(values), None)
+
+
+@receiver(pre_save, sender=Restaurant)
+def remember_restaurant_city(sender, instance, raw=False, **kwargs):
+    instance._city_before = None
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    instance._city_before = Restaurant.objects.filter(pk=instance.pk).values_list("city", flat=True).first()
+
+
+@receiver(post_save, sender=Restaurant)
+@receiver(post_delete, sender=Restaurant)
+def invalidate_restaurant_city(sender, instance, **kwargs):
+    # Recommendations embed restaurant details and fall back to ratings. A
+    # restaurant that moved drops out of its old city's recommendations too.
+    cities = {instance.city}
+    if getattr(instance, "_city_before", None):
+        cities.add(instance._city_before)
+    invalidate_recommendations(cities=cities)
@@ -1,96 +1,358 @@
 import logging
-import re
+from collections import defaultdict
+from datetime import timedelta
 from celery import shared_task
-from django.db import transaction
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
 from backend.apps.receipts.models import Receipt
-from .models import Restaurant, UserRestaurantInteraction
-from .services import fetch_restaurant_details_from_google
+from backend.apps.receipts.utils import extract_city_from_address
+from .models import ReceiptEnrichment, Restaurant, UserRestaurantInteraction
+from .clients import PlacesAPIError
+from .interactions import BackfillPending, reconcile_interactions
+from .matching import find_matching_restaurant
+from .places_cache import lookup_restaurant_details
+from .recommendation_cache import invalidate_recommendations
+from .recommender import train_recommender
+from .services import increment_city_popularities, rebuild_city_popularity
 
 logger = logging.getLogger(__name__)
 
-def extract_city_from_address(address):
-    if not address:
+def lookup_place_or_none(name, city):
+    """
+    Places lookup for the enrichment tasks: API outages are logged and treated
+    like "no data" so they neither crash the task nor get cached as misses.
+    """
+    try:
+        return lookup_restaurant_details(name, city)
+    except PlacesAPIError as exc:
+        logger.warning(f"Places lookup failed for {name} in {city}: {exc}")
         return None
 
-    match = re.search(r"\b\d{5}\s+([A-Za-zäöüÄÖÜß\s\-]+)", address)
-    if match:
-        return match.group(1).strip()
+def resolve_restaurant(name, city, address):
+    """
+    Find the Restaurant for ``name`` in ``city``, creating it from Google
+    Places data when it is unknown and refreshing it when Google reports a
+    different place. Returns ``None`` if the restaurant cannot be resolved.
+    """
+    restaurant = Restaurant.objects.filter(name__iexact=name, city__iexact=city).first()
+    if restaurant is None:
+        # Spelling variants ("PIZZA HUT GmbH", "Pizzahut") resolve locally.
+        restaurant = find_matching_restaurant(name, city)
+        if restaurant is not None:
+            logger.info(f"Matched '{name}' in {city} to restaurant {restaurant.id} '{restaurant.name}'")
+            return restaurant
+
+    if not restaurant:
+        # Fetch from Google first to get place_id and other data
+        data = lookup_place_or_none(name, city)
+        if not data or not data.get('place_id'):
+            logger.warning(f"Skipping creation: No valid place_id from Google for {name} in {city}")
+            return None
 
-    parts = [p.strip() for p in address.split(",")]
-    if len(parts) >= 2:
-        return parts[-2]
+        # A variant we could not match locally may still be a known place,
+        # or one another worker is creating right now: get_or_create re-reads
+        # the row when our insert loses the race on the unique place_id.
+        restaurant, created = Restaurant.objects.get_or_create(
+            place_id=data['place_id'],
+            defaults={
+                'name': data.get('name', name),
+                'address': data.get('address', address),
+                'city': data.get('city', city),
+                'cuisine': data.get('cuisine', []),
+                'rating': data.get('rating'),
+                'user_ratings_total': data.get('user_ratings_total'),
+                'phone_number': data.get('phone_number'),
+            },
+        )
+        if not created:
+            return restaurant
+        logger.info(f"Created new restaurant '{name}' with place_id {data['place_id']}")
 
-    return None
+    else:
+        # Update restaurant data if needed
+        data = lookup_place_or_none(name, city)
+        if data and data.get('place_id') != restaurant.place_id:
+            restaurant.place_id = data.get('place_id', restaurant.place_id)
+            restaurant.address = data.get('address', restaurant.address)
+            restaurant.cuisine = data.get('cuisine', restaurant.cuisine)
+            restaurant.rating = data.get('rating', restaurant.rating)
+            restaurant.user_ratings_total = data.get('user_ratings_total', restaurant.user_ratings_total)
+            restaurant.phone_number = data.get('phone_number', restaurant.phone_number)
+            restaurant.save()
+            logger.info(f"Updated restaurant '{name}' with new Google Places data")
+
+    return restaurant
 
 @shared_task
 def fetch_and_create_restaurant_from_receipt(receipt_id):
-    try:
-        receipt = Receipt.objects.get(id=receipt_id)
+    enrich_receipts([receipt_id])
+
+
+@shared_task
+def fetch_and_create_restaurants_from_receipts(receipt_ids):
+    """
+    Batched variant of ``fetch_and_create_restaurant_from_receipt``.
+    """
+    enrich_receipts(receipt_ids)
+
+
+def enrich_receipts(receipt_ids):
+    """
+    Resolve the restaurants of ``receipt_ids`` and record each receipt's visit
+    exactly once.
+
+    Receipts are loaded in one query, each distinct (name, city) is resolved
+    once and the interaction stats are written in bulk. Progress is kept in
+    ``ReceiptEnrichment``: receipts already ``done`` are skipped, so saving a
+    receipt twice or redelivering a task does not count a visit again.
+    """
+    receipts = list(Receipt.objects.select_related('user').filter(id__in=receipt_ids))
+    missing = set(receipt_ids) - {receipt.id for receipt in receipts}
+    if missing:
+        logger.error(f"Receipts {sorted(missing)} not found")
+
+    done = set(
+        ReceiptEnrichment.objects
+        .filter(receipt_id__in=[receipt.id for receipt in receipts], status=ReceiptEnrichment.Status.DONE)
+        .values_list('receipt_id', flat=True)
+    )
+    if done:
+        logger.info(f"Receipts {sorted(done)} are already enriched")
+    receipts = [receipt for receipt in receipts if receipt.id not in done]
+    if not receipts:
+        return
+    start_attempts([receipt.id for receipt in receipts])
+
+    groups = defaultdict(list)
+    outcomes = {}
+    for receipt in receipts:
         name = receipt.restaurant_name.strip()
-        print(f'address is {receipt.address}')
         city = extract_city_from_address(receipt.address)
-        logger.info(f"Processing receipt {receipt_id}: restaurant='{name}', city='{city}'")
-
         if not name or not city:
-            logger.warning(f"Skipping receipt {receipt_id} due to missing name or city")
-            return
-
-        # Try to find by name and city first
-        restaurant = Restaurant.objects.filter(name__iexact=name, city__iexact=city).first()
-
-        if not restaurant:
-            # Fetch from Google first to get place_id and other data
-            data = fetch_restaurant_details_from_google(name, city)
-            if not data or not data.get('place_id'):
-                logger.warning(f"Skipping creation: No valid place_id from Google for {name} in {city}")
-                return
-
-            # Create restaurant with valid place_id and data from Google
-            restaurant = Restaurant.objects.create(
-                place_id=data['place_id'],
-                name=data.get('name', name),
-                address=data.get('address', receipt.address),
-                city=data.get('city', city),
-                cuisine=data.get('cuisine', []),
-                rating=data.get('rating'),
-                user_ratings_total=data.get('user_ratings_total'),
-                phone_number=data.get('phone_number'),
+            logger.warning(f"Skipping receipt {receipt.id} due to missing name or city")
+            outcomes[receipt.id] = (None, "missing restaurant name or city")
+            continue
+        groups[(name.casefold(), city.casefold())].append((receipt, name, city))
+
+    for group in groups.values():
+        first, name, city = group[0]
+        restaurant = resolve_restaurant(name, city, first.address)
+        for receipt, _, _ in group:
+            outcomes[receipt.id] = (restaurant, "" if restaurant else "restaurant not resolved")
+
+    record_enrichment_outcomes(receipts, outcomes)
+    logger.info(f"Processed {len(receipts)} receipts for {len(groups)} restaurants in one batch")
+
+
+def start_attempts(receipt_ids):
+    """
+    Count an attempt for each unfinished receipt in ``receipt_ids``, creating
+    its pending state row if needed. Counting when a run starts rather than
+    when it records covers runs that die midway, which the retry sweep backs
+    off from like any other failure.
+    """
+    table = connection.ops.quote_name(ReceiptEnrichment._meta.db_table)
+    sql = f"""
+        INSERT INTO {table} (receipt_id, status, attempts, error, updated_at)
+        VALUES {", ".join(["(%s, %s, 1, '', %s)"] * len(receipt_ids))}
+        ON CONFLICT (receipt_id) DO UPDATE SET
+            attempts = {table}.attempts + 1,
+            updated_at = EXCLUDED.updated_at
+        WHERE {table}.status <> %s
+    """
+    now = timezone.now()
+    params = []
+    for receipt_id in sorted(receipt_ids):
+        params.extend([receipt_id, ReceiptEnrichment.Status.PENDING, now])
+    params.append(ReceiptEnrichment.Status.DONE)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def retry_stale_enrichments(limit=1000):
+    """
+    Queue the enrichment of stale ``pending`` and ``failed`` receipts again,
+    at most ``limit`` of them, oldest first. Pending ones had their batch
+    lost or their run killed; failed ones could not be resolved.
+
+    A receipt becomes due ``RECEIPT_ENRICHMENT_RETRY_AFTER`` seconds after
+    its last attempt, doubling with every attempt, and is given up after
+    ``RECEIPT_ENRICHMENT_MAX_ATTEMPTS``. Queued rows are touched so the next
+    sweep leaves them to the run. Returns the number of receipts queued.
+    """
+    now = timezone.now()
+    retry_after = timedelta(seconds=settings.RECEIPT_ENRICHMENT_RETRY_AFTER)
+    due = Q()
+    for attempts in range(settings.RECEIPT_ENRICHMENT_MAX_ATTEMPTS):
+        due |= Q(attempts=attempts, updated_at__lt=now - retry_after * 2 ** attempts)
+
+    with transaction.atomic():
+        receipt_ids = list(
+            ReceiptEnrichment.objects.select_for_update(skip_locked=True)
+            # status and the shortest delay bound the enrichment_status_idx scan.
+            .filter(
+                due,
+                status__in=[ReceiptEnrichment.Status.PENDING, ReceiptEnrichment.Status.FAILED],
+                updated_at__lt=now - retry_after,
             )
-            logger.info(f"Created new restaurant '{name}' with place_id {data['place_id']}")
+            .order_by('updated_at')
+            .values_list('receipt_id', flat=True)[:limit]
+        )
+        ReceiptEnrichment.objects.filter(receipt_id__in=receipt_ids).update(updated_at=now)
+        transaction.on_commit(lambda: queue_enrichment(receipt_ids))
+    return len(receipt_ids)
 
-        else:
-            # Update restaurant data if needed
-            data = fetch_restaurant_details_from_google(name, city)
-            if data and data.get('place_id') != restaurant.place_id:
-                restaurant.place_id = data.get('place_id', restaurant.place_id)
-                restaurant.address = data.get('address', restaurant.address)
-                restaurant.cuisine = data.get('cuisine', restaurant.cuisine)
-                restaurant.rating = data.get('rating', restaurant.rating)
-                restaurant.user_ratings_total = data.get('user_ratings_total', restaurant.user_ratings_total)
-                restaurant.phone_number = data.get('phone_number', restaurant.phone_number)
-                restaurant.save()
-                logger.info(f"Updated restaurant '{name}' with new Google Places data")
 
-        # Update user-restaurant interaction stats
-        update_user_interaction(receipt.user, restaurant, receipt.date, receipt.price)
+def queue_enrichment(receipt_ids):
+    batch_size = settings.RECEIPT_ENRICHMENT_BATCH_SIZE
+    for start in range(0, len(receipt_ids), batch_size):
+        fetch_and_create_restaurants_from_receipts.delay(receipt_ids[start:start + batch_size])
 
-    except Receipt.DoesNotExist:
-        logger.error(f"Receipt {receipt_id} not found")
+
+def record_enrichment_outcomes(receipts, outcomes):
+    """
+    Record the visits of resolved receipts, link them to their restaurant and
+    store every receipt's new state, in one transaction. The state rows are locked first and receipts
+    another worker has finished meanwhile are left alone.
+    """
+    with transaction.atomic():
+        states = list(
+            ReceiptEnrichment.objects.select_for_update()
+            .filter(receipt_id__in=outcomes)
+            .exclude(status=ReceiptEnrichment.Status.DONE)
+            .order_by('receipt_id')
+        )
+        claimed = {state.receipt_id for state in states}
+        update_user_interactions(
+            (receipt.user, outcomes[receipt.id][0], receipt.date, receipt.price)
+            for receipt in receipts
+            if receipt.id in claimed and outcomes[receipt.id][0] is not None
+        )
+        now = timezone.now()
+        for state in states:
+            restaurant, error = outcomes[state.receipt_id]
+            state.status = ReceiptEnrichment.Status.DONE if restaurant else ReceiptEnrichment.Status.FAILED
+            state.restaurant = restaurant
+            state.error = error
+            state.updated_at = now
+        ReceiptEnrichment.objects.bulk_update(states, ['status', 'restaurant', 'error', 'updated_at'])
+
+        linked = []
+        for receipt in receipts:
+            restaurant = outcomes[receipt.id][0]
+            if receipt.id in claimed and restaurant is not None and receipt.restaurant_id != restaurant.id:
+                receipt.restaurant = restaurant
+                linked.append(receipt)
+        # bulk_update skips the receipt signals: the rollups do not depend on
+        # the restaurant link.
+        Receipt.objects.bulk_update(linked, ['restaurant'])
 
 
 def update_user_interaction(user, restaurant, date, price):
+    update_user_interactions([(user, restaurant, date, price)])
+    logger.info(f"Recorded visit for user {user.id} at restaurant {restaurant.name}")
+
+
+def update_user_interactions(visits):
+    """
+    Record an iterable of ``(user, restaurant, date, price)`` visits.
+
+    Visits are folded per (user, restaurant) pair and written with a single
+    ``INSERT ... ON CONFLICT DO UPDATE``: the database increments ``visits``
+    and ``total_spend`` and derives ``average_spend`` from them, so concurrent
+    workers cannot lose each other's updates.
+    """
+    folded = {}
+    popularity = defaultdict(int)
+    restaurants = {}
+    for user, restaurant, date, price in visits:
+        key = (user.id, restaurant.id)
+        visit_count, spend, last_visited = folded.get(key, (0, 0, date))
+        folded[key] = (visit_count + 1, spend + price, max(last_visited, date))
+        popularity[restaurant.id] += 1
+        restaurants[restaurant.id] = restaurant
+    if not folded:
+        return
+
+    table = connection.ops.quote_name(UserRestaurantInteraction._meta.db_table)
+    # Sorted keys give concurrent batches a consistent lock order.
+    rows = sorted(folded.items())
+    sql = f"""
+        INSERT INTO {table} (user_id, restaurant_id, visits, total_spend, average_spend, last_visited)
+        VALUES {", ".join(["(%s, %s, %s, %s, %s, %s)"] * len(rows))}
+        ON CONFLICT (user_id, restaurant_id) DO UPDATE SET
+            visits = {table}.visits + EXCLUDED.visits,
+            total_spend = {table}.total_spend + EXCLUDED.total_spend,
+            average_spend = ({table}.total_spend + EXCLUDED.total_spend) / ({table}.visits + EXCLUDED.visits),
+            last_visited = CASE
+                WHEN EXCLUDED.last_visited > {table}.last_visited THEN EXCLUDED.last_visited
+                ELSE {table}.last_visited
+            END
+    """
+    params = []
+    for (user_id, restaurant_id), (visit_count, spend, last_visited) in rows:
+        params.extend([user_id, restaurant_id, visit_count, spend, spend / visit_count, last_visited])
+
     with transaction.atomic():
-        obj, created = UserRestaurantInteraction.objects.get_or_create(
-            user=user,
-            restaurant=restaurant,
-            defaults={'visits': 1, 'last_visited': date, 'average_spend': price}
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+        increment_city_popularities(
+            (restaurants[restaurant_id], count) for restaurant_id, count in popularity.items()
         )
-        if not created:
-            obj.visits += 1
-            obj.last_visited = max(obj.last_visited, date)
-            if obj.average_spend is None:
-                obj.average_spend = price
-            else:
-                obj.average_spend = ((obj.average_spend * (obj.visits - 1)) + price) / obj.visits
-            obj.save()
-        logger.info(f"{'Created' if created else 'Updated'} UserRestaurantInteraction for user {user.id} and restaurant {restaurant.name}")
+        # Popularity moved for everyone in these cities, and these users'
+        # own visit counts changed.
+        invalidate_recommendations(
+            cities={restaurant.city for restaurant in restaurants.values()},
+            user_ids={user_id for user_id, _ in folded},
+        )
+
+
+@shared_task
+def rebuild_city_popularity_task():
+    """
+    ``manage.py rebuild_city_popularity`` for periodic runs on the maintenance queue.
+    """
+    written = rebuild_city_popularity()
+    logger.info(f"Rebuilt city popularity: {written} rows")
+    return written
+
+
+@shared_task
+def reconcile_interactions_task():
+    """
+    ``manage.py reconcile_interactions`` for periodic runs on the maintenance queue.
+    """
+    try:
+        mismatches, unverified = reconcile_interactions()
+    except BackfillPending as exc:
+        logger.warning(f"Not reconciling interactions: {exc}")
+        return 0
+    if unverified:
+        logger.warning(f"Skipped {len(unverified)} users whose receipts could not all be linked")
+    repaired = len(mismatches)
+    if repaired:
+        logger.warning(f"Repaired {repaired} user-restaurant interactions that had drifted from their receipts")
+    return repaired
+
+
+@shared_task
+def retry_stale_enrichments_task():
+    """
+    ``manage.py retry_stale_enrichments`` for periodic runs on the maintenance queue.
+    """
+    queued = retry_stale_enrichments()
+    if queued:
+        logger.info(f"Queued {queued} stale receipt enrichments again")
+    return queued
+
+
+@shared_task
+def train_recommender_task():
+    """
+    ``manage.py train_recommender`` for periodic runs on the maintenance queue.
+    """
+    written = train_recommender()
+    logger.info(f"Trained recommender: {written} neighbour rows")
+    return written
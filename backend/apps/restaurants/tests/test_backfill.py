@@ -0,0 +1,124 @@
+from datetime import date
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.utils import timezone
+
+from backend.apps.receipts.models import Receipt
+from backend.apps.restaurants.backfill import ReceiptBackfill
+from backend.apps.restaurants.models import PlaceLookup, ReceiptEnrichment, Restaurant, UserRestaurantInteraction
+from backend.apps.restaurants.places_cache import lookup_key
+from backend.apps.restaurants.tasks import fetch_and_create_restaurants_from_receipts
+
+User = get_user_model()
+
+
+@pytest.mark.django_db
+class TestReceiptBackfill:
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.user = User.objects.create_user(email="backfill@example.com", password="pass", full_name="Backfill")
+        self.exact = Restaurant.objects.create(name="Curry Corner", city="Berlin", place_id="curry")
+        self.fuzzy = Restaurant.objects.create(name="Pizza Hut", city="Berlin", place_id="pizza")
+        self.looked_up = Restaurant.objects.create(name="Sushi Place", city="Berlin", place_id="sushi")
+        PlaceLookup.objects.create(
+            key=lookup_key("Sushi Bar Mitte", "Berlin"), name="Sushi Bar Mitte", city="Berlin",
+            data={"place_id": "sushi"}, fetched_at=timezone.now(),
+        )
+
+    def add(self, name, address="Hauptstr. 1, 10115 Berlin"):
+        receipt = Receipt.objects.create(
+            user=self.user, restaurant_name=name, address=address, date=date(2024, 5, 1),
+            price=Decimal("10.00"), image=None,
+        )
+        # A receipt from before enrichment state was kept.
+        ReceiptEnrichment.objects.filter(receipt=receipt).delete()
+        return receipt
+
+    @patch("backend.apps.restaurants.tasks.lookup_restaurant_details")
+    def test_resolves_locally_first(self, mock_lookup):
+        receipts = [
+            self.add("curry corner"), self.add("PIZZA HUT GmbH"), self.add("Sushi Bar Mitte"),
+            self.add("Unknown Diner"), self.add("No City", address=""),
+        ]
+
+        out = StringIO()
+        call_command("backfill_receipt_restaurants", "--chunk-size", "2", stdout=out)
+
+        assert "Linked 3 of 5 receipts" in out.getvalue()
+        assert mock_lookup.call_count == 0
+        linked = dict(Receipt.objects.values_list("id", "restaurant_id"))
+        assert [linked[receipt.id] for receipt in receipts] == [
+            self.exact.id, self.fuzzy.id, self.looked_up.id, None, None,
+        ]
+
+    @patch("backend.apps.restaurants.tasks.lookup_restaurant_details")
+    def test_remote_resolves_the_rest(self, mock_lookup):
+        mock_lookup.return_value = {"place_id": "diner", "name": "Unknown Diner", "city": "Berlin"}
+        receipts = [self.add("Unknown Diner"), self.add("unknown diner")]
+
+        list(ReceiptBackfill(remote=True).chunks())
+
+        diner = Restaurant.objects.get(place_id="diner")
+        assert set(Receipt.objects.filter(id__in=[r.id for r in receipts]).values_list("restaurant_id", flat=True)) \
+            == {diner.id}
+        assert mock_lookup.call_count == 1
+
+    def visits(self, restaurant):
+        interaction = UserRestaurantInteraction.objects.filter(user=self.user, restaurant=restaurant).first()
+        return interaction.visits if interaction else 0
+
+    def test_resumes_and_does_not_recount_visits(self):
+        first, second = self.add("Curry Corner"), self.add("Curry Corner")
+
+        backfill = ReceiptBackfill(start_after=first.id)
+        assert list(backfill.chunks()) == [(1, 1)]
+        assert backfill.last_id == second.id
+        first.refresh_from_db()
+        assert first.restaurant is None
+
+        # No interaction shows the visit was counted, so the backfill counts
+        # it; replaying enrichment adds no second visit.
+        assert self.visits(self.exact) == 1
+        fetch_and_create_restaurants_from_receipts([second.id])
+        assert self.visits(self.exact) == 1
+        state = ReceiptEnrichment.objects.get(receipt=second)
+        assert (state.status, state.restaurant_id) == (ReceiptEnrichment.Status.DONE, self.exact.id)
+
+    def test_counted_visits_are_only_linked(self):
+        UserRestaurantInteraction.objects.create(
+            user=self.user, restaurant=self.exact, visits=1, total_spend=Decimal("10.00"),
+            last_visited=date(2024, 5, 1),
+        )
+        old = self.add("Curry Corner")
+        enriched = self.add("Pizza Hut")
+        ReceiptEnrichment.objects.create(
+            receipt=enriched, status=ReceiptEnrichment.Status.DONE, restaurant=self.looked_up, attempts=1,
+        )
+
+        assert list(ReceiptBackfill().chunks()) == [(2, 2)]
+
+        assert dict(Receipt.objects.values_list("id", "restaurant_id")) == {
+            old.id: self.exact.id, enriched.id: self.looked_up.id,
+        }
+        assert (self.visits(self.exact), self.visits(self.looked_up)) == (1, 0)
+        assert ReceiptEnrichment.objects.get(receipt=old).status == ReceiptEnrichment.Status.DONE
+
+    def test_pending_and_failed_receipts_have_their_visit_recorded(self):
+        pending, failed = self.add("Curry Corner"), self.add("curry corner")
+        ReceiptEnrichment.objects.create(receipt=pending)
+        ReceiptEnrichment.objects.create(
+            receipt=failed, status=ReceiptEnrichment.Status.FAILED, error="restaurant not resolved", attempts=2,
+        )
+
+        assert list(ReceiptBackfill().chunks()) == [(2, 2)]
+
+        assert set(Receipt.objects.values_list("restaurant_id", flat=True)) == {self.exact.id}
+        assert self.visits(self.exact) == 2
+        assert set(ReceiptEnrichment.objects.values_list("status", "restaurant_id", "error")) == {
+            (ReceiptEnrichment.Status.DONE, self.exact.id, ""),
+        }
@@ -0,0 +1,64 @@
+import time
+from datetime import date
+from decimal import Decimal
+from unittest.mock import patch
+
+import pytest
+from django.contrib.auth import get_user_model
+
+from backend.apps.receipts.models import Receipt
+from backend.apps.restaurants.batching import ReceiptBatcher
+
+User = get_user_model()
+
+
+class TestReceiptBatcher:
+    def test_coalesces_ids_within_window(self):
+        batches = []
+        batcher = ReceiptBatcher(dispatch=batches.append, window=0.05, max_size=100)
+
+        for receipt_id in (1, 2, 3):
+            batcher.add(receipt_id)
+        assert batches == []
+
+        time.sleep(0.2)
+        assert batches == [[1, 2, 3]]
+
+    def test_dispatches_full_batch_immediately(self):
+        batches = []
+        batcher = ReceiptBatcher(dispatch=batches.append, window=60, max_size=2)
+
+        for receipt_id in (1, 2, 3):
+            batcher.add(receipt_id)
+        assert batches == [[1, 2]]
+
+        batcher.flush()
+        assert batches == [[1, 2], [3]]
+
+    def test_zero_window_dispatches_each_id(self):
+        batches = []
+        batcher = ReceiptBatcher(dispatch=batches.append, window=0, max_size=100)
+
+        batcher.add(1)
+        batcher.add(2)
+        assert batches == [[1], [2]]
+
+
+@pytest.mark.django_db
+def test_new_receipt_is_queued_after_commit(django_capture_on_commit_callbacks):
+    user = User.objects.create_user(email="batch@example.com", password="pass", full_name="Batch")
+
+    with patch("backend.apps.restaurants.signals.enrichment_batcher") as batcher:
+        with django_capture_on_commit_callbacks(execute=True):
+            receipt = Receipt.objects.create(
+                user=user,
+                restaurant_name="Test Resto",
+                address="12345 Berlin",
+                date=date.today(),
+                price=Decimal("10.0"),
+                image=None,
+            )
+            batcher.add.assert_not_called()
+        receipt.save()
+
+    batcher.add.assert_called_once_with(receipt.id)
@@ -0,0 +1,143 @@
+import time
+
+import pytest
+from prometheus_client import REGISTRY
+
+from backend.apps.restaurants.clients import (
+    PlacesAPIError,
+    PlacesClient,
+    RateLimiter,
+    get_places_client,
+    reset_places_client,
+)
+from backend.apps.restaurants.fake_places import FakePlacesServer
+
+
+@pytest.fixture
+def server():
+    with FakePlacesServer() as fake:
+        yield fake
+
+
+def make_client(server, **kwargs):
+    kwargs.setdefault("backoff_factor", 0)
+    kwargs.setdefault("rate_limit", 0)
+    return PlacesClient(find_url=server.find_url, details_url=server.details_url, **kwargs)
+
+
+class TestPlacesClient:
+    def test_retries_transient_errors(self, server):
+        """
+        429/5xx responses are retried until the API answers normally.
+        """
+        server.add_place("Test Resto", "Berlin", place_id="abc123")
+        server.fail_next(503, 429)
+
+        assert make_client(server, max_retries=3).find_place_id("Test Resto, Berlin") == "abc123"
+        assert server.requests == ["/find", "/find", "/find"]
+
+    def test_gives_up_after_retry_budget(self, server):
+        """
+        Once the retry budget is spent the client raises instead of returning
+        a result that would look like "not found".
+        """
+        server.fail_next(500, 500, 500)
+
+        with pytest.raises(PlacesAPIError):
+            make_client(server, max_retries=1).find_place_id("Test Resto, Berlin")
+        assert len(server.requests) == 2
+
+    @pytest.mark.parametrize("status", ["OVER_QUERY_LIMIT", "REQUEST_DENIED", "INVALID_REQUEST", "UNKNOWN_ERROR"])
+    def test_api_error_status_is_not_a_miss(self, server, status):
+        """
+        Quota and key errors come back as HTTP 200 with an error status; they
+        raise instead of reading as "no candidates", so they are never cached.
+        """
+        server.add_place("Test Resto", "Berlin", place_id="abc123")
+        server.fail_next(status)
+        before = REGISTRY.get_sample_value(
+            "lunchlog_places_request_errors_total", {"endpoint": "find", "reason": status.lower()},
+        ) or 0
+
+        with pytest.raises(PlacesAPIError, match=status):
+            make_client(server).find_place_id("Test Resto, Berlin")
+
+        assert REGISTRY.get_sample_value(
+            "lunchlog_places_request_errors_total", {"endpoint": "find", "reason": status.lower()},
+        ) == before + 1
+        assert make_client(server).place_details("missing") is None
+
+    def test_non_json_body_is_an_api_error(self, server):
+        """
+        An HTML error page (e.g. from a proxy) raises ``PlacesAPIError``, not a
+        raw JSON decode error.
+        """
+        import requests
+
+        client = make_client(server)
+        response = requests.Response()
+        response.status_code = 200
+        response._content = b"<html><body>502 Bad Gateway</body></html>"
+        client.session.get = lambda *args, **kwargs: response
+        with pytest.raises(PlacesAPIError, match="non-JSON"):
+            client.find_place_id("Test Resto, Berlin")
+
+        response._content = b"[]"
+        with pytest.raises(PlacesAPIError, match="unexpected body"):
+            client.find_place_id("Test Resto, Berlin")
+
+    def test_retry_after_is_capped(self, server, settings):
+        """
+        A server's Retry-After is honoured, but never beyond the backoff cap.
+        """
+        from unittest.mock import Mock
+
+        settings.PLACES_RETRY_BACKOFF_MAX = 2.0
+        retry = make_client(server).session.get_adapter(server.find_url).max_retries
+        assert retry.respect_retry_after_header
+        assert retry.get_retry_after(Mock(headers={"Retry-After": "3600"})) == 2.0
+        assert retry.get_retry_after(Mock(headers={"Retry-After": "1"})) == 1.0
+        assert retry.get_retry_after(Mock(headers={})) is None
+        # Retries made from it keep the cap.
+        assert retry.increment("GET", server.find_url).get_retry_after(Mock(headers={"Retry-After": "60"})) == 2.0
+
+    def test_read_timeout(self):
+        """
+        A slow upstream is cut off by the read timeout.
+        """
+        with FakePlacesServer(latency=0.5) as slow:
+            client = make_client(slow, read_timeout=0.1, max_retries=0)
+            with pytest.raises(PlacesAPIError):
+                client.find_place_id("Test Resto, Berlin")
+
+    def test_session_is_reused(self, server):
+        """
+        All calls go through one pooled session, and the process-wide client
+        is built once.
+        """
+        client = make_client(server)
+        session = client.session
+        client.find_place_id("a, Berlin")
+        client.find_place_id("b, Berlin")
+        assert client.session is session
+
+        reset_places_client()
+        assert get_places_client() is get_places_client()
+        reset_places_client()
+
+
+class TestRateLimiter:
+    def test_throttles_after_burst(self):
+        limiter = RateLimiter(rate=20, burst=2)
+        started = time.monotonic()
+        for _ in range(4):
+            limiter.acquire()
+        # Two calls fit in the burst, the remaining two wait ~50ms each.
+        assert time.monotonic() - started >= 0.09
+
+    def test_zero_rate_disables_limiting(self):
+        limiter = RateLimiter(rate=0)
+        started = time.monotonic()
+        for _ in range(100):
+            limiter.acquire()
+        assert time.monotonic() - started < 0.05
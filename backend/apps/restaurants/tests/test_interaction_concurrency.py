@@ -0,0 +1,58 @@
+import threading
+from datetime import date, timedelta
+from decimal import Decimal
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.db import connection
+
+from backend.apps.restaurants.models import (
+    CityRestaurantPopularity,
+    Restaurant,
+    UserRestaurantInteraction,
+)
+from backend.apps.restaurants.tasks import update_user_interaction
+
+User = get_user_model()
+
+WORKERS = 8
+VISITS_PER_WORKER = 25
+
+
+@pytest.mark.django_db(transaction=True)
+def test_parallel_upserts_lose_no_increments():
+    """
+    Workers hammering the same (user, restaurant) pair concurrently must not
+    lose visits or spend.
+    """
+    user = User.objects.create_user(email="stress@example.com", password="pass", full_name="Stress")
+    restaurant = Restaurant.objects.create(name="Busy Bistro", city="Berlin")
+    start = threading.Barrier(WORKERS)
+    errors = []
+
+    def worker(offset):
+        try:
+            start.wait()
+            for _ in range(VISITS_PER_WORKER):
+                update_user_interaction(
+                    user, restaurant, date(2024, 1, 1) + timedelta(days=offset), Decimal("10.00")
+                )
+        except Exception as exc:
+            errors.append(exc)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(WORKERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    expected_visits = WORKERS * VISITS_PER_WORKER
+    interaction = UserRestaurantInteraction.objects.get(user=user, restaurant=restaurant)
+    assert interaction.visits == expected_visits
+    assert interaction.total_spend == Decimal("10.00") * expected_visits
+    assert interaction.average_spend == Decimal("10.00")
+    assert interaction.last_visited == date(2024, 1, 1) + timedelta(days=WORKERS - 1)
+    assert CityRestaurantPopularity.objects.get(restaurant=restaurant).total_visits == expected_visits
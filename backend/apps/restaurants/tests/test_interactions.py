@@ -0,0 +1,179 @@
+from datetime import date
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from backend.apps.receipts.models import Receipt
+from backend.apps.receipts.views import ReceiptViewSet
+from backend.apps.restaurants.models import (
+    CityRestaurantPopularity,
+    ReceiptEnrichment,
+    Restaurant,
+    UserRestaurantInteraction,
+)
+from backend.apps.restaurants.tasks import fetch_and_create_restaurants_from_receipts, reconcile_interactions_task
+from backend.query_budget import assert_max_queries
+
+User = get_user_model()
+
+
+@pytest.mark.django_db
+class TestReceiptChangePropagation:
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.user = User.objects.create_user(email="drift@example.com", password="pass", full_name="Drift")
+        self.client = APIClient()
+        self.client.force_login(self.user)
+        self.restaurant = Restaurant.objects.create(name="Curry Corner", city="Berlin", place_id="curry")
+        self.receipts = [
+            Receipt.objects.create(
+                user=self.user, restaurant_name="Curry Corner", address="Hauptstr. 1, 10115 Berlin",
+                date=day, price=Decimal(price), image=None,
+            )
+            for day, price in [(date(2024, 5, 1), "10.00"), (date(2024, 6, 1), "20.00")]
+        ]
+        with patch("backend.apps.restaurants.tasks.lookup_restaurant_details", return_value=None):
+            fetch_and_create_restaurants_from_receipts([receipt.id for receipt in self.receipts])
+
+    def interaction(self):
+        return UserRestaurantInteraction.objects.get(user=self.user, restaurant=self.restaurant)
+
+    def test_edit_applies_the_difference(self):
+        url = reverse("receipt-detail", args=[self.receipts[1].id])
+        with assert_max_queries(ReceiptViewSet.query_budget["partial_update"]):
+            response = self.client.patch(url, {"price": "30.00", "date": "2024-04-01"}, format="json")
+        assert response.status_code == 200
+
+        interaction = self.interaction()
+        assert (interaction.visits, interaction.total_spend) == (2, Decimal("40.00"))
+        assert interaction.average_spend == Decimal("20.00")
+        assert interaction.last_visited == date(2024, 5, 1)
+        assert CityRestaurantPopularity.objects.get(restaurant=self.restaurant).total_visits == 2
+
+    def test_delete_removes_the_visit(self):
+        url = reverse("receipt-detail", args=[self.receipts[1].id])
+        with assert_max_queries(ReceiptViewSet.query_budget["destroy"]):
+            assert self.client.delete(url).status_code == 204
+
+        interaction = self.interaction()
+        assert (interaction.visits, interaction.total_spend, interaction.last_visited) == (
+            1, Decimal("10.00"), date(2024, 5, 1),
+        )
+        assert CityRestaurantPopularity.objects.get(restaurant=self.restaurant).total_visits == 1
+
+        self.client.delete(reverse("receipt-detail", args=[self.receipts[0].id]))
+        assert not UserRestaurantInteraction.objects.exists()
+        assert not CityRestaurantPopularity.objects.exists()
+
+    def test_delete_only_touches_the_restaurants_current_city(self):
+        # A row left in another city, e.g. from before the restaurant moved.
+        CityRestaurantPopularity.objects.create(city="hamburg", restaurant=self.restaurant, total_visits=5)
+
+        self.client.delete(reverse("receipt-detail", args=[self.receipts[1].id]))
+
+        assert CityRestaurantPopularity.objects.get(city="berlin", restaurant=self.restaurant).total_visits == 1
+        assert CityRestaurantPopularity.objects.get(city="hamburg", restaurant=self.restaurant).total_visits == 5
+
+    @patch("backend.apps.restaurants.signals.enrichment_batcher")
+    def test_renamed_receipt_is_enriched_again(self, batcher, django_capture_on_commit_callbacks):
+        receipt = self.receipts[1]
+        with django_capture_on_commit_callbacks(execute=True):
+            response = self.client.patch(
+                reverse("receipt-detail", args=[receipt.id]), {"restaurant_name": "Pho Saigon"}, format="json",
+            )
+        assert response.status_code == 200
+
+        receipt.refresh_from_db()
+        assert receipt.restaurant is None
+        state = ReceiptEnrichment.objects.get(receipt=receipt)
+        assert (state.status, state.restaurant, state.attempts) == (ReceiptEnrichment.Status.PENDING, None, 0)
+        batcher.add.assert_called_once_with(receipt.id)
+        assert self.interaction().visits == 1
+
+
+@pytest.mark.django_db
+class TestReconcileInteractions:
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.user = User.objects.create_user(email="reconcile@example.com", password="pass", full_name="Reconcile")
+        self.curry = Restaurant.objects.create(name="Curry Corner", city="Berlin", place_id="curry")
+        self.pho = Restaurant.objects.create(name="Pho Saigon", city="Berlin", place_id="pho")
+        for day, price in [(date(2024, 5, 1), "10.00"), (date(2024, 6, 1), "20.00")]:
+            Receipt.objects.create(
+                user=self.user, restaurant_name="Curry Corner", address="Hauptstr. 1, 10115 Berlin",
+                date=day, price=Decimal(price), image=None, restaurant=self.curry,
+            )
+
+    def test_check_and_repair(self):
+        # Drift: a lost visit on one pair and a pair without any receipts.
+        UserRestaurantInteraction.objects.create(
+            user=self.user, restaurant=self.curry, visits=1, total_spend=Decimal("10.00"), last_visited=date(2024, 5, 1),
+        )
+        CityRestaurantPopularity.objects.create(city="berlin", restaurant=self.curry, total_visits=1)
+        UserRestaurantInteraction.objects.create(
+            user=self.user, restaurant=self.pho, visits=3, total_spend=Decimal("30.00"), last_visited=date(2024, 1, 1),
+        )
+        CityRestaurantPopularity.objects.create(city="berlin", restaurant=self.pho, total_visits=3)
+
+        with pytest.raises(CommandError, match="2 interactions differ"):
+            call_command("reconcile_interactions", "--check", stdout=StringIO())
+
+        assert reconcile_interactions_task() == 2
+
+        interaction = UserRestaurantInteraction.objects.get()
+        assert (interaction.restaurant, interaction.visits, interaction.total_spend) == (
+            self.curry, 2, Decimal("30.00"),
+        )
+        assert interaction.last_visited == date(2024, 6, 1)
+        assert CityRestaurantPopularity.objects.get().total_visits == 2
+        out = StringIO()
+        call_command("reconcile_interactions", "--check", "--chunk-size", "1", stdout=out)
+        assert "match the receipts" in out.getvalue()
+
+    def test_stats_from_before_linking_are_not_wiped(self):
+        """
+        Visits counted before receipts were linked survive reconciliation:
+        repairs wait for the backfill, and users with receipts it could not
+        link are left alone.
+        """
+        diner = Restaurant.objects.create(name="Diner Deluxe", city="Berlin", place_id="diner")
+        counted = [
+            Receipt.objects.create(
+                user=self.user, restaurant_name=name, address="Hauptstr. 1, 10115 Berlin",
+                date=date(2024, 4, 1), price=Decimal("12.00"), image=None,
+            )
+            for name in ["Pho Saigon", "Dinerio"]
+        ]
+        ReceiptEnrichment.objects.filter(receipt__in=counted).delete()
+        for restaurant in [self.pho, diner]:
+            UserRestaurantInteraction.objects.create(
+                user=self.user, restaurant=restaurant, visits=1, total_spend=Decimal("12.00"),
+                last_visited=date(2024, 4, 1),
+            )
+        # Drift the repair would fix.
+        UserRestaurantInteraction.objects.create(
+            user=self.user, restaurant=self.curry, visits=5, total_spend=Decimal("50.00"),
+            last_visited=date(2024, 6, 1),
+        )
+        before = set(UserRestaurantInteraction.objects.values_list("restaurant", "visits"))
+
+        assert reconcile_interactions_task() == 0
+        with pytest.raises(CommandError, match="backfill_receipt_restaurants"):
+            call_command("reconcile_interactions", stdout=StringIO())
+        assert set(UserRestaurantInteraction.objects.values_list("restaurant", "visits")) == before
+
+        call_command("backfill_receipt_restaurants", stdout=StringIO())
+        assert Receipt.objects.get(id=counted[0].id).restaurant == self.pho
+        assert ReceiptEnrichment.objects.get(receipt=counted[1]).status == ReceiptEnrichment.Status.UNLINKED
+
+        out = StringIO()
+        call_command("reconcile_interactions", stdout=out)
+        assert f"Skipped 1 users with receipts that could not be linked: {self.user.id}" in out.getvalue()
+        assert set(UserRestaurantInteraction.objects.values_list("restaurant", "visits")) == before
@@ -0,0 +1,231 @@
+from datetime import date
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+
+from backend.apps.restaurants.matching import (
+    find_duplicate_groups,
+    find_matching_restaurant,
+    has_pg_trgm,
+    is_name_variant,
+    merge_restaurants,
+    normalize_restaurant_name,
+    similarity,
+)
+from backend.apps.restaurants.models import CityRestaurantPopularity, Restaurant, UserRestaurantInteraction
+from backend.apps.restaurants.tasks import resolve_restaurant
+
+User = get_user_model()
+
+
+@pytest.mark.parametrize("name, key", [
+    ("Pizza Hut", "pizzahut"),
+    ("PIZZA HUT GmbH", "pizzahut"),
+    ("Pizzahut", "pizzahut"),
+    ("Café Müller GmbH & Co. KG", "cafemuller"),
+    ("Straßenküche UG (haftungsbeschränkt)", "strassenkuche"),
+    ("  The   Bird Ltd. ", "thebird"),
+    ("AG", "ag"),
+    ("", ""),
+])
+def test_normalize_restaurant_name(name, key):
+    assert normalize_restaurant_name(name) == key
+
+
+def test_similarity_matches_pg_trgm():
+    # Values as returned by PostgreSQL's pg_trgm similarity().
+    assert similarity("word", "two words") == pytest.approx(4 / 11)
+    assert similarity("pizzahut", "pizzahut") == 1.0
+    assert similarity("pizzahut", "") == 0.0
+
+
+@pytest.mark.parametrize("key_a, key_b, variant", [
+    ("pizzahut", "pizzahut", True),
+    ("pizzahut", "pizzahutt", True),
+    ("pizzahut", "pizzahit", True),
+    ("pizzahut", "pizzahtu", True),
+    ("restaurantitalia", "restaurantitaliano", False),
+    ("asiawok", "asiawok2", False),
+    ("asiawok1", "asiawok2", False),
+    ("pizzahut", "pizzahuttt", False),
+])
+def test_is_name_variant(key_a, key_b, variant):
+    assert is_name_variant(key_a, key_b) is variant
+    assert is_name_variant(key_b, key_a) is variant
+
+
+@pytest.mark.django_db
+class TestRestaurantMatching:
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.pizza = Restaurant.objects.create(place_id="p1", name="Pizza Hut", address="a", city="Berlin")
+        self.other_city = Restaurant.objects.create(place_id="p2", name="Pizza Hut", address="a", city="Hamburg")
+        Restaurant.objects.create(place_id="p3", name="Burger King", address="a", city="Berlin")
+
+    def test_name_key_kept_in_sync(self):
+        assert self.pizza.name_key == "pizzahut"
+        self.pizza.name = "Pizza Hut Delivery"
+        self.pizza.save(update_fields=["name"])
+        self.pizza.refresh_from_db()
+        assert self.pizza.name_key == "pizzahutdelivery"
+
+    def test_matches_normalized_name_in_same_city(self):
+        assert find_matching_restaurant("PIZZA HUT GmbH", "berlin") == self.pizza
+        assert find_matching_restaurant("Pizzahut", "Hamburg") == self.other_city
+        assert find_matching_restaurant("Pizzahut", "München") is None
+
+    def test_fuzzy_match_without_pg_trgm(self):
+        with patch("backend.apps.restaurants.matching.has_pg_trgm", return_value=False):
+            assert find_matching_restaurant("Pizza Hutt", "Berlin") == self.pizza
+            assert find_matching_restaurant("Burger Kong", "Berlin") is None
+            assert find_matching_restaurant("Pizza Hutt", "Berlin", threshold=1.1) is None
+
+    def test_fuzzy_match_with_pg_trgm(self):
+        if not has_pg_trgm():
+            pytest.skip("pg_trgm is not installed")
+        assert find_matching_restaurant("Pizza Hutt", "Berlin") == self.pizza
+        assert find_matching_restaurant("Burger Kong", "Berlin") is None
+        assert find_matching_restaurant("Pizza Hutt", "Berlin", threshold=1.1) is None
+
+    @pytest.mark.parametrize("trigram", [False, True])
+    def test_near_miss_names_do_not_match(self, trigram):
+        if trigram and not has_pg_trgm():
+            pytest.skip("pg_trgm is not installed")
+        Restaurant.objects.create(place_id="pB", name="Restaurant Italiano", address="a", city="Berlin")
+        Restaurant.objects.create(place_id="pC", name="Asia Wok", address="a", city="Berlin")
+        with patch("backend.apps.restaurants.matching.has_pg_trgm", return_value=trigram):
+            assert find_matching_restaurant("Restaurant Italiano Due", "Berlin") is None
+            assert find_matching_restaurant("Restaurant Italia", "Berlin") is None
+            assert find_matching_restaurant("Asia Wok 2", "Berlin") is None
+
+    def test_variant_resolves_without_network(self):
+        with patch("backend.apps.restaurants.tasks.lookup_restaurant_details") as lookup:
+            assert resolve_restaurant("PIZZA HUT GmbH", "Berlin", "addr") == self.pizza
+        lookup.assert_not_called()
+
+    def test_unmatched_variant_reuses_known_place(self):
+        with patch("backend.apps.restaurants.tasks.lookup_restaurant_details", return_value={"place_id": "p3"}):
+            assert resolve_restaurant("BK Alexanderplatz", "Berlin", "addr").place_id == "p3"
+        assert Restaurant.objects.count() == 3
+
+    def test_new_place_created_by_another_worker(self):
+        from django.db import connection
+
+        def lose_race(execute, sql, params, many, context):
+            # Another worker inserts the place right after we looked it up.
+            result = execute(sql, params, many, context)
+            if '"restaurants_restaurant"."place_id" = ' in sql and not raced:
+                raced.append(True)
+                Restaurant.objects.create(place_id="p4", name="Curry 36", address="a", city="Berlin")
+            return result
+
+        raced = []
+        with patch("backend.apps.restaurants.tasks.lookup_restaurant_details", return_value={"place_id": "p4"}), \
+                connection.execute_wrapper(lose_race):
+            restaurant = resolve_restaurant("Curry 36", "Berlin", "addr")
+        assert raced
+        assert restaurant.place_id == "p4"
+        assert Restaurant.objects.filter(place_id="p4").count() == 1
+
+
+@pytest.mark.django_db
+class TestMergeDuplicateRestaurants:
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.alice = User.objects.create_user(email="alice@example.com", password="x", full_name="Alice")
+        self.bob = User.objects.create_user(email="bob@example.com", password="x", full_name="Bob")
+        self.keep = Restaurant.objects.create(place_id="p1", name="Pizza Hut", address="a", city="Berlin",
+                                              user_ratings_total=100)
+        # Created before name keys existed / without a Google place.
+        self.dupe = Restaurant.objects.create(place_id=None, name="PIZZA HUT GmbH", address="a", city="berlin")
+        self.typo = Restaurant.objects.create(place_id=None, name="Pizza Hutt", address="a", city="Berlin")
+        self.unrelated = Restaurant.objects.create(place_id="p2", name="Pizza Hut", address="a", city="Hamburg")
+
+        def interaction(user, restaurant, visits, spend, last):
+            UserRestaurantInteraction.objects.create(
+                user=user, restaurant=restaurant, visits=visits, total_spend=Decimal(spend),
+                average_spend=Decimal(spend) / visits, last_visited=last,
+            )
+
+        interaction(self.alice, self.keep, 2, "20.00", date(2024, 1, 1))
+        interaction(self.alice, self.dupe, 1, "16.00", date(2024, 3, 1))
+        interaction(self.bob, self.typo, 3, "30.00", date(2024, 2, 1))
+        CityRestaurantPopularity.objects.create(city="berlin", restaurant=self.keep, total_visits=2)
+        CityRestaurantPopularity.objects.create(city="berlin", restaurant=self.dupe, total_visits=1)
+        CityRestaurantPopularity.objects.create(city="berlin", restaurant=self.typo, total_visits=3)
+
+    def test_find_duplicate_groups(self):
+        assert find_duplicate_groups() == [[self.keep.id, self.dupe.id, self.typo.id]]
+        assert find_duplicate_groups(threshold=1.1) == [[self.keep.id, self.dupe.id]]
+
+    def test_find_duplicate_groups_without_pg_trgm(self):
+        with patch("backend.apps.restaurants.matching.has_pg_trgm", return_value=False):
+            assert find_duplicate_groups() == [[self.keep.id, self.dupe.id, self.typo.id]]
+            assert find_duplicate_groups(threshold=1.1) == [[self.keep.id, self.dupe.id]]
+
+    @pytest.mark.parametrize("trigram", [False, True])
+    def test_near_miss_places_are_not_grouped(self, trigram):
+        if trigram and not has_pg_trgm():
+            pytest.skip("pg_trgm is not installed")
+        Restaurant.objects.create(place_id="pA", name="Restaurant Italia", address="a", city="Berlin")
+        Restaurant.objects.create(place_id="pB", name="Restaurant Italiano", address="a", city="Berlin")
+        Restaurant.objects.create(place_id="pC", name="Asia Wok", address="a", city="Berlin")
+        Restaurant.objects.create(place_id="pD", name="Asia Wok 2", address="a", city="Berlin")
+        Restaurant.objects.create(place_id=None, name="Asia Wok 2", address="a", city="Berlin")
+        # Same name, different branch.
+        Restaurant.objects.create(place_id="pE", name="Pizza Hut", address="b", city="Berlin")
+        with patch("backend.apps.restaurants.matching.has_pg_trgm", return_value=trigram):
+            groups = find_duplicate_groups()
+        assert len(groups) == 2
+        assert [self.keep.id, self.dupe.id, self.typo.id] in groups
+        assert not {"pA", "pB", "pC", "pE"} & set(
+            Restaurant.objects.filter(id__in=sum(groups, [])).values_list("place_id", flat=True)
+        )
+
+    def test_groups_do_not_chain(self):
+        # "Pizza Huttt" is a typo of "Pizza Hutt" but not of the kept "Pizza Hut".
+        chained = Restaurant.objects.create(place_id=None, name="Pizza Huttt", address="a", city="Berlin")
+        with patch("backend.apps.restaurants.matching.has_pg_trgm", return_value=False):
+            assert find_duplicate_groups() == [[self.keep.id, self.dupe.id, self.typo.id]]
+        assert chained.id not in sum(find_duplicate_groups(), [])
+
+    def test_merge_refuses_different_places(self):
+        other = Restaurant.objects.create(place_id="p5", name="Pizza Hut", address="b", city="Berlin")
+        with pytest.raises(ValueError):
+            merge_restaurants(self.keep, [self.dupe, other])
+        assert Restaurant.objects.count() == 5
+
+    def test_dry_run_changes_nothing(self):
+        out = StringIO()
+        call_command("merge_duplicate_restaurants", "--dry-run", stdout=out)
+        assert "Found 1 groups" in out.getvalue()
+        assert Restaurant.objects.count() == 4
+
+    def test_merge_repoints_interactions_and_popularity(self):
+        from backend.apps.receipts.models import Receipt
+
+        receipt = Receipt.objects.create(
+            user=self.alice, restaurant_name=self.dupe.name, address="Hauptstr. 1, 10115 Berlin",
+            date=date(2024, 3, 1), price=Decimal("12.00"), image=None, restaurant=self.dupe,
+        )
+        out = StringIO()
+        call_command("merge_duplicate_restaurants", stdout=out)
+        assert "Merged 2 duplicate restaurants" in out.getvalue()
+        assert set(Restaurant.objects.values_list("id", flat=True)) == {self.keep.id, self.unrelated.id}
+
+        alice = UserRestaurantInteraction.objects.get(user=self.alice)
+        assert alice.restaurant_id == self.keep.id
+        assert (alice.visits, alice.total_spend, alice.last_visited) == (3, Decimal("36.00"), date(2024, 3, 1))
+        assert alice.average_spend == Decimal("12.00")
+
+        bob = UserRestaurantInteraction.objects.get(user=self.bob)
+        assert (bob.restaurant_id, bob.visits, bob.total_spend) == (self.keep.id, 3, Decimal("30.00"))
+
+        popularity = CityRestaurantPopularity.objects.get()
+        assert (popularity.restaurant_id, popularity.total_visits) == (self.keep.id, 6)
+        receipt.refresh_from_db()
+        assert receipt.restaurant_id == self.keep.id
@@ -0,0 +1,127 @@
+from datetime import date
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from prometheus_client import REGISTRY
+from rest_framework.test import APIClient
+
+from backend import metrics
+from backend.apps.receipts.models import Receipt
+from backend.apps.receipts.utils import storage
+from backend.apps.restaurants.clients import PlacesAPIError, PlacesClient
+from backend.apps.restaurants.fake_places import FakePlacesServer
+from backend.apps.restaurants.tasks import fetch_and_create_restaurant_from_receipt
+
+User = get_user_model()
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+@pytest.mark.django_db
+class TestRequestMetrics:
+    def setup_method(self):
+        self.user = User.objects.create_user(email="metrics@example.com", password="pass", full_name="Metrics")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_latency_and_queries_per_view(self):
+        labels = {"view": "food-recommendations"}
+        before = sample("lunchlog_http_request_duration_seconds_count", method="GET", status="200", **labels)
+        queries_before = sample("lunchlog_http_request_db_queries_sum", **labels)
+
+        assert self.client.get("/api/recommendations/", {"city": "Berlin"}).status_code == 200
+
+        assert sample("lunchlog_http_request_duration_seconds_count", method="GET", status="200", **labels) == before + 1
+        assert sample("lunchlog_http_request_db_queries_sum", **labels) > queries_before
+        assert sample("lunchlog_http_request_db_duration_seconds_count", **labels) >= 1
+
+    def test_unresolved_paths_share_a_label(self):
+        before = sample("lunchlog_http_request_duration_seconds_count", view="unmatched", method="GET", status="404")
+        self.client.get("/no-such-page-1/")
+        self.client.get("/no-such-page-2/")
+        after = sample("lunchlog_http_request_duration_seconds_count", view="unmatched", method="GET", status="404")
+        assert after == before + 2
+
+    def test_scrape_endpoint(self, settings):
+        settings.METRICS_TOKEN = "secret"
+        self.client.get("/api/recommendations/", {"city": "Berlin"})
+        response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer secret")
+        assert response.status_code == 200
+        assert response["Content-Type"].startswith("text/plain")
+        assert b"lunchlog_http_request_duration_seconds_bucket" in response.content
+
+        assert self.client.get("/metrics").status_code == 403
+        assert self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer wrong").status_code == 403
+
+    def test_scrape_endpoint_refused_without_token(self, settings):
+        settings.METRICS_TOKEN = ""
+        settings.DEBUG = False
+        assert self.client.get("/metrics").status_code == 403
+
+        settings.DEBUG = True
+        assert self.client.get("/metrics").status_code == 200
+
+
+@pytest.mark.django_db
+class TestTaskMetrics:
+    def test_task_duration_by_state(self):
+        user = User.objects.create_user(email="taskmetrics@example.com", password="pass", full_name="Task")
+        receipt = Receipt.objects.create(
+            user=user, restaurant_name="Nowhere", address="No city here", date=date.today(),
+            price=Decimal("10.00"), image=None,
+        )
+        labels = {"task": fetch_and_create_restaurant_from_receipt.name, "state": "SUCCESS"}
+        before = sample("lunchlog_celery_task_duration_seconds_count", **labels)
+
+        fetch_and_create_restaurant_from_receipt.apply(args=[receipt.id])
+
+        assert sample("lunchlog_celery_task_duration_seconds_count", **labels) == before + 1
+
+    def test_queue_lag_and_retries(self):
+        task = SimpleNamespace(
+            name=fetch_and_create_restaurant_from_receipt.name, request=SimpleNamespace(published_at=None),
+        )
+        headers = {}
+        metrics._task_published(headers=headers)
+        task.request.published_at = headers["published_at"] - 2
+
+        lag_before = sample("lunchlog_celery_task_queue_lag_seconds_sum", task=task.name)
+        retries_before = sample("lunchlog_celery_task_retries_total", task=task.name)
+        metrics._task_prerun(task_id="t-1", task=task)
+        metrics._task_retry(sender=task)
+        metrics._task_postrun(task_id="t-1", task=task, state="RETRY")
+
+        assert sample("lunchlog_celery_task_queue_lag_seconds_sum", task=task.name) - lag_before >= 2
+        assert sample("lunchlog_celery_task_retries_total", task=task.name) == retries_before + 1
+        assert sample("lunchlog_celery_task_duration_seconds_count", task=task.name, state="RETRY") >= 1
+
+
+class TestOutboundMetrics:
+    def test_places_latency_and_errors(self):
+        with FakePlacesServer() as server:
+            server.add_place("Test Resto", "Berlin", place_id="abc")
+            client = PlacesClient(
+                find_url=server.find_url, details_url=server.details_url,
+                max_retries=0, backoff_factor=0, rate_limit=0,
+            )
+            found_before = sample("lunchlog_places_request_duration_seconds_count", endpoint="find")
+            errors_before = sample("lunchlog_places_request_errors_total", endpoint="details", reason="http_500")
+
+            assert client.find_place_id("Test Resto, Berlin") == "abc"
+            server.fail_next(500)
+            with pytest.raises(PlacesAPIError):
+                client.place_details("abc")
+
+        assert sample("lunchlog_places_request_duration_seconds_count", endpoint="find") == found_before + 1
+        assert sample("lunchlog_places_request_errors_total", endpoint="details", reason="http_500") == errors_before + 1
+
+    def test_storage_upload_latency(self):
+        before = sample("lunchlog_storage_operation_duration_seconds_count", operation="save")
+        name = storage.save("metrics/test.txt", ContentFile(b"hello"))
+        storage.delete(name)
+        assert sample("lunchlog_storage_operation_duration_seconds_count", operation="save") == before + 1
@@ -0,0 +1,159 @@
+import threading
+import time
+from datetime import timedelta
+from unittest.mock import patch
+
+import pytest
+from django.core.cache import cache
+from django.db import connection
+from django.utils import timezone
+
+from backend.apps.restaurants.clients import PlacesAPIError
+from backend.apps.restaurants.models import PlaceLookup
+from backend.apps.restaurants.places_cache import (
+    get_lookup_stats,
+    lookup_key,
+    lookup_restaurant_details,
+    reset_lookup_stats,
+)
+
+PLACE = {
+    "place_id": "abc123",
+    "name": "Test Resto",
+    "address": "123 Main St, Berlin",
+    "city": "Berlin",
+    "cuisine": ["restaurant"],
+    "rating": 4.5,
+    "user_ratings_total": 10,
+    "phone_number": None,
+}
+
+
+@pytest.mark.django_db
+class TestPlacesLookupCache:
+    @pytest.fixture(autouse=True)
+    def setup(self, settings):
+        settings.PLACES_CACHE_TTL = 3600
+        settings.PLACES_NEGATIVE_CACHE_TTL = 60
+        cache.clear()
+        reset_lookup_stats()
+
+    @patch("backend.apps.restaurants.places_cache.fetch_restaurant_details_from_google")
+    def test_repeated_lookup_is_served_from_cache(self, mock_fetch):
+        """
+        Lookups differing only in case and spacing share one entry and
+        reach Google once.
+        """
+        mock_fetch.return_value = PLACE
+
+        assert lookup_restaurant_details("Test Resto", "Berlin") == PLACE
+        assert lookup_restaurant_details("  test   RESTO", "berlin ") == PLACE
+
+        assert mock_fetch.call_count == 1
+        stats = get_lookup_stats()
+        assert stats["misses"] == 1
+        assert stats["hits"] == 1
+        assert stats["hit_ratio"] == 0.5
+
+    @patch("backend.apps.restaurants.places_cache.fetch_restaurant_details_from_google")
+    def test_not_found_is_cached(self, mock_fetch):
+        """
+        A lookup that finds no place is stored as a negative entry.
+        """
+        mock_fetch.return_value = None
+
+        assert lookup_restaurant_details("Nowhere", "Berlin") is None
+        assert lookup_restaurant_details("Nowhere", "Berlin") is None
+
+        assert mock_fetch.call_count == 1
+        assert PlaceLookup.objects.get(key=lookup_key("Nowhere", "Berlin")).data is None
+
+    @patch("backend.apps.restaurants.places_cache.fetch_restaurant_details_from_google")
+    def test_persistent_store_survives_cache_flush(self, mock_fetch):
+        """
+        After the cache backend is flushed, warm data comes from the table.
+        """
+        mock_fetch.return_value = PLACE
+        lookup_restaurant_details("Test Resto", "Berlin")
+        cache.clear()
+
+        assert lookup_restaurant_details("Test Resto", "Berlin") == PLACE
+        assert mock_fetch.call_count == 1
+        assert get_lookup_stats()["db_hits"] == 1
+
+    @patch("backend.apps.restaurants.places_cache.fetch_restaurant_details_from_google")
+    def test_expired_entry_is_refetched(self, mock_fetch):
+        """
+        Negative entries older than the negative TTL are looked up again.
+        """
+        PlaceLookup.objects.create(
+            key=lookup_key("Test Resto", "Berlin"),
+            name="Test Resto",
+            city="Berlin",
+            data=None,
+            fetched_at=timezone.now() - timedelta(seconds=120),
+        )
+        mock_fetch.return_value = PLACE
+
+        assert lookup_restaurant_details("Test Resto", "Berlin") == PLACE
+        assert mock_fetch.call_count == 1
+        assert PlaceLookup.objects.get(key=lookup_key("Test Resto", "Berlin")).data == PLACE
+
+    @patch("backend.apps.restaurants.places_cache.fetch_restaurant_details_from_google")
+    def test_api_errors_are_not_cached(self, mock_fetch):
+        """
+        An outage must not be remembered as "place not found".
+        """
+        mock_fetch.side_effect = PlacesAPIError("down")
+
+        with pytest.raises(PlacesAPIError):
+            lookup_restaurant_details("Test Resto", "Berlin")
+
+        assert not PlaceLookup.objects.exists()
+        mock_fetch.side_effect = None
+        mock_fetch.return_value = PLACE
+        assert lookup_restaurant_details("Test Resto", "Berlin") == PLACE
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_lookups_share_one_request(settings):
+    """
+    A burst of lookups for one restaurant from several workers reaches Google
+    once; the others wait for its result.
+    """
+    settings.PLACES_CACHE_TTL = 3600
+    cache.clear()
+    reset_lookup_stats()
+    calls = []
+
+    def slow_fetch(name, city):
+        calls.append(name)
+        time.sleep(0.3)
+        return PLACE
+
+    workers = 6
+    start = threading.Barrier(workers)
+    results, errors = [], []
+
+    def worker():
+        try:
+            start.wait()
+            results.append(lookup_restaurant_details("Test Resto", "Berlin"))
+        except Exception as exc:
+            errors.append(exc)
+        finally:
+            connection.close()
+
+    with patch("backend.apps.restaurants.places_cache.fetch_restaurant_details_from_google", side_effect=slow_fetch):
+        threads = [threading.Thread(target=worker) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert errors == []
+    assert results == [PLACE] * workers
+    assert len(calls) == 1
+    stats = get_lookup_stats()
+    assert stats["misses"] == 1
+    assert stats["coalesced"] == workers - 1
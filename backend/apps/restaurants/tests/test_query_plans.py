@@ -0,0 +1,83 @@
+import pytest
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from backend.apps.restaurants.models import CityRestaurantPopularity, Restaurant, RestaurantNeighbor
+from backend.apps.restaurants.services import normalize_city
+from backend.apps.restaurants.tasks import retry_stale_enrichments
+
+User = get_user_model()
+
+pytestmark = [
+    pytest.mark.django_db,
+    pytest.mark.skipif(connection.vendor != "postgresql", reason="query plans are PostgreSQL specific"),
+]
+
+
+def explain_without_seqscan(queryset):
+    """
+    EXPLAIN the queryset with sequential scans discouraged, so the tiny test
+    tables still show which index the planner can use.
+    """
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+        return queryset.explain()
+
+
+@pytest.fixture
+def restaurants():
+    """
+    A few hundred restaurants spread over a handful of cities, analyzed so the
+    planner has realistic statistics.
+    """
+    cities = ["Berlin", "Hamburg", "Munich", "Cologne"]
+    Restaurant.objects.bulk_create(
+        Restaurant(name=f"Restaurant {n}", city=cities[n % len(cities)], rating=n % 5)
+        for n in range(400)
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(f"ANALYZE {Restaurant._meta.db_table}")
+
+
+@pytest.mark.usefixtures("restaurants")
+def test_restaurant_name_city_lookup_uses_functional_index():
+    plan = explain_without_seqscan(
+        Restaurant.objects.filter(name__iexact="restaurant 8", city__iexact="berlin")
+    )
+    assert "restaurant_upper_city_name_idx" in plan
+
+
+@pytest.mark.usefixtures("restaurants")
+def test_restaurant_city_fallback_uses_functional_index():
+    plan = explain_without_seqscan(
+        Restaurant.objects.filter(city__iexact="Berlin").order_by("-rating")[:10]
+    )
+    assert "restaurant_upper_city_idx" in plan
+
+
+def test_city_popularity_uses_city_index():
+    plan = explain_without_seqscan(
+        CityRestaurantPopularity.objects.filter(city=normalize_city("Berlin")).order_by("-total_visits")[:10]
+    )
+    assert "popularity_city_visits_idx" in plan
+
+
+@pytest.mark.usefixtures("restaurants")
+def test_neighbors_of_visited_restaurants_use_unique_index():
+    restaurant_ids = list(Restaurant.objects.values_list("id", flat=True)[:3])
+    plan = explain_without_seqscan(RestaurantNeighbor.objects.filter(restaurant_id__in=restaurant_ids))
+    assert "_uniq" in plan
+
+
+def test_retry_sweep_uses_status_index():
+    with CaptureQueriesContext(connection) as queries:
+        retry_stale_enrichments()
+    sweep = next(query["sql"] for query in queries if "FOR UPDATE" in query["sql"])
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute(f"EXPLAIN {sweep}")
+            plan = "\n".join(row[0] for row in cursor.fetchall())
+    assert "enrichment_status_idx" in plan
@@ -0,0 +1,134 @@
+from datetime import date
+from io import StringIO
+
+import numpy as np
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from scipy import sparse
+
+from backend.apps.restaurants.models import (
+    CityRestaurantPopularity,
+    Restaurant,
+    RestaurantNeighbor,
+    UserRestaurantInteraction,
+)
+from backend.apps.restaurants.recommender import cuisine_features, item_neighbors
+from backend.apps.restaurants.services import get_recommendations_for_user
+from backend.apps.restaurants.tasks import train_recommender_task
+from backend.query_budget import assert_max_queries
+
+User = get_user_model()
+
+
+def visit_matrix(visits):
+    users, items = zip(*visits)
+    return sparse.csr_matrix((np.ones(len(visits)), (users, items)), shape=(max(users) + 1, max(items) + 1))
+
+
+class TestItemNeighbors:
+    def test_neighbours_come_from_shared_visitors(self):
+        # Items 0 and 1 share two visitors, 1 and 2 one; 3 shares none.
+        matrix = visit_matrix([(0, 0), (0, 1), (1, 0), (1, 1), (2, 1), (2, 2), (3, 3)])
+
+        items, neighbors, scores = item_neighbors(matrix, k=1, block_size=2)
+
+        assert dict(zip(items.tolist(), neighbors.tolist())) == {0: 1, 1: 0, 2: 1}
+        assert np.all(scores > 0)
+
+    def test_shrinkage_discounts_pairs_with_few_shared_visitors(self):
+        # 0~1 share one visitor (cosine 1.0); 2~3 share three.
+        matrix = visit_matrix([(0, 0), (0, 1), (1, 2), (1, 3), (2, 2), (2, 3), (3, 2), (3, 3)])
+
+        items, neighbors, scores = item_neighbors(matrix, k=1, shrinkage=3)
+
+        score = dict(zip(zip(items.tolist(), neighbors.tolist()), scores.tolist()))
+        assert score[(0, 1)] == pytest.approx(0.25)
+        assert score[(2, 3)] == pytest.approx(0.5)
+
+    def test_cuisine_and_price_break_ties(self):
+        # Item 0 is co-visited equally with 1, 2 and 3.
+        matrix = visit_matrix([(user, item) for user in range(3) for item in range(4)])
+        features = cuisine_features([
+            ["restaurant", "vietnamese"], ["restaurant", "pizza"], ["restaurant", "vietnamese"], ["restaurant"],
+        ])
+        prices = np.array([12.0, 12.0, 12.0, np.nan])
+
+        items, neighbors, _ = item_neighbors(matrix, k=3, features=features, prices=prices, content_weight=0.5)
+
+        assert neighbors[items == 0].tolist() == [2, 1, 3]
+
+    def test_tags_every_restaurant_has_carry_no_weight(self):
+        features = cuisine_features([["restaurant", "pizza"], ["restaurant", "sushi"], ["sushi", "restaurant"]])
+        assert features[0].multiply(features[1]).sum() == 0
+        assert features[1].multiply(features[2]).sum() == pytest.approx(1)
+
+
+@pytest.mark.django_db
+class TestTrainRecommender:
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.users = [
+            User.objects.create_user(email=f"diner{n}@example.com", password="pass", full_name=f"Diner {n}")
+            for n in range(4)
+        ]
+        self.pho = Restaurant.objects.create(name="Pho Saigon", city="Berlin", place_id="pho", cuisine=["vietnamese"])
+        self.banh_mi = Restaurant.objects.create(name="Banh Mi", city="Berlin", place_id="banh", cuisine=["vietnamese"])
+        self.burger = Restaurant.objects.create(name="Burger Bar", city="Berlin", place_id="burger")
+        self.fischbroetchen = Restaurant.objects.create(name="Fischbrötchen", city="Hamburg", place_id="fisch")
+        visits = [
+            (0, self.pho, 3), (0, self.banh_mi, 1),
+            (1, self.pho, 1), (1, self.banh_mi, 2),
+            (2, self.burger, 9), (3, self.burger, 9), (3, self.fischbroetchen, 2),
+        ]
+        for user, restaurant, count in visits:
+            UserRestaurantInteraction.objects.create(
+                user=self.users[user], restaurant=restaurant, visits=count, total_spend=12 * count,
+                last_visited=date(2024, 5, 1),
+            )
+        for restaurant, total in [(self.pho, 4), (self.banh_mi, 3), (self.burger, 18), (self.fischbroetchen, 2)]:
+            CityRestaurantPopularity.objects.create(
+                city=restaurant.city.casefold(), restaurant=restaurant, total_visits=total,
+            )
+
+    def test_neighbours_stay_within_the_city(self):
+        out = StringIO()
+        call_command("train_recommender", stdout=out)
+
+        pairs = set(RestaurantNeighbor.objects.values_list("city", "restaurant", "neighbor"))
+        assert pairs == {
+            ("berlin", self.pho.id, self.banh_mi.id),
+            ("berlin", self.banh_mi.id, self.pho.id),
+        }
+        assert "Stored 2 restaurant neighbours" in out.getvalue()
+
+    def test_similar_restaurants_rank_before_popular_ones(self):
+        newcomer = User.objects.create_user(email="newcomer@example.com", password="pass", full_name="Newcomer")
+        UserRestaurantInteraction.objects.create(
+            user=newcomer, restaurant=self.pho, visits=1, last_visited=date(2024, 6, 1),
+        )
+        assert get_recommendations_for_user(newcomer, "Berlin")[1] == self.burger
+
+        train_recommender_task()
+
+        with assert_max_queries(1):
+            recommendations = get_recommendations_for_user(newcomer, "Berlin")
+        assert recommendations == [self.pho, self.banh_mi, self.burger]
+
+    def test_retraining_replaces_stale_neighbours(self):
+        train_recommender_task()
+        UserRestaurantInteraction.objects.filter(restaurant=self.banh_mi).delete()
+
+        assert train_recommender_task() == 0
+        assert not RestaurantNeighbor.objects.exists()
+
+    def test_retraining_after_a_restaurant_moved(self):
+        train_recommender_task()
+        # Trained under "augsburg" before the "berlin" rows are replaced.
+        Restaurant.objects.filter(id__in=[self.pho.id, self.banh_mi.id]).update(city="Augsburg")
+
+        assert train_recommender_task() == 2
+        assert set(RestaurantNeighbor.objects.values_list("city", "restaurant", "neighbor")) == {
+            ("augsburg", self.pho.id, self.banh_mi.id),
+            ("augsburg", self.banh_mi.id, self.pho.id),
+        }
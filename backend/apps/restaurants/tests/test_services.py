@@ -1,28 +1,28 @@
 from datetime import date
-from unittest.mock import patch
+from io import StringIO
 from django.urls import reverse
 from rest_framework.test import APITestCase
 from rest_framework import status
 from django.contrib.auth import get_user_model
-
-from backend.apps.restaurants.models import Restaurant, UserRestaurantInteraction
+from django.core.management import call_command
+
+from backend.apps.restaurants.clients import PlacesClient
+from backend.apps.restaurants.fake_places import FakePlacesServer
+from backend.apps.restaurants.models import (
+    CityRestaurantPopularity,
+    Restaurant,
+    UserRestaurantInteraction,
+)
 from backend.apps.restaurants.services import (
     fetch_restaurant_details_from_google,
     get_recommendations_for_user,
+    rebuild_city_popularity,
 )
+from backend.apps.restaurants.tasks import update_user_interaction
 
 User = get_user_model()
 
 
-class MockResponse:
-    def __init__(self, json_data: dict, status_code: int):
-        self._json = json_data
-        self.status_code = status_code
-
-    def json(self) -> dict:
-        return self._json
-
-
 class TestRestaurantServices(APITestCase):
     @classmethod
     def setUpTestData(cls):
@@ -80,6 +80,7 @@ class TestRestaurantServices(APITestCase):
             visits=10,
             last_visited=date.today()
         )
+        rebuild_city_popularity()
 
         recommendations = get_recommendations_for_user(self.user, city=self.city)
         recommendation_names = [r.name for r in recommendations]
@@ -88,6 +89,56 @@ class TestRestaurantServices(APITestCase):
         self.assertIn("Sushi Haus", recommendation_names)
         self.assertIn("Taco Town", recommendation_names)
 
+    def test_get_recommendations_ranks_visited_before_popular(self):
+        """
+        The user's own restaurants come first by their visit count, followed by
+        the city's most visited restaurants.
+        """
+        for _ in range(2):
+            update_user_interaction(self.user, self.restaurant2, date.today(), 10)
+        update_user_interaction(self.user, self.restaurant1, date.today(), 10)
+        for _ in range(5):
+            update_user_interaction(self.other_user, self.restaurant3, date.today(), 10)
+
+        recommendations = get_recommendations_for_user(self.user, city="  berlin ")
+
+        self.assertEqual(
+            [r.name for r in recommendations],
+            ["Sushi Haus", "Pasta Palace", "Taco Town"],
+        )
+        self.assertEqual(len(get_recommendations_for_user(self.user, city=self.city, limit=2)), 2)
+
+    def test_update_user_interaction_increments_city_popularity(self):
+        """
+        Each recorded visit bumps the restaurant's per-city popularity row.
+        """
+        update_user_interaction(self.user, self.restaurant1, date.today(), 10)
+        update_user_interaction(self.other_user, self.restaurant1, date.today(), 10)
+
+        popularity = CityRestaurantPopularity.objects.get(restaurant=self.restaurant1)
+        self.assertEqual(popularity.city, "berlin")
+        self.assertEqual(popularity.total_visits, 2)
+
+    def test_rebuild_city_popularity_command(self):
+        """
+        The management command recomputes the table from interactions,
+        discarding stale rows.
+        """
+        UserRestaurantInteraction.objects.create(
+            user=self.user, restaurant=self.restaurant1, visits=4, last_visited=date.today()
+        )
+        UserRestaurantInteraction.objects.create(
+            user=self.other_user, restaurant=self.restaurant1, visits=3, last_visited=date.today()
+        )
+        CityRestaurantPopularity.objects.create(city="berlin", restaurant=self.restaurant2, total_visits=99)
+
+        call_command("rebuild_city_popularity", stdout=StringIO())
+
+        self.assertEqual(
+            list(CityRestaurantPopularity.objects.values_list("restaurant_id", "total_visits")),
+            [(self.restaurant1.id, 7)],
+        )
+
     def test_get_recommendations_with_no_data_fallback(self):
         """
         When user has no interactions, fallback to returning restaurants
@@ -100,32 +151,36 @@ class TestRestaurantServices(APITestCase):
         self.assertGreater(len(recommendations), 0)
         self.assertTrue(all(r.city == self.city for r in recommendations))
 
-    @patch("backend.apps.restaurants.services.requests.get")
-    def test_fetch_restaurant_details_from_google(self, mock_get):
+    def test_fetch_restaurant_details_from_google(self):
         """
         Test that fetching restaurant details from Google Places API
         returns expected parsed data.
         """
-        mock_get.side_effect = [
-            MockResponse({
-                "candidates": [{"place_id": "abc123"}]
-            }, 200),
-            MockResponse({
-                "result": {
-                    "place_id": "abc123",
-                    "name": "Test Resto",
-                    "formatted_address": "123 Main St, Berlin",
-                    "formatted_phone_number": "+49123456789",
-                    "rating": 4.6,
-                    "user_ratings_total": 100,
-                    "types": ["restaurant", "food", "italian"]
-                }
-            }, 200)
-        ]
-
-        result = fetch_restaurant_details_from_google("Test Resto", self.city)
+        with FakePlacesServer() as server:
+            server.add_place(
+                "Test Resto",
+                self.city,
+                place_id="abc123",
+                formatted_address="123 Main St, Berlin",
+                formatted_phone_number="+49123456789",
+                rating=4.6,
+                user_ratings_total=100,
+                types=["restaurant", "food", "italian"],
+            )
+            client = PlacesClient(find_url=server.find_url, details_url=server.details_url)
+            result = fetch_restaurant_details_from_google("Test Resto", self.city, client=client)
 
         self.assertEqual(result["place_id"], "abc123")
         self.assertEqual(result["name"], "Test Resto")
         self.assertEqual(result["city"], self.city)
         self.assertIn("italian", result["cuisine"])
+
+    def test_fetch_restaurant_details_from_google_not_found(self):
+        """
+        An empty candidate list means the place does not exist.
+        """
+        with FakePlacesServer() as server:
+            client = PlacesClient(find_url=server.find_url, details_url=server.details_url)
+            result = fetch_restaurant_details_from_google("Unknown", self.city, client=client)
+
+        self.assertIsNone(result)
@@ -1,14 +1,20 @@
 from unittest.mock import patch
-from datetime import date
+from datetime import date, timedelta
+from io import StringIO
 import pytest
 from decimal import Decimal
 
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.utils import timezone
 
 from backend.apps.receipts.models import Receipt
-from backend.apps.restaurants.models import Restaurant, UserRestaurantInteraction
+from backend.apps.restaurants.models import ReceiptEnrichment, Restaurant, UserRestaurantInteraction
 from backend.apps.restaurants.tasks import (
     fetch_and_create_restaurant_from_receipt,
+    fetch_and_create_restaurants_from_receipts,
+    retry_stale_enrichments,
+    retry_stale_enrichments_task,
     update_user_interaction,
 )
 
@@ -33,7 +39,7 @@ class TestRestaurantTasks:
             image=None,
         )
 
-    @patch("backend.apps.restaurants.tasks.fetch_restaurant_details_from_google")
+    @patch("backend.apps.restaurants.tasks.lookup_restaurant_details")
     def test_fetch_and_create_restaurant_skips_missing_data(self, mock_fetch_google):
         """
         Should skip creating a Restaurant if receipt's city extraction returns None or missing.
@@ -50,7 +56,7 @@ class TestRestaurantTasks:
         assert not Restaurant.objects.filter(name="NoCityResto").exists(), \
             "Restaurant should not be created when city info is missing"
 
-    @patch("backend.apps.restaurants.tasks.fetch_restaurant_details_from_google")
+    @patch("backend.apps.restaurants.tasks.lookup_restaurant_details")
     def test_fetch_and_create_restaurant_creates_new(self, mock_fetch_google):
         """
         Should create a new Restaurant and UserRestaurantInteraction when details fetched successfully.
@@ -100,3 +106,240 @@ class TestRestaurantTasks:
         expected_avg = Decimal("30.0")
         assert abs(interaction.average_spend - expected_avg) < Decimal("0.001"), \
             f"Average spend should be updated to {expected_avg}"
+
+    @patch("backend.apps.restaurants.tasks.lookup_restaurant_details")
+    def test_batch_resolves_each_restaurant_once(self, mock_lookup, django_assert_max_num_queries):
+        """
+        The batched task groups receipts by (name, city), so each distinct
+        restaurant is looked up once, and folds visits per user.
+        """
+        mock_lookup.side_effect = lambda name, city: {
+            "place_id": f"{name}-{city}",
+            "name": name,
+            "city": city,
+        }
+        other_user = User.objects.create_user(
+            email="other-batch@example.com", password="testpass", full_name="Other"
+        )
+        receipts = []
+        for user, name, price in [
+            (self.user, "Test Resto", "20.0"),
+            (self.user, "test resto", "30.0"),
+            (other_user, "Test Resto", "10.0"),
+            (other_user, "Curry Corner", "12.0"),
+        ]:
+            receipts.append(Receipt.objects.create(
+                user=user,
+                restaurant_name=name,
+                address="Hauptstr. 1, 10115 Berlin",
+                date=date.today(),
+                price=Decimal(price),
+                image=None,
+            ))
+
+        with django_assert_max_num_queries(30):
+            fetch_and_create_restaurants_from_receipts([r.id for r in receipts] + [999999])
+
+        assert mock_lookup.call_count == 2
+        resto = Restaurant.objects.get(name="Test Resto")
+        mine = UserRestaurantInteraction.objects.get(user=self.user, restaurant=resto)
+        assert mine.visits == 2
+        assert mine.average_spend == Decimal("25.0")
+        assert UserRestaurantInteraction.objects.get(user=other_user, restaurant=resto).visits == 1
+        assert resto.popularity.get().total_visits == 3
+
+    def test_batch_updates_existing_interactions(self):
+        """
+        Visits in a batch are added on top of the stored stats.
+        """
+        restaurant = Restaurant.objects.create(name="Test Resto", city="Berlin", place_id="abc123")
+        update_user_interaction(self.user, restaurant, date(2024, 1, 1), Decimal("10.0"))
+        receipt = Receipt.objects.create(
+            user=self.user,
+            restaurant_name="Test Resto",
+            address="Hauptstr. 1, 10115 Berlin",
+            date=date.today(),
+            price=Decimal("20.0"),
+            image=None,
+        )
+
+        with patch("backend.apps.restaurants.tasks.lookup_restaurant_details", return_value=None):
+            fetch_and_create_restaurants_from_receipts([receipt.id])
+
+        interaction = UserRestaurantInteraction.objects.get(user=self.user, restaurant=restaurant)
+        assert interaction.visits == 2
+        assert interaction.average_spend == Decimal("15.0")
+        assert interaction.last_visited == date.today()
+
+
+    @patch("backend.apps.restaurants.tasks.lookup_restaurant_details")
+    def test_replayed_enrichment_counts_the_visit_once(self, mock_lookup):
+        """
+        Running the task again for a receipt, alone or in a batch, neither
+        records another visit nor repeats the lookup.
+        """
+        mock_lookup.return_value = {"place_id": "abc123", "name": "Test Resto", "city": "Berlin"}
+
+        fetch_and_create_restaurant_from_receipt(self.receipt.id)
+        fetch_and_create_restaurant_from_receipt(self.receipt.id)
+        fetch_and_create_restaurants_from_receipts([self.receipt.id])
+
+        restaurant = Restaurant.objects.get(place_id="abc123")
+        interaction = UserRestaurantInteraction.objects.get(user=self.user, restaurant=restaurant)
+        assert interaction.visits == 1
+        assert interaction.total_spend == Decimal("20.0")
+        assert restaurant.popularity.get().total_visits == 1
+        assert mock_lookup.call_count == 1
+        state = ReceiptEnrichment.objects.get(receipt=self.receipt)
+        assert state.status == ReceiptEnrichment.Status.DONE
+        assert state.restaurant == restaurant
+        assert state.attempts == 1
+        self.receipt.refresh_from_db()
+        assert self.receipt.restaurant == restaurant
+
+    def test_failed_enrichment_is_retried(self):
+        """
+        Receipts whose restaurant cannot be resolved are marked failed and
+        picked up again by the next run.
+        """
+        with patch("backend.apps.restaurants.tasks.lookup_restaurant_details", return_value=None):
+            fetch_and_create_restaurant_from_receipt(self.receipt.id)
+        state = ReceiptEnrichment.objects.get(receipt=self.receipt)
+        assert state.status == ReceiptEnrichment.Status.FAILED
+        assert state.restaurant is None
+        assert state.error == "restaurant not resolved"
+
+        with patch(
+            "backend.apps.restaurants.tasks.lookup_restaurant_details",
+            return_value={"place_id": "abc123", "name": "Test Resto", "city": "Berlin"},
+        ):
+            fetch_and_create_restaurant_from_receipt(self.receipt.id)
+        state.refresh_from_db()
+        assert state.status == ReceiptEnrichment.Status.DONE
+        assert state.attempts == 2
+        assert UserRestaurantInteraction.objects.get(user=self.user).visits == 1
+
+    def test_new_receipt_starts_pending(self):
+        state = ReceiptEnrichment.objects.get(receipt=self.receipt)
+        assert (state.status, state.attempts) == (ReceiptEnrichment.Status.PENDING, 0)
+
+    def test_receipts_finished_by_another_worker_are_not_counted(self):
+        """
+        A receipt marked done between resolving and recording is left alone.
+        """
+        restaurant = Restaurant.objects.create(name="Test Resto", city="Berlin", place_id="abc123")
+
+        def finish_elsewhere(name, city):
+            ReceiptEnrichment.objects.filter(receipt=self.receipt).update(
+                status=ReceiptEnrichment.Status.DONE, restaurant=restaurant,
+            )
+            return None
+
+        with patch("backend.apps.restaurants.tasks.lookup_restaurant_details", side_effect=finish_elsewhere):
+            fetch_and_create_restaurant_from_receipt(self.receipt.id)
+
+        assert not UserRestaurantInteraction.objects.exists()
+        state = ReceiptEnrichment.objects.get(receipt=self.receipt)
+        assert (state.status, state.restaurant, state.attempts) == (ReceiptEnrichment.Status.DONE, restaurant, 1)
+
+    def test_interrupted_run_counts_as_an_attempt(self):
+        with patch("backend.apps.restaurants.tasks.lookup_restaurant_details", side_effect=SystemExit):
+            with pytest.raises(SystemExit):
+                fetch_and_create_restaurant_from_receipt(self.receipt.id)
+        state = ReceiptEnrichment.objects.get(receipt=self.receipt)
+        assert (state.status, state.attempts) == (ReceiptEnrichment.Status.PENDING, 1)
+
+
+@pytest.mark.django_db
+class TestRetryStaleEnrichments:
+    @pytest.fixture(autouse=True)
+    def setup(self, settings):
+        settings.RECEIPT_ENRICHMENT_RETRY_AFTER = 600
+        settings.RECEIPT_ENRICHMENT_MAX_ATTEMPTS = 3
+        self.user = User.objects.create_user(email="retry@example.com", password="pass", full_name="Retry")
+        self.now = timezone.now()
+
+    def receipt(self, status, attempts, minutes_ago):
+        receipt = Receipt.objects.create(
+            user=self.user, restaurant_name="Test Resto", address="Hauptstr. 1, 10115 Berlin",
+            date=date(2024, 5, 1), price=Decimal("10.00"), image=None,
+        )
+        ReceiptEnrichment.objects.filter(receipt=receipt).update(
+            status=status, attempts=attempts, updated_at=self.now - timedelta(minutes=minutes_ago),
+        )
+        return receipt.id
+
+    def test_queues_due_receipts_with_backoff(self, django_capture_on_commit_callbacks):
+        pending, failed = ReceiptEnrichment.Status.PENDING, ReceiptEnrichment.Status.FAILED
+        lost = self.receipt(pending, 0, minutes_ago=11)
+        retried = self.receipt(failed, 2, minutes_ago=41)
+        self.receipt(pending, 0, minutes_ago=5)  # its batch may still be queued
+        self.receipt(failed, 1, minutes_ago=15)  # backing off for 20 minutes
+        self.receipt(failed, 3, minutes_ago=600)  # given up
+        self.receipt(ReceiptEnrichment.Status.DONE, 1, minutes_ago=600)
+
+        with patch("backend.apps.restaurants.tasks.fetch_and_create_restaurants_from_receipts.delay") as enrich:
+            with django_capture_on_commit_callbacks(execute=True):
+                out = StringIO()
+                call_command("retry_stale_enrichments", stdout=out)
+
+        assert "Queued 2 receipts" in out.getvalue()
+        # Oldest attempt first.
+        enrich.assert_called_once_with([retried, lost])
+
+        # Queued receipts wait for their run rather than being queued again.
+        assert retry_stale_enrichments_task() == 0
+
+    def test_respects_limit_and_batch_size(self, settings, django_capture_on_commit_callbacks):
+        settings.RECEIPT_ENRICHMENT_BATCH_SIZE = 2
+        ids = [self.receipt(ReceiptEnrichment.Status.PENDING, 0, minutes_ago=30 - n) for n in range(5)]
+
+        with patch("backend.apps.restaurants.tasks.fetch_and_create_restaurants_from_receipts.delay") as enrich:
+            with django_capture_on_commit_callbacks(execute=True):
+                assert retry_stale_enrichments(limit=3) == 3
+
+        assert [call.args[0] for call in enrich.call_args_list] == [ids[:2], ids[2:3]]
+
+
+class TestTaskRouting:
+    @pytest.mark.parametrize("task_name, queue", [
+        ("backend.apps.restaurants.tasks.fetch_and_create_restaurant_from_receipt", "enrichment"),
+        ("backend.apps.restaurants.tasks.fetch_and_create_restaurants_from_receipts", "enrichment"),
+        ("backend.apps.receipts.tasks.process_receipt_image", "images"),
+        ("backend.apps.receipts.tasks.process_receipt_images", "images"),
+        ("backend.apps.restaurants.tasks.rebuild_city_popularity_task", "maintenance"),
+        ("backend.apps.restaurants.tasks.reconcile_interactions_task", "maintenance"),
+        ("backend.apps.restaurants.tasks.retry_stale_enrichments_task", "maintenance"),
+        ("backend.apps.restaurants.tasks.train_recommender_task", "maintenance"),
+        ("backend.apps.receipts.tasks.rebuild_receipt_rollups_task", "maintenance"),
+        ("backend.apps.receipts.tasks.import_receipts_task", "default"),
+        ("celery.backend_cleanup", "default"),
+    ])
+    def test_queue(self, task_name, queue):
+        from backend.celery import app
+
+        assert app.amqp.router.route({}, task_name)["queue"].name == queue
+
+    def test_per_queue_options(self):
+        from backend.apps.receipts.tasks import process_receipt_image
+
+        assert fetch_and_create_restaurants_from_receipts.acks_late is True
+        assert fetch_and_create_restaurants_from_receipts.soft_time_limit == 600
+        assert process_receipt_image.acks_late is True
+        assert process_receipt_image.soft_time_limit < process_receipt_image.time_limit
+
+
+@pytest.mark.django_db
+def test_rebuild_city_popularity_task():
+    from backend.apps.restaurants.models import CityRestaurantPopularity
+    from backend.apps.restaurants.tasks import rebuild_city_popularity_task
+
+    user = User.objects.create_user(email="maintenance@example.com", password="pass", full_name="Maintenance")
+    restaurant = Restaurant.objects.create(place_id="p-maint", name="Maint Resto", city="Berlin")
+    UserRestaurantInteraction.objects.create(
+        user=user, restaurant=restaurant, visits=3, total_spend=Decimal("30"), last_visited=date.today(),
+    )
+    CityRestaurantPopularity.objects.all().delete()
+
+    assert rebuild_city_popularity_task.apply().get() == 1
+    assert CityRestaurantPopularity.objects.get(restaurant=restaurant).total_visits == 3
@@ -63,3 +63,82 @@ class FoodRecommendationViewTest(APITestCase):
         self.client.logout()
         response = self.client.get(self.url, {"city": "Berlin"})
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class FoodRecommendationCacheTest(APITestCase):
+    def setUp(self) -> None:
+        from django.core.cache import cache
+
+        cache.clear()
+        self.user = User.objects.create_user(email="cache@example.com", password="x", full_name="Cache")
+        self.other = User.objects.create_user(email="cache-other@example.com", password="x", full_name="Other")
+        self.sushi = Restaurant.objects.create(place_id="s", name="Sushi Haus", city="Berlin", rating=4.0)
+        self.pasta = Restaurant.objects.create(place_id="p", name="Pasta Palace", city="Berlin", rating=4.5)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse("food-recommendations")
+
+    def get(self, city="Berlin", **headers):
+        return self.client.get(self.url, {"city": city}, **headers)
+
+    def visit(self, user, restaurant):
+        from backend.apps.restaurants.tasks import update_user_interaction
+
+        with self.captureOnCommitCallbacks(execute=True):
+            update_user_interaction(user, restaurant, date.today(), 10)
+
+    def test_second_request_is_served_from_cache(self) -> None:
+        first = self.get()
+        with self.assertNumQueries(0):
+            second = self.get(" berlin ")
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second["ETag"], first["ETag"])
+
+    def test_if_none_match_returns_304(self) -> None:
+        etag = self.get()["ETag"]
+        with self.assertNumQueries(0):
+            response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH='"stale"').status_code, status.HTTP_200_OK)
+
+    def test_visit_in_city_invalidates_everyone_there(self) -> None:
+        etag = self.get()["ETag"]
+        hamburg_etag = self.get("Hamburg")["ETag"]
+
+        self.visit(self.other, self.sushi)
+
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[0]["name"], "Sushi Haus")
+        self.assertEqual(self.get("Hamburg", HTTP_IF_NONE_MATCH=hamburg_etag).status_code, 304)
+
+    def test_restaurant_update_invalidates_city(self) -> None:
+        etag = self.get()["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sushi.rating = 5.0
+            self.sushi.save()
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[0]["name"], "Sushi Haus")
+
+    def test_restaurant_moving_invalidates_both_cities(self) -> None:
+        berlin_etag = self.get()["ETag"]
+        hamburg_etag = self.get("Hamburg")["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sushi.city = "Hamburg"
+            self.sushi.save()
+
+        response = self.get(HTTP_IF_NONE_MATCH=berlin_etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([restaurant["name"] for restaurant in response.data], ["Pasta Palace"])
+        response = self.get("Hamburg", HTTP_IF_NONE_MATCH=hamburg_etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([restaurant["name"] for restaurant in response.data], ["Sushi Haus"])
+
+    def test_evicted_version_does_not_revive_old_etag(self) -> None:
+        from django.core.cache import cache
+
+        etag = self.get()["ETag"]
+        cache.clear()
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
@@ -3,18 +3,36 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import status
 
+from .recommendation_cache import get_cached_payload, recommendation_key, set_cached_payload
 from .serializers import RestaurantSerializer
 from .services import get_recommendations_for_user
 
+RECOMMENDATION_LIMIT = 10
+
 
 class FoodRecommendationView(APIView):
     permission_classes = [IsAuthenticated]
+    query_budget = 5
 
     def get(self, request):
         city = request.query_params.get('city')
         if not city:
             return Response({"error": "City is required"}, status=status.HTTP_400_BAD_REQUEST)
+        city = city.strip()
+
+        cache_key, etag = recommendation_key(request.user.id, city, RECOMMENDATION_LIMIT)
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if etag in self.if_none_match(request):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        payload = get_cached_payload(cache_key)
+        if payload is None:
+            recommendations = get_recommendations_for_user(request.user, city, limit=RECOMMENDATION_LIMIT)
+            payload = RestaurantSerializer(recommendations, many=True).data
+            set_cached_payload(cache_key, payload)
+        return Response(payload, status=status.HTTP_200_OK, headers=headers)
 
-        recommendations = get_recommendations_for_user(request.user, city.strip())
-        serializer = RestaurantSerializer(recommendations, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+    @staticmethod
+    def if_none_match(request):
+        header = request.headers.get("If-None-Match", "")
+        return {tag.strip().removeprefix("W/") for tag in header.split(",") if tag.strip()}
@@ -4,3 +4,6 @@ class UsersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'backend.apps.users'
     label = 'users' 
+
+    def ready(self):
+        import backend.apps.users.signals
@@ -0,0 +1,15 @@
+from django.contrib.auth.backends import ModelBackend
+
+from .cache import get_cached_user
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ``ModelBackend`` that serves the per-request session user lookup from the
+    cache instead of the database. Cached users are dropped whenever the user
+    is saved or deleted. Sessions created by the plain ``ModelBackend`` are
+    moved over to this one as they are loaded (see ``sessions.SessionStore``).
+    """
+
+    def get_user(self, user_id):
+        return get_cached_user(user_id, super().get_user)
@@ -0,0 +1,102 @@
+"""
+Per-user object cache for session authentication, plus hit/miss counters
+for the caches that sit in front of every authenticated request.
+
+Counters are kept in process and added to shared cache counters every
+``CACHE_STATS_FLUSH_EVERY`` events, so counting does not add a cache round
+trip to each request.
+"""
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+
+STATS_PREFIX = "cache:stats"
+STATS_NAMES = ("users", "sessions")
+
+
+def _cache():
+    return caches[settings.USER_CACHE_ALIAS]
+
+
+class CacheStats:
+    def __init__(self, flush_every):
+        self.flush_every = flush_every
+        self.pending = Counter()
+        self.events = 0
+        self.lock = threading.Lock()
+
+    def record(self, name, hit):
+        with self.lock:
+            self.pending[f"{name}:{'hits' if hit else 'misses'}"] += 1
+            self.events += 1
+            if self.events < self.flush_every:
+                return
+            pending, self.pending, self.events = self.pending, Counter(), 0
+        self._write(pending)
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending, self.events = self.pending, Counter(), 0
+        self._write(pending)
+
+    def _write(self, pending):
+        cache = _cache()
+        for counter, amount in pending.items():
+            key = f"{STATS_PREFIX}:{counter}"
+            cache.add(key, 0, timeout=None)
+            try:
+                cache.incr(key, amount)
+            except ValueError:
+                # Evicted between add() and incr(); losing a few ticks is fine.
+                pass
+
+
+cache_stats = CacheStats(flush_every=settings.CACHE_STATS_FLUSH_EVERY)
+
+
+def get_cache_stats():
+    """
+    ``{name: {"hits", "misses", "hit_ratio"}}`` for the user and session
+    caches, across all processes that have flushed their counters.
+    """
+    cache_stats.flush()
+    keys = [f"{STATS_PREFIX}:{name}:{kind}" for name in STATS_NAMES for kind in ("hits", "misses")]
+    values = _cache().get_many(keys)
+    stats = {}
+    for name in STATS_NAMES:
+        hits = values.get(f"{STATS_PREFIX}:{name}:hits", 0)
+        misses = values.get(f"{STATS_PREFIX}:{name}:misses", 0)
+        total = hits + misses
+        stats[name] = {"hits": hits, "misses": misses, "hit_ratio": hits / total if total else 0.0}
+    return stats
+
+
+def reset_cache_stats():
+    cache_stats.flush()
+    _cache().delete_many([f"{STATS_PREFIX}:{name}:{kind}" for name in STATS_NAMES for kind in ("hits", "misses")])
+
+
+def user_cache_key(user_id):
+    return f"auth:user:{user_id}"
+
+
+def get_cached_user(user_id, load):
+    """
+    User ``user_id`` from the cache, falling back to ``load(user_id)`` and
+    caching what it returns.
+    """
+    cache = _cache()
+    key = user_cache_key(user_id)
+    user = cache.get(key)
+    cache_stats.record("users", user is not None)
+    if user is None:
+        user = load(user_id)
+        if user is not None:
+            cache.set(key, user, timeout=settings.USER_CACHE_TTL)
+    return user
+
+
+def invalidate_cached_user(user_id):
+    _cache().delete(user_cache_key(user_id))
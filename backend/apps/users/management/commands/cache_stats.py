@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from backend.apps.users.cache import get_cache_stats, reset_cache_stats
+
+
+class Command(BaseCommand):
+    help = "Show hit/miss counters for the session and authenticated-user caches."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--reset",
+            action="store_true",
+            help="Reset the counters after printing them.",
+        )
+
+    def handle(self, *args, **options):
+        for name, stats in get_cache_stats().items():
+            self.stdout.write(
+                f"{name}: hits={stats['hits']} misses={stats['misses']} hit_ratio={stats['hit_ratio']:.2%}"
+            )
+        if options["reset"]:
+            reset_cache_stats()
+            self.stdout.write(self.style.SUCCESS("Counters reset."))
@@ -0,0 +1,32 @@
+from django.contrib.auth import BACKEND_SESSION_KEY
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+
+from .cache import cache_stats
+
+# Authentication backends that sessions may still name, and the backend
+# that now handles their users.
+LEGACY_AUTH_BACKENDS = {
+    "django.contrib.auth.backends.ModelBackend": "backend.apps.users.backends.CachedModelBackend",
+}
+
+
+class SessionStore(CachedDBStore):
+    """
+    ``cached_db`` sessions that count how many loads the cache answered.
+    Sessions that name a backend from ``LEGACY_AUTH_BACKENDS`` are rewritten
+    to its replacement, so the old backend need not stay configured.
+    """
+
+    def load(self):
+        self._loaded_from_db = False
+        data = super().load()
+        cache_stats.record("sessions", not self._loaded_from_db)
+        backend = LEGACY_AUTH_BACKENDS.get(data.get(BACKEND_SESSION_KEY))
+        if backend is not None:
+            data[BACKEND_SESSION_KEY] = backend
+            self.modified = True
+        return data
+
+    def _get_session_from_db(self):
+        self._loaded_from_db = True
+        return super()._get_session_from_db()
@@ -0,0 +1,16 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import invalidate_cached_user
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def drop_cached_user(sender, instance, **kwargs):
+    invalidate_cached_user(instance.pk)
+    # Again after commit, in case a request re-cached the old row meanwhile.
+    transaction.on_commit(lambda: invalidate_cached_user(instance.pk))
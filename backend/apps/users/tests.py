@@ -48,3 +48,197 @@ class TestUserAuthAPI:
         response = self.client.post(self.login_url, data)
         assert response.status_code == status.HTTP_200_OK
         assert "message" in response.data
+
+
+def redis_cache_settings():
+    """
+    A Redis cache for the tests, backed by in-process fakeredis.
+    """
+    import fakeredis
+
+    return {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": "redis://fakeredis:6379/0",
+        "KEY_PREFIX": "test",
+        "OPTIONS": {"connection_class": fakeredis.FakeConnection},
+    }
+
+
+@pytest.mark.django_db
+class TestCachedSessionAuth:
+    @pytest.fixture(autouse=True)
+    def redis_cache(self, settings):
+        from django.core.cache import cache
+        from backend.apps.users.cache import cache_stats
+
+        settings.CACHES = {"default": redis_cache_settings()}
+        cache.clear()
+        cache_stats.flush()
+        cache_stats.flush_every = 1
+        yield
+        cache_stats.flush_every = settings.CACHE_STATS_FLUSH_EVERY
+        cache.clear()
+
+    def setup_method(self):
+        self.client = APIClient()
+        self.password = "StrongPass123!"
+        self.user = User.objects.create_user(email="cached@example.com", full_name="Cached", password=self.password)
+        self.url = "/api/recommendations/?city=Berlin"
+
+    def login(self):
+        response = self.client.post("/api/auth/login/", {"email": self.user.email, "password": self.password})
+        assert response.status_code == status.HTTP_200_OK
+
+    def test_session_and_user_served_from_cache(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        self.login()
+        assert self.client.get(self.url).status_code == status.HTTP_200_OK
+        with CaptureQueriesContext(connection) as queries:
+            assert self.client.get(self.url).status_code == status.HTTP_200_OK
+        tables = " ".join(query["sql"] for query in queries.captured_queries)
+        assert "django_session" not in tables
+        assert "users_user" not in tables
+
+    def test_user_save_invalidates_cached_user(self):
+        from backend.apps.users.backends import CachedModelBackend
+
+        backend = CachedModelBackend()
+        assert backend.get_user(self.user.id).full_name == "Cached"
+        self.user.full_name = "Renamed"
+        self.user.save()
+        assert backend.get_user(self.user.id).full_name == "Renamed"
+
+    def test_password_change_ends_cached_sessions(self):
+        self.login()
+        assert self.client.get(self.url).status_code == status.HTTP_200_OK
+        self.user.set_password("AnotherPass456!")
+        self.user.save()
+        assert self.client.get(self.url).status_code == status.HTTP_403_FORBIDDEN
+
+    def test_wrong_password_checked_once(self):
+        from unittest.mock import patch
+        from django.contrib.auth.backends import ModelBackend
+
+        with patch.object(ModelBackend, "authenticate", autospec=True, return_value=None) as authenticate:
+            response = self.client.post("/api/auth/login/", {"email": self.user.email, "password": "wrong"})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert authenticate.call_count == 1
+
+    def test_sessions_of_the_plain_model_backend_still_work(self):
+        from django.conf import settings
+        from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+        from django.contrib.sessions.models import Session
+        from backend.apps.users.sessions import SessionStore
+
+        session = SessionStore()
+        session[SESSION_KEY] = str(self.user.pk)
+        session[BACKEND_SESSION_KEY] = "django.contrib.auth.backends.ModelBackend"
+        session[HASH_SESSION_KEY] = self.user.get_session_auth_hash()
+        session.create()
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+
+        assert self.client.get(self.url).status_code == status.HTTP_200_OK
+        stored = Session.objects.get(session_key=session.session_key).get_decoded()
+        assert stored[BACKEND_SESSION_KEY] == "backend.apps.users.backends.CachedModelBackend"
+
+    def test_cache_stats(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from backend.apps.users.cache import get_cache_stats
+
+        self.login()
+        for _ in range(3):
+            self.client.get(self.url)
+        stats = get_cache_stats()
+        assert stats["users"]["hits"] >= 2
+        assert stats["sessions"]["hits"] >= 2
+        assert 0 < stats["users"]["hit_ratio"] <= 1
+
+        out = StringIO()
+        call_command("cache_stats", "--reset", stdout=out)
+        assert "users: hits=" in out.getvalue()
+        assert get_cache_stats()["users"]["hits"] == 0
+
+
+@pytest.mark.django_db
+class TestTokenAuth:
+    @pytest.fixture(autouse=True)
+    def clear_cache(self, monkeypatch):
+        from django.core.cache import cache
+        from rest_framework_simplejwt.views import TokenViewBase
+
+        monkeypatch.setattr(TokenViewBase, "throttle_classes", [])
+        cache.clear()
+        yield
+        cache.clear()
+
+    def setup_method(self):
+        self.client = APIClient()
+        self.password = "StrongPass123!"
+        self.user = User.objects.create_user(email="token@example.com", full_name="Token User", password=self.password)
+        self.token_url = "/api/auth/token/"
+        self.refresh_url = "/api/auth/token/refresh/"
+        self.logout_url = "/api/auth/token/logout/"
+        self.receipts_url = "/api/receipts/"
+
+    def obtain(self):
+        response = self.client.post(self.token_url, {"email": self.user.email, "password": self.password})
+        assert response.status_code == status.HTTP_200_OK
+        return response.data
+
+    def test_access_token_carries_claims(self):
+        from rest_framework_simplejwt.tokens import AccessToken
+
+        access = AccessToken(self.obtain()["access"])
+        assert access["user_id"] == str(self.user.id)
+        assert access["email"] == self.user.email
+        assert access["full_name"] == "Token User"
+
+    def test_wrong_password_rejected(self):
+        response = self.client.post(self.token_url, {"email": self.user.email, "password": "wrong"})
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_bearer_request_skips_session_and_user_queries(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.obtain()['access']}")
+        assert self.client.get(self.receipts_url).status_code == status.HTTP_200_OK
+        with CaptureQueriesContext(connection) as queries:
+            assert self.client.get(self.receipts_url).status_code == status.HTTP_200_OK
+        sql = " ".join(query["sql"] for query in queries.captured_queries)
+        assert "django_session" not in sql
+        assert 'FROM "users_user"' not in sql
+        assert "Set-Cookie" not in self.client.get(self.receipts_url).headers
+
+    def test_refresh_rotates_and_blocks_used_token(self):
+        tokens = self.obtain()
+        response = self.client.post(self.refresh_url, {"refresh": tokens["refresh"]})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["refresh"] != tokens["refresh"]
+
+        again = self.client.post(self.refresh_url, {"refresh": tokens["refresh"]})
+        assert again.status_code == status.HTTP_401_UNAUTHORIZED
+
+        rotated = self.client.post(self.refresh_url, {"refresh": response.data["refresh"]})
+        assert rotated.status_code == status.HTTP_200_OK
+
+    def test_logout_blocks_refresh_token(self):
+        tokens = self.obtain()
+        assert self.client.post(self.logout_url, {"refresh": tokens["refresh"]}).status_code == status.HTTP_200_OK
+        response = self.client.post(self.refresh_url, {"refresh": tokens["refresh"]})
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_password_change_revokes_tokens(self):
+        tokens = self.obtain()
+        self.user.set_password("AnotherPass456!")
+        self.user.save()
+
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+        response = self.client.get(self.receipts_url)
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+        self.client.credentials()
+        response = self.client.post(self.refresh_url, {"refresh": tokens["refresh"]})
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
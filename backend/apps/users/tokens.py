@@ -0,0 +1,142 @@
+"""
+JWT access/refresh tokens for API clients that do not keep a session.
+
+Access tokens are short-lived and carry the user id, email and name, so an
+authenticated request needs neither the session table nor, once the user is
+cached, the users table. Refresh tokens are rotated on every use; a used or
+logged-out refresh token is kept in a cache blocklist until it would have
+expired anyway.
+"""
+import time
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework import serializers
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken, TokenError
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .cache import get_cached_user
+
+BLOCKLIST_PREFIX = "jwt:blocklist"
+
+
+def _cache():
+    return caches[settings.JWT_BLOCKLIST_CACHE_ALIAS]
+
+
+def _blocklist_key(jti):
+    return f"{BLOCKLIST_PREFIX}:{jti}"
+
+
+def add_user_claims(token, user):
+    token["email"] = user.email
+    token["full_name"] = user.full_name
+    if api_settings.CHECK_REVOKE_TOKEN:
+        token[api_settings.REVOKE_TOKEN_CLAIM] = get_md5_hash_password(user.password)
+    return token
+
+
+def get_token_user(user_id):
+    """
+    Active user ``user_id``, served from the user cache, or ``None``.
+    """
+    return get_cached_user(user_id, ModelBackend().get_user)
+
+
+def check_token_user(token):
+    """
+    The user a validated token belongs to. Tokens issued before the user's
+    last password change are rejected.
+    """
+    try:
+        user_id = token[api_settings.USER_ID_CLAIM]
+    except KeyError:
+        raise InvalidToken(_("Token contained no recognizable user identification"))
+    user = get_token_user(user_id)
+    if user is None:
+        raise AuthenticationFailed(_("User not found"), code="user_not_found")
+    if api_settings.CHECK_REVOKE_TOKEN and token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(
+        user.password
+    ):
+        raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+    return user
+
+
+class LunchLogRefreshToken(RefreshToken):
+    """
+    Refresh token checked against the cache blocklist instead of
+    simplejwt's database tables.
+    """
+
+    def verify(self, *args, **kwargs):
+        self.check_blacklist()
+        super().verify(*args, **kwargs)
+
+    def check_blacklist(self):
+        if _cache().get(_blocklist_key(self.payload[api_settings.JTI_CLAIM])) is not None:
+            raise TokenError(_("Token is blacklisted"))
+
+    def blacklist(self):
+        """
+        Block this token until it expires. Returns ``False`` if it was already
+        blocked, so of two concurrent rotations only one succeeds.
+        """
+        timeout = max(int(self.payload["exp"] - time.time()), 1)
+        return _cache().add(_blocklist_key(self.payload[api_settings.JTI_CLAIM]), 1, timeout=timeout)
+
+    @classmethod
+    def for_user(cls, user):
+        return add_user_claims(super().for_user(user), user)
+
+
+class TokenPairSerializer(TokenObtainPairSerializer):
+    token_class = LunchLogRefreshToken
+
+
+class TokenRefreshSerializer(serializers.Serializer):
+    """
+    Exchange a refresh token for a new access token and a new refresh token.
+    The old refresh token is blocked.
+    """
+    refresh = serializers.CharField(write_only=True)
+
+    def validate(self, attrs):
+        try:
+            refresh = LunchLogRefreshToken(attrs["refresh"])
+        except TokenError as e:
+            raise InvalidToken(e.args[0])
+        user = check_token_user(refresh)
+        if not refresh.blacklist():
+            raise InvalidToken(_("Token is blacklisted"))
+
+        refresh.set_jti()
+        refresh.set_exp()
+        refresh.set_iat()
+        add_user_claims(refresh, user)
+        return {"access": str(refresh.access_token), "refresh": str(refresh)}
+
+
+class TokenLogoutSerializer(serializers.Serializer):
+    refresh = serializers.CharField(write_only=True)
+
+    def validate(self, attrs):
+        try:
+            LunchLogRefreshToken(attrs["refresh"]).blacklist()
+        except TokenError as e:
+            raise InvalidToken(e.args[0])
+        return {}
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    Bearer token authentication that loads the user through the user cache.
+    """
+
+    def get_user(self, validated_token):
+        return check_token_user(validated_token)
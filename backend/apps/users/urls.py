@@ -1,8 +1,13 @@
 from django.urls import path,include
-from backend.apps.users.views import SignupView, LoginView, set_csrf_token
+from backend.apps.users.views import (
+    SignupView, LoginView, set_csrf_token, TokenObtainView, TokenRefreshView, TokenLogoutView,
+)
 
 urlpatterns = [
     path("signup/", SignupView.as_view(), name="signup"),
     path("login/", LoginView.as_view(), name="login"),
     path('csrf/', set_csrf_token,name="set-csrf"),
+    path("token/", TokenObtainView.as_view(), name="token-obtain"),
+    path("token/refresh/", TokenRefreshView.as_view(), name="token-refresh"),
+    path("token/logout/", TokenLogoutView.as_view(), name="token-logout"),
 ]
@@ -7,6 +7,8 @@ from .serializers import SignupSerializer, LoginSerializer
 from rest_framework.permissions import AllowAny
 from django.views.decorators.csrf import ensure_csrf_cookie
 from rest_framework.decorators import api_view
+from rest_framework_simplejwt.views import TokenViewBase
+from .tokens import TokenLogoutSerializer, TokenPairSerializer, TokenRefreshSerializer
 
 User = get_user_model()
 
@@ -39,4 +41,19 @@ class LoginView(APIView):
 @api_view(['GET'])
 @ensure_csrf_cookie
 def set_csrf_token(request):
-    return Response({'message': 'CSRF cookie set'})
\ No newline at end of file
+    return Response({'message': 'CSRF cookie set'})
+
+
+class TokenObtainView(TokenViewBase):
+    """
+    Email/password login for token clients: returns an access and a refresh token.
+    """
+    serializer_class = TokenPairSerializer
+
+
+class TokenRefreshView(TokenViewBase):
+    serializer_class = TokenRefreshSerializer
+
+
+class TokenLogoutView(TokenViewBase):
+    serializer_class = TokenLogoutSerializer
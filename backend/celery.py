@@ -1,6 +1,8 @@
 import os
 from celery import Celery
 
+from backend.metrics import connect_celery_signals
+
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', os.getenv('DJANGO_SETTINGS_MODULE', 'backend.settings.dev'))
 
 app = Celery('backend')
@@ -9,5 +11,7 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 
 app.autodiscover_tasks()
 
+connect_celery_signals()
+
 app.conf.enable_utc = True
 app.conf.timezone = 'UTC' 
@@ -0,0 +1,182 @@
+"""
+Always-on Prometheus metrics: request latency and database work per view,
+Celery task duration, outcomes, retries and queue lag, outbound Google Places
+calls and object storage uploads.
+
+Each measurement is a couple of ``perf_counter`` calls and a histogram
+update, so the instrumentation stays on in production; Sentry tracing is
+for sampled deep dives. Metrics are served at ``/metrics``. With several
+worker processes (gunicorn, Celery prefork) set ``PROMETHEUS_MULTIPROC_DIR``
+to a shared empty directory so every process reports into it.
+"""
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+logger = logging.getLogger(__name__)
+
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144)
+
+REQUEST_LATENCY = Histogram(
+    "lunchlog_http_request_duration_seconds", "Request latency by view.", ["view", "method", "status"],
+)
+REQUEST_QUERIES = Histogram(
+    "lunchlog_http_request_db_queries", "Database queries per request.", ["view"], buckets=QUERY_COUNT_BUCKETS,
+)
+REQUEST_DB_TIME = Histogram(
+    "lunchlog_http_request_db_duration_seconds", "Time spent in database queries per request.", ["view"],
+)
+TASK_DURATION = Histogram(
+    "lunchlog_celery_task_duration_seconds", "Celery task run time.", ["task", "state"],
+)
+TASK_RETRIES = Counter("lunchlog_celery_task_retries", "Celery task retries.", ["task"])
+TASK_QUEUE_LAG = Histogram(
+    "lunchlog_celery_task_queue_lag_seconds", "Time from publishing a task to a worker starting it.", ["task"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900),
+)
+PLACES_LATENCY = Histogram(
+    "lunchlog_places_request_duration_seconds", "Google Places API request latency.", ["endpoint"],
+)
+PLACES_ERRORS = Counter("lunchlog_places_request_errors", "Failed Google Places API requests.", ["endpoint", "reason"])
+STORAGE_LATENCY = Histogram(
+    "lunchlog_storage_operation_duration_seconds", "Object storage operation latency.", ["operation"],
+)
+
+
+@contextmanager
+def timed(histogram, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.labels(**labels).observe(time.perf_counter() - start)
+
+
+class _QueryTimer:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - start
+
+
+class MetricsMiddleware:
+    """
+    Latency, query count and query time per resolved view. Requests that do
+    not resolve to a view share one label, so scans cannot blow up the
+    number of series.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+        queries = _QueryTimer()
+        start = time.perf_counter()
+        with connection.execute_wrapper(queries):
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - start
+
+        match = getattr(request, "resolver_match", None)
+        view = match.view_name if match else "unmatched"
+        REQUEST_LATENCY.labels(view=view, method=request.method, status=response.status_code).observe(elapsed)
+        REQUEST_QUERIES.labels(view=view).observe(queries.count)
+        REQUEST_DB_TIME.labels(view=view).observe(queries.seconds)
+        return response
+
+
+def get_registry():
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint. Requires ``Authorization: Bearer
+    <METRICS_TOKEN>``; without a configured token it is only served with
+    ``DEBUG`` on, so a deployment never publishes metrics by accident.
+    """
+    token = settings.METRICS_TOKEN
+    if not token:
+        if not settings.DEBUG:
+            return HttpResponseForbidden()
+    elif request.headers.get("Authorization") != f"Bearer {token}":
+        return HttpResponseForbidden()
+    return HttpResponse(generate_latest(get_registry()), content_type=CONTENT_TYPE_LATEST)
+
+
+# Celery -----------------------------------------------------------------------
+
+_task_started = {}
+
+
+def _task_published(headers=None, **kwargs):
+    if headers is not None:
+        headers.setdefault("published_at", time.time())
+
+
+def _task_prerun(task_id=None, task=None, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+    published_at = getattr(task.request, "published_at", None)
+    if published_at:
+        TASK_QUEUE_LAG.labels(task=task.name).observe(max(time.time() - published_at, 0))
+
+
+def _task_postrun(task_id=None, task=None, state=None, **kwargs):
+    start = _task_started.pop(task_id, None)
+    if start is not None:
+        TASK_DURATION.labels(task=task.name, state=state or "UNKNOWN").observe(time.perf_counter() - start)
+
+
+def _task_retry(sender=None, **kwargs):
+    TASK_RETRIES.labels(task=sender.name).inc()
+
+
+def _worker_ready(**kwargs):
+    port = settings.METRICS_WORKER_PORT
+    if port:
+        from prometheus_client import start_http_server
+
+        start_http_server(port, registry=get_registry())
+        logger.info(f"Serving worker metrics on port {port}")
+
+
+def _worker_process_exit(pid=None, **kwargs):
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid or os.getpid())
+
+
+def connect_celery_signals():
+    from celery import signals
+
+    signals.before_task_publish.connect(_task_published, weak=False)
+    signals.task_prerun.connect(_task_prerun, weak=False)
+    signals.task_postrun.connect(_task_postrun, weak=False)
+    signals.task_retry.connect(_task_retry, weak=False)
+    signals.worker_ready.connect(_worker_ready, weak=False)
+    signals.worker_process_shutdown.connect(_worker_process_exit, weak=False)
@@ -0,0 +1,157 @@
+"""
+Per-request query budgets and N+1 detection.
+
+``QueryBudgetMiddleware`` records every query a request runs. Views declare
+how many they may use with a ``query_budget`` attribute (an int, or a dict
+keyed by viewset action) or the ``query_budget`` decorator. A request that
+goes over its budget, or that runs the same SQL shape at least
+``QUERY_REPEAT_THRESHOLD`` times (a loop issuing one query per row), is
+logged, or raises ``QueryBudgetExceeded`` when ``QUERY_BUDGET_RAISE`` is set,
+as it is in development and tests. Views whose queries scale with their
+input by design (the receipt export) declare ``EXEMPT`` and are not
+checked at all.
+
+``assert_max_queries`` applies the same checks to a block of test code.
+
+Queries run while a streaming response is consumed happen after the
+middleware returns and are not counted.
+"""
+import logging
+import re
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*%s(?:\s*,\s*%s)*\s*\)")
+_SAVEPOINT = re.compile(r"^\s*(?:SAVEPOINT|RELEASE SAVEPOINT|ROLLBACK TO SAVEPOINT)\b", re.IGNORECASE)
+
+
+# Budget of views that are not checked, not even for repeated queries.
+EXEMPT = "exempt"
+
+
+class QueryBudgetExceeded(Exception):
+    """
+    A request or test block ran more queries than allowed, or repeated one.
+    """
+
+
+def sql_shape(sql):
+    """
+    ``sql`` with literals and ``IN (%s, %s, ...)`` lists collapsed, so the
+    same query for different rows has the same shape.
+    """
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _PLACEHOLDER_LIST.sub("(...)", sql)
+    return " ".join(sql.split())
+
+
+class QueryRecorder:
+    """
+    ``connection.execute_wrapper`` callable that counts queries per shape.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        if not _SAVEPOINT.match(sql):
+            self.shapes[sql_shape(sql)] += 1
+        return execute(sql, params, many, context)
+
+    def repeated(self, threshold=None):
+        """
+        ``[(shape, count)]`` of shapes run at least ``threshold`` times.
+        """
+        threshold = threshold or settings.QUERY_REPEAT_THRESHOLD
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+    def problems(self, budget=None, threshold=None):
+        problems = []
+        if budget is not None and self.count > budget:
+            problems.append(f"{self.count} queries, budget is {budget}")
+        for shape, count in self.repeated(threshold):
+            problems.append(f"N+1: {count}x {shape[:200]}")
+        return problems
+
+
+@contextmanager
+def record_queries():
+    recorder = QueryRecorder()
+    with connection.execute_wrapper(recorder):
+        yield recorder
+
+
+@contextmanager
+def assert_max_queries(budget=None, threshold=None):
+    """
+    Fail if the block runs more than ``budget`` queries or repeats a query
+    shape ``threshold`` times (``QUERY_REPEAT_THRESHOLD`` by default).
+    """
+    with record_queries() as recorder:
+        yield recorder
+    problems = recorder.problems(budget, threshold)
+    if problems:
+        raise AssertionError("; ".join(problems))
+
+
+def query_budget(budget):
+    """
+    Declare the query budget of a function view.
+    """
+    def decorator(view):
+        view.query_budget = budget
+        return view
+    return decorator
+
+
+def view_query_budget(view_func, method):
+    """
+    Budget declared by the view behind ``view_func``: on the function, on the
+    view class, or per action for viewsets.
+    """
+    view_class = getattr(view_func, "cls", None) or getattr(view_func, "view_class", None)
+    budget = getattr(view_func, "query_budget", None)
+    if budget is None and view_class is not None:
+        budget = getattr(view_class, "query_budget", None)
+    if isinstance(budget, dict):
+        action = (getattr(view_func, "actions", None) or {}).get(method.lower())
+        budget = budget.get(action)
+    return budget
+
+
+class QueryBudgetMiddleware:
+    """
+    Enforce view query budgets and report N+1 patterns. List it first so the
+    session and authentication queries are counted too.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request._query_budget = None
+        with record_queries() as recorder:
+            response = self.get_response(request)
+
+        if request._query_budget == EXEMPT:
+            return response
+        problems = recorder.problems(request._query_budget)
+        if problems:
+            message = f"{request.method} {request.path}: {'; '.join(problems)}"
+            if settings.QUERY_BUDGET_RAISE:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._query_budget = view_query_budget(view_func, request.method)
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+from datetime import timedelta
 from pathlib import Path
 import environ
 
@@ -64,6 +65,9 @@ INSTALLED_APPS = DJANGO_APPS + THIRD_PARTY_APPS + LOCAL_APPS
 
 
 MIDDLEWARE = [
+    # First, so that the whole request and every query of it are counted.
+    'backend.metrics.MetricsMiddleware',
+    'backend.query_budget.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -159,8 +163,10 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 AUTH_USER_MODEL = "users.User"
 
 # settings.py
+# Sessions created with the plain ModelBackend are moved to the cached
+# backend when loaded (backend.apps.users.sessions).
 AUTHENTICATION_BACKENDS = [
-    'django.contrib.auth.backends.ModelBackend',
+    'backend.apps.users.backends.CachedModelBackend',
 ]
 
 CELERY_BROKER_URL = env.str("CELERY_BROKER_URL")
@@ -170,6 +176,62 @@ CELERY_RESULT_BACKEND = env.str("CELERY_BROKER_URL")
 
 CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
 
+# Task queues, each served by its own worker profile (docker-compose.yml):
+# - enrichment: waits on Google Places; a thread-pool worker keeps many
+#   lookups in flight. acks_late: ReceiptEnrichment makes replays no-ops.
+# - images: CPU-bound Pillow work on a prefork worker, one task at a time.
+# - maintenance: long table rebuilds, idempotent, so acks_late.
+# - default: everything else, including bulk imports, which are not
+#   acks_late because a replay would insert their rows again.
+# Time limits are enforced by prefork workers; on the thread pool, the Places
+# client timeouts and retry budget bound enrichment instead.
+CELERY_TASK_DEFAULT_QUEUE = "default"
+CELERY_WORKER_PREFETCH_MULTIPLIER = env.int("CELERY_WORKER_PREFETCH_MULTIPLIER", default=1)
+CELERY_TASK_ROUTES = {
+    "backend.apps.restaurants.tasks.fetch_and_create_restaurant_from_receipt": {"queue": "enrichment"},
+    "backend.apps.restaurants.tasks.fetch_and_create_restaurants_from_receipts": {"queue": "enrichment"},
+    "backend.apps.receipts.tasks.process_receipt_image": {"queue": "images"},
+    "backend.apps.receipts.tasks.process_receipt_images": {"queue": "images"},
+    "backend.apps.receipts.tasks.import_receipts_task": {"queue": "default"},
+    "backend.apps.restaurants.tasks.rebuild_city_popularity_task": {"queue": "maintenance"},
+    "backend.apps.restaurants.tasks.reconcile_interactions_task": {"queue": "maintenance"},
+    "backend.apps.restaurants.tasks.retry_stale_enrichments_task": {"queue": "maintenance"},
+    "backend.apps.restaurants.tasks.train_recommender_task": {"queue": "maintenance"},
+    "backend.apps.receipts.tasks.rebuild_receipt_rollups_task": {"queue": "maintenance"},
+}
+CELERY_TASK_ANNOTATIONS = {
+    "backend.apps.restaurants.tasks.fetch_and_create_restaurant_from_receipt": {
+        "acks_late": True, "soft_time_limit": 60, "time_limit": 90,
+    },
+    "backend.apps.restaurants.tasks.fetch_and_create_restaurants_from_receipts": {
+        "acks_late": True, "soft_time_limit": 600, "time_limit": 660,
+    },
+    "backend.apps.receipts.tasks.process_receipt_image": {
+        "acks_late": True, "soft_time_limit": 60, "time_limit": 90,
+    },
+    "backend.apps.receipts.tasks.process_receipt_images": {
+        "acks_late": True, "soft_time_limit": 900, "time_limit": 960,
+    },
+    "backend.apps.receipts.tasks.import_receipts_task": {
+        "soft_time_limit": 3600, "time_limit": 3720,
+    },
+    "backend.apps.restaurants.tasks.rebuild_city_popularity_task": {
+        "acks_late": True, "soft_time_limit": 1800, "time_limit": 1920,
+    },
+    "backend.apps.restaurants.tasks.reconcile_interactions_task": {
+        "acks_late": True, "soft_time_limit": 1800, "time_limit": 1920,
+    },
+    "backend.apps.restaurants.tasks.retry_stale_enrichments_task": {
+        "acks_late": True, "soft_time_limit": 300, "time_limit": 360,
+    },
+    "backend.apps.restaurants.tasks.train_recommender_task": {
+        "acks_late": True, "soft_time_limit": 1800, "time_limit": 1920,
+    },
+    "backend.apps.receipts.tasks.rebuild_receipt_rollups_task": {
+        "acks_late": True, "soft_time_limit": 1800, "time_limit": 1920,
+    },
+}
+
 # Rest Framework Settings =============
 PAGE_SIZE = env("PAGE_SIZE", default=50)
 REST_FRAMEWORK = {
@@ -179,6 +241,9 @@ REST_FRAMEWORK = {
     ),
     "DEFAULT_AUTHENTICATION_CLASSES": (
         'rest_framework.authentication.SessionAuthentication',
+        # Token clients send no session cookie, so the session is never
+        # loaded for them. Listed second to keep 403 for anonymous requests.
+        'backend.apps.users.tokens.CachedJWTAuthentication',
         #'rest_framework.authentication.TokenAuthentication', # Optional if using external services
     ),
     "DEFAULT_PARSER_CLASSES": (
@@ -223,3 +288,133 @@ LOGGING = {
 GOOGLE_API_KEY = env("GOOGLE_API_KEY")
 GOOGLE_PLACES_TEXT_SEARCH_URL = env("GOOGLE_PLACES_TEXT_SEARCH_URL")
 GOOGLE_PLACES_DETAILS_URL = env("GOOGLE_PLACES_DETAILS_URL")
+
+# Google Places lookup cache: positive results are kept for PLACES_CACHE_TTL
+# seconds, "not found" results for PLACES_NEGATIVE_CACHE_TTL seconds.
+PLACES_CACHE_ALIAS = env.str("PLACES_CACHE_ALIAS", default="default")
+PLACES_CACHE_TTL = env.int("PLACES_CACHE_TTL", default=60 * 60 * 24 * 7)
+PLACES_NEGATIVE_CACHE_TTL = env.int("PLACES_NEGATIVE_CACHE_TTL", default=60 * 60)
+# Concurrent lookups of one (name, city) wait for a single Google request;
+# the lock it holds expires after this many seconds.
+PLACES_LOOKUP_LOCK_TIMEOUT = env.int("PLACES_LOOKUP_LOCK_TIMEOUT", default=30)
+
+# Google Places HTTP client: timeouts in seconds, bounded retries with
+# exponential backoff on 429/5xx, and a per-process rate limit (requests/second,
+# 0 disables it).
+PLACES_CONNECT_TIMEOUT = env.float("PLACES_CONNECT_TIMEOUT", default=3.05)
+PLACES_READ_TIMEOUT = env.float("PLACES_READ_TIMEOUT", default=10.0)
+PLACES_MAX_RETRIES = env.int("PLACES_MAX_RETRIES", default=3)
+PLACES_RETRY_BACKOFF = env.float("PLACES_RETRY_BACKOFF", default=0.5)
+PLACES_RETRY_BACKOFF_MAX = env.float("PLACES_RETRY_BACKOFF_MAX", default=8.0)
+PLACES_RATE_LIMIT = env.float("PLACES_RATE_LIMIT", default=10.0)
+PLACES_POOL_MAXSIZE = env.int("PLACES_POOL_MAXSIZE", default=10)
+
+# New receipts are enriched in batches: IDs saved within the window (seconds)
+# are sent as one Celery message, or earlier once the batch size is reached.
+RECEIPT_ENRICHMENT_BATCH_WINDOW = env.float("RECEIPT_ENRICHMENT_BATCH_WINDOW", default=2.0)
+RECEIPT_ENRICHMENT_BATCH_SIZE = env.int("RECEIPT_ENRICHMENT_BATCH_SIZE", default=100)
+# retry_stale_enrichments queues pending and failed receipts again this many
+# seconds after their last attempt, doubling the delay with each attempt, up to
+# RECEIPT_ENRICHMENT_MAX_ATTEMPTS. Keep the delay above the batch task's
+# time_limit so a run still in progress is not queued twice.
+RECEIPT_ENRICHMENT_RETRY_AFTER = env.int("RECEIPT_ENRICHMENT_RETRY_AFTER", default=900)
+RECEIPT_ENRICHMENT_MAX_ATTEMPTS = env.int("RECEIPT_ENRICHMENT_MAX_ATTEMPTS", default=5)
+
+# Receipt image processing: uploaded images are recompressed to JPEG at this
+# quality (capped at RECEIPT_IMAGE_MAX_DIMENSION px) and thumbnailed to each
+# size below (longest edge in px). RECEIPT_LIST_THUMBNAIL is the variant
+# exposed as ``thumbnail_url``.
+RECEIPT_IMAGE_QUALITY = env.int("RECEIPT_IMAGE_QUALITY", default=80)
+RECEIPT_IMAGE_MAX_DIMENSION = env.int("RECEIPT_IMAGE_MAX_DIMENSION", default=2048)
+RECEIPT_THUMBNAIL_SIZES = {
+    "small": 160,
+    "medium": 480,
+    "large": 1024,
+}
+RECEIPT_LIST_THUMBNAIL = "small"
+
+# Direct (presigned) receipt uploads: how long the upload URL stays valid, the
+# extra time allowed to finalize afterwards, the size cap enforced by the
+# bucket policy and on finalize, and the accepted content types.
+RECEIPT_UPLOAD_URL_EXPIRY = env.int("RECEIPT_UPLOAD_URL_EXPIRY", default=900)
+RECEIPT_UPLOAD_FINALIZE_GRACE = env.int("RECEIPT_UPLOAD_FINALIZE_GRACE", default=3600)
+RECEIPT_UPLOAD_MAX_SIZE = env.int("RECEIPT_UPLOAD_MAX_SIZE", default=10 * 1024 * 1024)
+RECEIPT_UPLOAD_CONTENT_TYPES = [
+    "image/jpeg",
+    "image/png",
+    "image/webp",
+]
+
+# Bulk receipt import: rows per chunk (one bulk insert each), how many row
+# errors are reported back and how many HEAD requests per chunk check images
+# under an image prefix at once.
+RECEIPT_IMPORT_CHUNK_SIZE = env.int("RECEIPT_IMPORT_CHUNK_SIZE", default=500)
+RECEIPT_IMPORT_MAX_ERRORS = env.int("RECEIPT_IMPORT_MAX_ERRORS", default=100)
+RECEIPT_IMPORT_IMAGE_LOOKUPS = env.int("RECEIPT_IMPORT_IMAGE_LOOKUPS", default=8)
+
+# Receipt export: rows fetched per round trip from the server-side cursor.
+RECEIPT_EXPORT_CHUNK_SIZE = env.int("RECEIPT_EXPORT_CHUNK_SIZE", default=2000)
+
+# Address parsing: country assumed for bare 4/5-digit postcodes, the
+# postcode gazetteer (defaults to the bundled one; build a full one with
+# ``manage.py build_postcode_gazetteer``) and the parse cache size.
+ADDRESS_DEFAULT_COUNTRY = env.str("ADDRESS_DEFAULT_COUNTRY", default="DE")
+ADDRESS_GAZETTEER_PATH = env.str("ADDRESS_GAZETTEER_PATH", default="")
+ADDRESS_PARSE_CACHE_SIZE = env.int("ADDRESS_PARSE_CACHE_SIZE", default=10000)
+
+# Restaurant name matching: minimum trigram similarity between normalized
+# names for a receipt to be matched to an existing restaurant (above 1
+# disables fuzzy matching).
+RESTAURANT_MATCH_THRESHOLD = env.float("RESTAURANT_MATCH_THRESHOLD", default=0.7)
+
+# Recommendation response cache: serialized payloads per (user, city), expired
+# by version bumps when interactions or restaurants change.
+RECOMMENDATION_CACHE_ALIAS = env.str("RECOMMENDATION_CACHE_ALIAS", default="default")
+RECOMMENDATION_CACHE_TTL = env.int("RECOMMENDATION_CACHE_TTL", default=60 * 60 * 2)
+
+# Sessions are read from the cache and written through to the database. The
+# session user is cached per user id for USER_CACHE_TTL seconds and dropped
+# whenever the user is saved. Hit/miss counters are flushed to the cache
+# every CACHE_STATS_FLUSH_EVERY events (``manage.py cache_stats``).
+SESSION_ENGINE = "backend.apps.users.sessions"
+USER_CACHE_ALIAS = env.str("USER_CACHE_ALIAS", default="default")
+USER_CACHE_TTL = env.int("USER_CACHE_TTL", default=60 * 5)
+CACHE_STATS_FLUSH_EVERY = env.int("CACHE_STATS_FLUSH_EVERY", default=100)
+
+# JWT login next to the session login (/api/auth/token/). Access tokens are
+# short-lived; refresh tokens rotate on every use and used ones are kept in a
+# cache blocklist. Changing the password revokes outstanding tokens.
+SIMPLE_JWT = {
+    "ACCESS_TOKEN_LIFETIME": timedelta(seconds=env.int("JWT_ACCESS_TOKEN_LIFETIME", default=60 * 5)),
+    "REFRESH_TOKEN_LIFETIME": timedelta(seconds=env.int("JWT_REFRESH_TOKEN_LIFETIME", default=60 * 60 * 24 * 7)),
+    "ROTATE_REFRESH_TOKENS": True,
+    "BLACKLIST_AFTER_ROTATION": True,
+    "UPDATE_LAST_LOGIN": True,
+    "CHECK_REVOKE_TOKEN": True,
+    "SIGNING_KEY": env.str("JWT_SIGNING_KEY", default=SECRET_KEY),
+    "AUTH_HEADER_TYPES": ("Bearer",),
+    "TOKEN_OBTAIN_SERIALIZER": "backend.apps.users.tokens.TokenPairSerializer",
+}
+JWT_BLOCKLIST_CACHE_ALIAS = env.str("JWT_BLOCKLIST_CACHE_ALIAS", default="default")
+
+# Query budgets: views declare ``query_budget``; requests over budget or
+# running one SQL shape QUERY_REPEAT_THRESHOLD+ times (N+1) are logged, or
+# raise with QUERY_BUDGET_RAISE (on in development and tests).
+QUERY_BUDGET_RAISE = env.bool("QUERY_BUDGET_RAISE", default=False)
+QUERY_REPEAT_THRESHOLD = env.int("QUERY_REPEAT_THRESHOLD", default=5)
+
+# Prometheus metrics at /metrics (see backend/metrics.py), behind
+# METRICS_TOKEN; without a token they are only served with DEBUG on. Set
+# PROMETHEUS_MULTIPROC_DIR when running several processes; Celery workers
+# serve their own metrics on METRICS_WORKER_PORT (0 = off).
+METRICS_ENABLED = env.bool("METRICS_ENABLED", default=True)
+METRICS_TOKEN = env.str("METRICS_TOKEN", default="")
+METRICS_WORKER_PORT = env.int("METRICS_WORKER_PORT", default=0)
+
+# Offline item-item recommender (restaurants/recommender.py), trained by
+# ``manage.py train_recommender`` / train_recommender_task: neighbours kept
+# per restaurant, how strongly pairs with few shared visitors are shrunk, and
+# the weight of cuisine and price against co-visits.
+RECOMMENDER_NEIGHBORS = env.int("RECOMMENDER_NEIGHBORS", default=20)
+RECOMMENDER_SHRINKAGE = env.float("RECOMMENDER_SHRINKAGE", default=10.0)
+RECOMMENDER_CONTENT_WEIGHT = env.float("RECOMMENDER_CONTENT_WEIGHT", default=0.2)
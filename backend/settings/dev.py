@@ -16,6 +16,9 @@ SECRET_KEY = env.str(
 # ------------------------------------------------------------------------------
 DEBUG = True
 
+# Fail loudly on query budget overruns and N+1 patterns.
+QUERY_BUDGET_RAISE = env.bool("QUERY_BUDGET_RAISE", default=True)
+
 # ------------------------------------------------------------------------------
 # Local Minio setup
 # ------------------------------------------------------------------------------
@@ -33,18 +36,22 @@ AWS_QUERYSTRING_AUTH = False
 
 
 # ------------------------------------------------------------------------------
-# Caching - local memory cache, suitable for development only
+# Caching - the compose Redis, shared by the web and worker containers so
+# invalidation done by a worker is seen by the web process (tests use local
+# memory, see settings/test.py)
 # ------------------------------------------------------------------------------
+# TTL for cache: 2 hours
+CACHE_TTL = 60 * 60 * 2
+
 CACHES = {
     "default": {
-        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
-        "LOCATION": "dev-cache",
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": env.str("REDIS_CACHE_URL", default="redis://redis:6379/1"),
+        "KEY_PREFIX": "lunch-log",
+        "TIMEOUT": CACHE_TTL,
     }
 }
 
-# TTL for cache: 2 hours
-CACHE_TTL = 60 * 60 * 2
-
 # ------------------------------------------------------------------------------
 # Admin URL - easier to change if needed
 # ------------------------------------------------------------------------------
@@ -43,6 +43,22 @@ STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
 # ------------------------------------------------------------------------------
 CACHE_TTL = 60 * 60 * 2  # 2 hours
 
+# Shared by all web and worker processes, so invalidation is seen everywhere.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": env.str("REDIS_CACHE_URL", default="redis://redis:6379/1"),
+        "KEY_PREFIX": "lunch-log",
+        "TIMEOUT": CACHE_TTL,
+        "OPTIONS": {
+            # Fail fast rather than hold requests when Redis is unreachable.
+            "socket_connect_timeout": env.float("REDIS_CACHE_CONNECT_TIMEOUT", default=1.0),
+            "socket_timeout": env.float("REDIS_CACHE_TIMEOUT", default=1.0),
+            "max_connections": env.int("REDIS_CACHE_MAX_CONNECTIONS", default=50),
+        },
+    }
+}
+
 # ------------------------------------------------------------------------------
 # Admin
 # ------------------------------------------------------------------------------
@@ -0,0 +1,11 @@
+from .dev import *
+
+# ------------------------------------------------------------------------------
+# Caching - local memory, so tests need no Redis and start from an empty cache
+# ------------------------------------------------------------------------------
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "test-cache",
+    }
+}
@@ -1,6 +1,8 @@
 from django.contrib import admin
 from django.urls import path, include
 
+from backend.metrics import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
 
@@ -8,4 +10,6 @@ urlpatterns = [
     path('api/auth/', include('backend.apps.users.urls')), 
     path('api/receipts/', include('backend.apps.receipts.urls')), 
     path("api/recommendations/", include("backend.apps.restaurants.urls")),
+
+    path("metrics", metrics_view, name="metrics"),
 ]
@@ -0,0 +1,11 @@
+"""
+Django bootstrap shared by the benchmark scripts.
+"""
+import os
+
+
+def setup_django():
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+    import django
+
+    django.setup()
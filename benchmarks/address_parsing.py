@@ -0,0 +1,98 @@
+"""
+Throughput of receipt address parsing.
+
+Generates a corpus of addresses in the layouts the parser understands, with
+receipts repeating addresses the way real users revisit restaurants, and
+times the previous single-regex extractor against ``parse_address`` with a
+cold and a warm cache.
+
+    python -m benchmarks.address_parsing --count 200000 --unique 20000 [--json out.json]
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import time
+
+from benchmarks._setup import setup_django
+
+
+STREETS = ["Hauptstr.", "Friedrichstraße", "Bahnhofstrasse", "Rue de Rivoli", "Damrak", "Leopoldstr.", "Kantstraße"]
+LAYOUTS = [
+    ("{street} {number}, {postcode} {city}", "DE", [("10115", "14199", "Berlin"), ("80331", "81929", "München")]),
+    ("{street} {number}, {postcode} {city}, Germany", "DE", [("20095", "21149", "Hamburg"), ("50667", "51149", "Köln")]),
+    ("{street} {number}, A-{postcode} {city}", "AT", [("1010", "1239", "Wien")]),
+    ("{street} {number}, {postcode} {city}, Schweiz", "CH", [("8001", "8099", "Zürich")]),
+    ("{number} {street}, {postcode} {city}, France", "FR", [("75001", "75020", "Paris")]),
+    ("{street} {number}, {postcode} AB {city}", "NL", [("1011", "1109", "Amsterdam")]),
+    ("{number} 5th Ave, {city}, NY {postcode}", "US", [("10001", "10282", "New York")]),
+    ("{number} Downing St, {city} SW1A 2AA", "GB", [("", "", "London")]),
+]
+
+
+def make_corpus(count, unique, seed=42):
+    rng = random.Random(seed)
+    addresses = []
+    for _ in range(unique):
+        layout, _, places = rng.choice(LAYOUTS)
+        first, last, city = rng.choice(places)
+        postcode = str(rng.randint(int(first), int(last))).zfill(len(first)) if first else ""
+        addresses.append(layout.format(
+            street=rng.choice(STREETS), number=rng.randint(1, 200), postcode=postcode, city=city,
+        ))
+    # Popular restaurants account for most receipts.
+    weights = [1 / (rank + 1) for rank in range(unique)]
+    return rng.choices(addresses, weights=weights, k=count)
+
+
+def legacy_extract_city(address):
+    match = re.search(r"\b\d{5}\s+([A-Za-zäöüÄÖÜß\s\-]+)", address)
+    if match:
+        return match.group(1).strip()
+    parts = [p.strip() for p in address.split(",")]
+    if len(parts) >= 2:
+        return parts[-2]
+    return None
+
+
+def timed(label, func, corpus):
+    start = time.perf_counter()
+    for address in corpus:
+        func(address)
+    elapsed = time.perf_counter() - start
+    return {"name": label, "addresses": len(corpus), "seconds": round(elapsed, 4), "per_second": round(len(corpus) / elapsed)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=200000, help="Addresses in the corpus.")
+    parser.add_argument("--unique", type=int, default=20000, help="Distinct addresses in the corpus.")
+    parser.add_argument("--json", help="Also write the results to this file.")
+    args = parser.parse_args(argv)
+
+    setup_django()
+    from backend.apps.receipts.address import parse_address, parse_cache_info, reset_gazetteer
+
+    corpus = make_corpus(args.count, args.unique)
+    distinct = list(dict.fromkeys(corpus))
+
+    results = [timed("legacy regex", legacy_extract_city, corpus)]
+    reset_gazetteer()
+    results.append(timed("parse_address, distinct addresses, cold cache", parse_address, distinct))
+    reset_gazetteer()
+    results.append(timed("parse_address, full corpus", parse_address, corpus))
+    results.append(timed("parse_address, full corpus, warm cache", parse_address, corpus))
+    cache = parse_cache_info()
+
+    for result in results:
+        print(f"{result['name']:<48} {result['per_second']:>12,}/s  ({result['seconds']}s)")
+    print(f"cache: {cache.hits} hits, {cache.misses} misses, {cache.currsize}/{cache.maxsize} entries")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"benchmark": "address_parsing", "count": args.count, "unique": args.unique, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
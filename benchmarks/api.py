@@ -0,0 +1,266 @@
+"""
+Latency and query counts of the API and the enrichment task.
+
+Creates a throwaway test database, seeds it (see ``benchmarks.seed``), then
+replays requests in process through the DRF test client as randomly chosen
+users, weighted by how active they are:
+
+- ``receipt_list``: first page of ``/api/receipts/``
+- ``month_filter``: ``/api/receipts/?month=`` for a recent month
+- ``upload``: multipart ``POST /api/receipts/`` with a small JPEG (needs the
+  configured object storage)
+- ``recommendations``: ``/api/recommendations/?city=`` for the user's city
+- ``enrichment``: ``fetch_and_create_restaurants_from_receipts`` over batches
+  of new receipts, with a local fake Places server standing in for Google
+
+Reports p50/p95/p99 latency in milliseconds and queries per call. Celery
+tasks queued by the requests go to an in-memory broker and are not run.
+
+    python -m benchmarks.api --users 200 --receipts 20000 [--json out.json] [--compare old.json]
+"""
+import argparse
+import io
+import json
+import logging
+import math
+import random
+import subprocess
+import sys
+import time
+from datetime import date
+
+from benchmarks._setup import setup_django
+
+SCENARIOS = ("receipt_list", "month_filter", "upload", "recommendations", "enrichment")
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(pct / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[rank]
+
+
+def summarize(name, latencies, queries, **extra):
+    latencies = sorted(latencies)
+    return {
+        "name": name,
+        "calls": len(latencies),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+        "queries_mean": round(sum(queries) / len(queries), 2) if queries else 0.0,
+        "queries_max": max(queries, default=0),
+        **extra,
+    }
+
+
+def measure(call, repeat):
+    """
+    Run ``call`` ``repeat`` times; return per-call latencies and query counts.
+    """
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    latencies, queries = [], []
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            call()
+            latencies.append(time.perf_counter() - start)
+        queries.append(len(captured.captured_queries))
+    return latencies, queries
+
+
+class Clients:
+    """
+    One logged-in API client per user, picked with the users' activity
+    weights.
+    """
+
+    def __init__(self, data, rng):
+        from rest_framework.test import APIClient
+
+        self.data = data
+        self.rng = rng
+        self.clients = {}
+        self.APIClient = APIClient
+
+    def pick(self):
+        user = self.rng.choices(self.data.users, weights=self.data.activity)[0]
+        if user.id not in self.clients:
+            client = self.APIClient()
+            client.force_login(user)
+            self.clients[user.id] = client
+        return user, self.clients[user.id]
+
+
+def check(response):
+    if response.status_code >= 400:
+        raise RuntimeError(f"{response.request['PATH_INFO']} returned {response.status_code}: {response.content[:200]!r}")
+    return response
+
+
+def jpeg_bytes():
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (800, 1200), "white").save(buffer, "JPEG", quality=80)
+    return buffer.getvalue()
+
+
+def run_api(name, data, repeat, rng):
+    from django.core.files.uploadedfile import SimpleUploadedFile
+
+    from benchmarks.seed import address, lunch_price, restaurant_name
+
+    clients = Clients(data, rng)
+    today = date.today()
+    current = today.year * 12 + today.month - 1
+    recent_months = [f"{month // 12}-{month % 12 + 1:02d}" for month in range(current, current - 12, -1)]
+    image = jpeg_bytes() if name == "upload" else None
+
+    def call():
+        user, client = clients.pick()
+        if name == "receipt_list":
+            check(client.get("/api/receipts/"))
+        elif name == "month_filter":
+            check(client.get("/api/receipts/", {"month": rng.choice(recent_months)}))
+        elif name == "recommendations":
+            check(client.get("/api/recommendations/", {"city": data.home_city[user.id]}))
+        elif name == "upload":
+            city = data.home_city[user.id]
+            check(client.post("/api/receipts/", {
+                "date": today.isoformat(), "price": str(lunch_price(rng)),
+                "restaurant_name": restaurant_name(rng), "address": address(rng, city),
+                "image": SimpleUploadedFile("receipt.jpg", image, content_type="image/jpeg"),
+            }, format="multipart"))
+
+    # One untimed call per scenario warms connections and import caches.
+    call()
+    return summarize(name, *measure(call, repeat))
+
+
+def run_enrichment(data, receipts, places_latency):
+    from django.conf import settings
+    from django.core.cache import caches
+
+    from backend.apps.restaurants.clients import reset_places_client
+    from backend.apps.restaurants.fake_places import FakePlacesServer
+    from backend.apps.restaurants.tasks import fetch_and_create_restaurants_from_receipts
+    from benchmarks.seed import new_receipts
+
+    receipt_ids = new_receipts(data, receipts)
+    batch_size = settings.RECEIPT_ENRICHMENT_BATCH_SIZE
+    batches = [receipt_ids[start:start + batch_size] for start in range(0, len(receipt_ids), batch_size)]
+
+    with FakePlacesServer(latency=places_latency, auto_create=True) as server:
+        settings.GOOGLE_PLACES_TEXT_SEARCH_URL = server.find_url
+        settings.GOOGLE_PLACES_DETAILS_URL = server.details_url
+        # The rate limit protects the Google quota; it would only measure
+        # sleeping here.
+        settings.PLACES_RATE_LIMIT = 0
+        caches[settings.PLACES_CACHE_ALIAS].clear()
+        reset_places_client()
+        pending = iter(batches)
+        latencies, queries = measure(lambda: fetch_and_create_restaurants_from_receipts(next(pending)), len(batches))
+        reset_places_client()
+        places_requests = len(server.requests)
+
+    return summarize(
+        "enrichment", latencies, queries,
+        receipts=len(receipt_ids), batch_size=batch_size, places_requests=places_requests,
+    )
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results, baseline=None):
+    previous = {result["name"]: result for result in (baseline or {}).get("results", [])}
+    print(f"{'scenario':<16} {'calls':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'queries':>8}")
+    for result in results:
+        line = (
+            f"{result['name']:<16} {result['calls']:>6} {result['p50_ms']:>9} {result['p95_ms']:>9}"
+            f" {result['p99_ms']:>9} {result['queries_mean']:>8}"
+        )
+        old = previous.get(result["name"])
+        if old:
+            change = (result["p95_ms"] - old["p95_ms"]) / old["p95_ms"] * 100 if old["p95_ms"] else 0.0
+            line += f"   p95 {change:+.1f}%, queries {result['queries_mean'] - old['queries_mean']:+.2f}"
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200, help="Users to seed.")
+    parser.add_argument("--receipts", type=int, default=20000, help="Receipts to seed.")
+    parser.add_argument("--restaurants", type=int, default=200, help="Restaurants to seed per city.")
+    parser.add_argument("--requests", type=int, default=200, help="Timed calls per API scenario.")
+    parser.add_argument("--enrich", type=int, default=1000, help="New receipts for the enrichment scenario.")
+    parser.add_argument("--places-latency", type=float, default=0.05, help="Fake Places response delay, seconds.")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="Also write the results to this file.")
+    parser.add_argument("--compare", help="Results file of an earlier run to compare against.")
+    args = parser.parse_args(argv)
+
+    setup_django()
+    from django.core.cache import caches
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    from backend.celery import app
+    from benchmarks.seed import seed
+
+    # Per-receipt INFO logs would dominate the enrichment timings.
+    logging.disable(logging.INFO)
+    # Queue tasks in memory instead of on the real broker.
+    app.conf.broker_url = "memory://"
+    app.conf.result_backend = "cache+memory://"
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        for alias in caches:
+            caches[alias].clear()
+        start = time.perf_counter()
+        data = seed(args.users, args.receipts, restaurants_per_city=args.restaurants, seed_value=args.seed)
+        print(f"seeded {args.users} users, {args.receipts} receipts in {time.perf_counter() - start:.1f}s")
+
+        rng = random.Random(args.seed)
+        results = []
+        for name in args.scenarios:
+            if name == "enrichment":
+                results.append(run_enrichment(data, args.enrich, args.places_latency))
+            else:
+                results.append(run_api(name, data, args.requests, rng))
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "benchmark": "api",
+                "commit": git_commit(),
+                "params": {key: value for key, value in vars(args).items() if key not in ("json", "compare")},
+                "results": results,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""
+Training time and memory of the offline item-item recommender.
+
+Generates interactions the way the API benchmark seeds receipts (skewed user
+activity, Zipf-like restaurant popularity, log-normal prices) for users and
+restaurants spread over a few cities of very different size, then trains the
+per-city neighbour lists with ``city_neighbors`` exactly as
+``train_recommender`` does, without the database. A second pass under
+``tracemalloc`` reports the peak memory allocated while training.
+
+    python -m benchmarks.recommender --users 100000 --restaurants 50000 [--json out.json]
+"""
+import argparse
+import json
+import resource
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from benchmarks._setup import setup_django
+
+CUISINES = [
+    "italian", "pizza", "vietnamese", "thai", "japanese", "sushi", "indian", "turkish", "greek", "mexican",
+    "burger", "vegan", "korean", "chinese", "lebanese", "bakery", "cafe", "german", "french", "spanish",
+]
+
+
+def zipf_weights(count, exponent=1.0):
+    weights = 1 / np.arange(1, count + 1) ** exponent
+    return weights / weights.sum()
+
+
+def make_cities(users, restaurants, cities, seed=42):
+    """
+    Per city: ``(user_ids, items, visits, spend, cuisines)`` with one entry
+    per (user, restaurant) pair, as ``city_neighbors`` takes them.
+    """
+    rng = np.random.default_rng(seed)
+    share = zipf_weights(cities)
+    restaurant_city = rng.choice(cities, size=restaurants, p=share)
+    user_city = rng.choice(cities, size=users, p=share)
+    generated = []
+    for city in range(cities):
+        n_items = int((restaurant_city == city).sum())
+        user_ids = np.flatnonzero(user_city == city)
+        # Most users keep to a few places; a long tail eats out everywhere.
+        per_user = np.minimum(rng.pareto(1.5, size=user_ids.size) * 4 + 1, 200).astype(np.int64)
+        users_per_pair = np.repeat(user_ids, per_user)
+        items = rng.choice(n_items, size=users_per_pair.size, p=zipf_weights(n_items, 0.8))
+        pairs = np.unique(users_per_pair * n_items + items)
+        users_per_pair, items = pairs // n_items, pairs % n_items
+        visits = rng.geometric(0.4, size=pairs.size).astype(np.float64)
+        price_level = rng.lognormal(np.log(14), 0.4, size=n_items)
+        spend = visits * price_level[items] * rng.lognormal(0, 0.15, size=pairs.size)
+        cuisines = [["restaurant", "food", CUISINES[tag]] for tag in rng.integers(len(CUISINES), size=n_items)]
+        generated.append((users_per_pair, items, visits, spend, cuisines))
+    return generated
+
+
+def train(cities, neighbors, shrinkage, content_weight, block_size):
+    from backend.apps.restaurants.recommender import city_neighbors
+
+    rows = 0
+    for users, items, visits, spend, cuisines in cities:
+        found, _, _ = city_neighbors(
+            users, items, visits, spend, cuisines, neighbors,
+            shrinkage=shrinkage, content_weight=content_weight, block_size=block_size,
+        )
+        rows += found.size
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--restaurants", type=int, default=50000)
+    parser.add_argument("--cities", type=int, default=8)
+    parser.add_argument("--neighbors", type=int, default=None, help="Default: RECOMMENDER_NEIGHBORS.")
+    parser.add_argument("--block-size", type=int, default=256)
+    parser.add_argument("--json", help="Also write the results to this file.")
+    args = parser.parse_args(argv)
+
+    setup_django()
+    from django.conf import settings
+
+    options = {
+        "neighbors": args.neighbors or settings.RECOMMENDER_NEIGHBORS,
+        "shrinkage": settings.RECOMMENDER_SHRINKAGE,
+        "content_weight": settings.RECOMMENDER_CONTENT_WEIGHT,
+        "block_size": args.block_size,
+    }
+    cities = make_cities(args.users, args.restaurants, args.cities)
+    interactions = sum(users.size for users, *_ in cities)
+    largest = max(len(cuisines) for *_, cuisines in cities)
+
+    start = time.perf_counter()
+    rows = train(cities, **options)
+    seconds = time.perf_counter() - start
+
+    tracemalloc.start()
+    train(cities, **options)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    result = {
+        "users": args.users, "restaurants": args.restaurants, "cities": args.cities,
+        "largest_city_restaurants": largest, "interactions": interactions, "neighbor_rows": rows,
+        **options, "seconds": round(seconds, 2), "peak_traced_mb": round(peak / 2 ** 20, 1),
+        "max_rss_mb": round(max_rss, 1),
+    }
+    print(f"{args.users:,} users, {args.restaurants:,} restaurants in {args.cities} cities "
+          f"(largest {largest:,}), {interactions:,} interactions")
+    print(f"trained {rows:,} neighbours (k={options['neighbors']}, block {args.block_size}) in {seconds:.2f}s")
+    print(f"peak memory while training: {result['peak_traced_mb']} MB allocated, process max RSS {result['max_rss_mb']} MB")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"benchmark": "recommender", "results": [result]}, f, indent=2)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
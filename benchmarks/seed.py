@@ -0,0 +1,172 @@
+"""
+Synthetic users, restaurants and receipts for the benchmarks.
+
+The shape follows real usage rather than uniform noise: a few heavy users
+log most receipts (Pareto-distributed activity), each user mostly eats in a
+home city, restaurant popularity within a city is Zipf-like, lunches fall on
+weekdays over the past year and prices are log-normal around 12 EUR.
+"""
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+
+# City, postcode range (resolvable through the bundled gazetteer), weight.
+CITIES = [
+    ("Berlin", 10115, 14199, 0.35),
+    ("München", 80331, 81929, 0.2),
+    ("Hamburg", 20095, 21149, 0.2),
+    ("Köln", 50667, 51149, 0.15),
+    ("Frankfurt am Main", 60311, 60599, 0.1),
+]
+PREFIXES = ["Trattoria", "Sushi", "Curry", "Pho", "Döner", "Pizzeria", "Café", "Bistro", "Taverna", "Ramen", "Burger"]
+SURNAMES = ["Rossi", "Yamamoto", "Nguyen", "Yilmaz", "Müller", "Dubois", "Papadopoulos", "Kim", "Schmidt", "Garcia"]
+STREETS = ["Hauptstr.", "Friedrichstraße", "Bahnhofstraße", "Schillerstraße", "Gartenweg", "Marktplatz"]
+HOME_CITY_SHARE = 0.85
+PASSWORD = "BenchPass123!"
+
+
+def restaurant_name(rng):
+    return f"{rng.choice(PREFIXES)} {rng.choice(SURNAMES)} {rng.randint(1, 999)}"
+
+
+def address(rng, city):
+    name, first, last, _ = next(entry for entry in CITIES if entry[0] == city)
+    return f"{rng.choice(STREETS)} {rng.randint(1, 200)}, {rng.randint(first, last)} {name}"
+
+
+def lunch_price(rng):
+    return Decimal(str(round(min(max(rng.lognormvariate(2.45, 0.45), 3.0), 150.0), 2)))
+
+
+def lunch_date(rng, today):
+    while True:
+        day = today - timedelta(days=rng.randint(0, 364))
+        # Mostly weekday lunches.
+        if day.weekday() < 5 or rng.random() < 0.1:
+            return day
+
+
+def zipf_weights(count, exponent=1.1):
+    return [1 / (rank + 1) ** exponent for rank in range(count)]
+
+
+class Dataset:
+    """
+    Seeded objects: ``users`` with per-user ``activity`` weights and
+    ``home_city``, ``restaurants`` per city and the created receipt ids.
+    """
+
+    def __init__(self):
+        self.users = []
+        self.activity = []
+        self.home_city = {}
+        self.restaurants = {}
+        self.receipt_ids = []
+
+
+def seed(users, receipts, restaurants_per_city=200, seed_value=42, chunk_size=1000):
+    """
+    Create ``users`` users, ``restaurants_per_city`` enriched restaurants per
+    city and ``receipts`` receipts spread over them, with the rollups,
+    interactions and popularity rows the app would have built, and the
+    recommender trained on them.
+    """
+    from django.contrib.auth import get_user_model
+    from django.contrib.auth.hashers import make_password
+    from django.db import transaction
+
+    from backend.apps.receipts.models import Receipt
+    from backend.apps.receipts.rollups import receipt_values, record_new_receipts
+    from backend.apps.restaurants.matching import normalize_restaurant_name
+    from backend.apps.restaurants.models import ReceiptEnrichment, Restaurant
+    from backend.apps.restaurants.recommender import train_recommender
+    from backend.apps.restaurants.tasks import update_user_interactions
+
+    User = get_user_model()
+    rng = random.Random(seed_value)
+    today = date.today()
+    data = Dataset()
+
+    for city, _, _, _ in CITIES:
+        rows = []
+        for index in range(restaurants_per_city):
+            name = restaurant_name(rng)
+            rows.append(Restaurant(
+                place_id=f"bench-{city}-{index}", name=name, city=city, address=address(rng, city),
+                cuisine=["restaurant"], rating=round(rng.uniform(3.0, 5.0), 1),
+                user_ratings_total=int(rng.paretovariate(1.2) * 20),
+            ))
+        for restaurant in rows:
+            # bulk_create skips save(), which fills the matching key.
+            restaurant.name_key = normalize_restaurant_name(restaurant.name)
+        data.restaurants[city] = Restaurant.objects.bulk_create(rows)
+
+    password = make_password(PASSWORD)
+    data.users = User.objects.bulk_create([
+        User(email=f"user{index}@bench.local", full_name=f"Bench User {index}", password=password)
+        for index in range(users)
+    ])
+    city_names = [city for city, _, _, _ in CITIES]
+    city_weights = [weight for _, _, _, weight in CITIES]
+    for user in data.users:
+        data.activity.append(rng.paretovariate(1.5))
+        data.home_city[user.id] = rng.choices(city_names, weights=city_weights)[0]
+
+    popularity = zipf_weights(restaurants_per_city)
+    owners = rng.choices(data.users, weights=data.activity, k=receipts)
+    for start in range(0, receipts, chunk_size):
+        chunk, visits = [], []
+        for user in owners[start:start + chunk_size]:
+            city = data.home_city[user.id]
+            if rng.random() > HOME_CITY_SHARE:
+                city = rng.choice(city_names)
+            restaurant = rng.choices(data.restaurants[city], weights=popularity)[0]
+            receipt = Receipt(
+                user=user, date=lunch_date(rng, today), price=lunch_price(rng),
+                restaurant_name=restaurant.name, address=restaurant.address, restaurant=restaurant,
+                image=f"receipts/{user.id}/bench/placeholder.jpg",
+            )
+            receipt.set_city_from_address()
+            chunk.append(receipt)
+            visits.append((user, restaurant, receipt.date, receipt.price))
+        with transaction.atomic():
+            Receipt.objects.bulk_create(chunk)
+            ReceiptEnrichment.objects.bulk_create([
+                ReceiptEnrichment(
+                    receipt=receipt, restaurant=receipt.restaurant, status=ReceiptEnrichment.Status.DONE, attempts=1,
+                )
+                for receipt in chunk
+            ])
+            record_new_receipts(receipt_values(receipt) for receipt in chunk)
+            update_user_interactions(visits)
+        data.receipt_ids.extend(receipt.id for receipt in chunk)
+    train_recommender()
+    return data
+
+
+def new_receipts(data, count, known_share=0.6, seed_value=7):
+    """
+    Unenriched receipts for the enrichment benchmark: ``known_share`` of them
+    at seeded restaurants (resolved locally), the rest at new ones that need
+    a Places lookup.
+    """
+    from backend.apps.receipts.models import Receipt
+    from backend.apps.restaurants.models import ReceiptEnrichment
+
+    rng = random.Random(seed_value)
+    today = date.today()
+    receipts = []
+    for user in rng.choices(data.users, weights=data.activity, k=count):
+        city = data.home_city[user.id]
+        if rng.random() < known_share:
+            restaurant = rng.choice(data.restaurants[city])
+            name, where = restaurant.name, restaurant.address
+        else:
+            name, where = restaurant_name(rng), address(rng, city)
+        receipts.append(Receipt(
+            user=user, date=lunch_date(rng, today), price=lunch_price(rng),
+            restaurant_name=name, address=where, image=f"receipts/{user.id}/bench/placeholder.jpg",
+        ))
+    receipts = Receipt.objects.bulk_create(receipts)
+    ReceiptEnrichment.objects.bulk_create([ReceiptEnrichment(receipt=receipt) for receipt in receipts])
+    return [receipt.id for receipt in receipts]